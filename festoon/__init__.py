@@ -1,7 +1,49 @@
 # flake8: noqa
 __version__ = "0.0.1"
 
-from .docstring_tools import docfill
-from .exception_tools import retry
-from .logging_tools import logit, timeit
-from .environment_tools import fromenv
+# Decorators are imported from their submodule on first access, so that
+# importing festoon costs close to nothing, and tools using only some
+# decorators do not import the others' dependencies
+_EXPORTS = {
+    "docfill": "docstring_tools",
+    "retry": "exception_tools",
+    "retry_batch": "exception_tools",
+    "limitit": "limit_tools",
+    "logit": "logging_tools",
+    "timeit": "logging_tools",
+    "cacheit": "cache_tools",
+    "fromenv": "environment_tools",
+    "profileit": "profile_tools",
+    "configure": "queue_tools",
+    "traceit": "trace_tools",
+}
+
+__all__ = list(_EXPORTS)
+
+# Type checkers see the decorators as if they were imported eagerly. Not
+# imported from typing, which would cost more than the rest of the module.
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from .docstring_tools import docfill
+    from .exception_tools import retry, retry_batch
+    from .limit_tools import limitit
+    from .logging_tools import logit, timeit
+    from .cache_tools import cacheit
+    from .environment_tools import fromenv
+    from .profile_tools import profileit
+    from .queue_tools import configure
+    from .trace_tools import traceit
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(__import__(module, globals(), None, [name], 1), name)
+    # Later accesses do not go through __getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,102 @@
+"""Helpers to build wrappers around sync, coroutine and async generator
+functions from a common set of hooks"""
+import functools
+import inspect
+from typing import Any, Callable, Optional
+
+from .registry_tools import Registration
+
+
+#: Called with (args, kwargs) before the wrapped function. Returning None
+#: calls the wrapped function without calling any other hook. Otherwise, the
+#: returned state is passed to the other hooks.
+BEFORE_TYPE = Callable[[tuple, dict], Optional[Any]]
+#: Called with (state, result) after the wrapped function returned
+AFTER_TYPE = Callable[[Any, Any], None]
+#: Called with (state, exception) if the wrapped function raised
+ERROR_TYPE = Callable[[Any, Exception], None]
+
+
+def _always(level: int) -> bool:
+    return True
+
+
+def wrap(
+    fn: Callable,
+    before: BEFORE_TYPE,
+    after: AFTER_TYPE,
+    error: ERROR_TYPE,
+    registration: Registration,
+    enabled: Callable[[int], bool] = _always,
+    level: int = 0,
+) -> Callable:
+    """Wrap `fn` with hooks, producing a wrapper of the same kind as `fn`
+
+    Coroutine functions produce coroutine functions. Async generator functions
+    produce async generator functions, and their result is None: `after` is
+    called once the generator is exhausted.
+
+    If `registration` is disabled, then `fn` is called directly. Otherwise,
+    calls and errors are counted in `registration`, and `enabled(level)` is
+    checked: if it returns False, then no hook is called. It is a cheaper
+    way than `before` to skip all hooks, e.g., with
+    :code:`logger.isEnabledFor`.
+    """
+    if inspect.isasyncgenfunction(fn):
+        @functools.wraps(fn)
+        async def wrapped(*args, **kwargs):
+            if not registration.enabled:
+                async for item in fn(*args, **kwargs):
+                    yield item
+                return
+            registration.calls += 1
+            state = before(args, kwargs) if enabled(level) else None
+            try:
+                async for item in fn(*args, **kwargs):
+                    yield item
+            except Exception as e:
+                registration.errors += 1
+                if state is not None:
+                    error(state, e)
+                raise
+            if state is not None:
+                after(state, None)
+
+    elif inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def wrapped(*args, **kwargs):
+            if not registration.enabled:
+                return await fn(*args, **kwargs)
+            registration.calls += 1
+            state = before(args, kwargs) if enabled(level) else None
+            try:
+                result = await fn(*args, **kwargs)
+            except Exception as e:
+                registration.errors += 1
+                if state is not None:
+                    error(state, e)
+                raise
+            if state is not None:
+                after(state, result)
+            return result
+
+    else:
+        @functools.wraps(fn)
+        def wrapped(*args, **kwargs):
+            if not registration.enabled:
+                return fn(*args, **kwargs)
+            registration.calls += 1
+            state = before(args, kwargs) if enabled(level) else None
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                registration.errors += 1
+                if state is not None:
+                    error(state, e)
+                raise
+            if state is not None:
+                after(state, result)
+            return result
+
+    wrapped.registration = registration
+    return wrapped
@@ -0,0 +1,142 @@
+import itertools
+import random
+import time
+from typing import Iterator, Optional
+
+
+JITTERS = (None, "full", "equal", "decorrelated")
+
+
+class Backoff:
+    """Base class of backoff policies: re-iterable sequences of delays
+
+    Each iteration lazily yields a fresh sequence of delays, in seconds, and
+    may be infinite. The caller sleeps for each delay before its next attempt.
+    Subclasses implement :code:`delays`, and this base class applies the
+    limits shared by all policies.
+
+    Args:
+        max_retries: maximum number of delays yielded. If None, then the
+            schedule is infinite, unless bound by `deadline`.
+        deadline: if not None, then total number of seconds, measured from
+            the start of the iteration, after which no more delays are
+            yielded. The last delay is shortened to end at the deadline.
+    """
+    def __init__(
+        self,
+        *,
+        max_retries: Optional[int] = None,
+        deadline: Optional[float] = None,
+    ):
+        self.max_retries = max_retries
+        self.deadline = deadline
+
+    def delays(self) -> Iterator[float]:
+        """Yield an infinite sequence of delays"""
+        raise NotImplementedError
+
+    def __iter__(self) -> Iterator[float]:
+        delays = self.delays()
+        if self.max_retries is not None:
+            delays = itertools.islice(delays, self.max_retries)
+        if self.deadline is None:
+            return delays
+        return self._until_deadline(delays)
+
+    def _until_deadline(self, delays: Iterator[float]) -> Iterator[float]:
+        end = time.monotonic() + self.deadline
+        for delay in delays:
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                return
+            yield min(delay, remaining)
+
+
+class ExponentialBackoff(Backoff):
+    """Exponentially growing delays, optionally capped and jittered
+
+    Without jitter, the n-th delay is :code:`min(max_delay, base *
+    factor**n)`. Jitter spreads the retries of many clients that failed at
+    the same time, to avoid them retrying in lockstep:
+
+    - "full": a delay drawn uniformly between 0 and the exponential delay
+    - "equal": half the exponential delay, plus a uniformly drawn delay of up
+      to the other half
+    - "decorrelated": a delay drawn uniformly between `base` and three times
+      the previous delay, capped by `max_delay`
+
+    Args:
+        base: first delay, in seconds
+        factor: growth factor of delays
+        max_delay: if not None, then maximum delay, in seconds
+        jitter: one of None, "full", "equal" or "decorrelated"
+        max_retries: see :code:`Backoff`. Default is 7.
+        deadline: see :code:`Backoff`
+        rng: random number generator used for jitter. Defaults to the
+            :code:`random` module.
+
+    Examples:
+        >>> list(ExponentialBackoff(max_retries=5))
+        [1.0, 2.0, 4.0, 8.0, 16.0]
+        >>> list(ExponentialBackoff(max_delay=3, max_retries=5))
+        [1.0, 2.0, 3.0, 3.0, 3.0]
+        >>> rng = random.Random(0)
+        >>> [round(d, 2) for d in ExponentialBackoff(
+        >>>     jitter="full", max_retries=5, rng=rng
+        >>> )]
+        [0.84, 1.52, 1.68, 2.07, 8.18]
+
+        An infinite schedule that retries for at most one minute:
+
+        >>> @retry(schedule=ExponentialBackoff(
+        >>>     base=0.1, max_delay=10, jitter="full",
+        >>>     max_retries=None, deadline=60,
+        >>> ))
+        >>> def func():
+        >>>     ...
+    """
+    def __init__(
+        self,
+        base: float = 1.0,
+        factor: float = 2.0,
+        max_delay: Optional[float] = None,
+        jitter: Optional[str] = None,
+        *,
+        max_retries: Optional[int] = 7,
+        deadline: Optional[float] = None,
+        rng: Optional[random.Random] = None,
+    ):
+        if jitter not in JITTERS:
+            raise ValueError(f"jitter must be one of {JITTERS}, got {jitter}")
+        super().__init__(max_retries=max_retries, deadline=deadline)
+        self.base = base
+        self.factor = factor
+        self.max_delay = None if max_delay is None else float(max_delay)
+        self.jitter = jitter
+        self.rng = rng or random
+
+    def _cap(self, delay: float) -> float:
+        if self.max_delay is None:
+            return delay
+        return min(delay, self.max_delay)
+
+    def delays(self) -> Iterator[float]:
+        uniform = self.rng.uniform
+        if self.jitter == "decorrelated":
+            delay = self.base
+            while True:
+                delay = self._cap(uniform(self.base, delay * 3))
+                yield delay
+
+        delay = float(self.base)
+        while True:
+            capped = self._cap(delay)
+            if self.jitter == "full":
+                yield uniform(0, capped)
+            elif self.jitter == "equal":
+                yield capped / 2 + uniform(0, capped / 2)
+            else:
+                yield capped
+            # Stop growing once capped, so that delays never overflow
+            if capped == delay:
+                delay *= self.factor
@@ -0,0 +1,405 @@
+"""Micro benchmarks of the per-call overhead added by festoon decorators
+
+Run all benchmarks with::
+
+    $ python -m festoon.bench
+
+or only some of them by name::
+
+    $ python -m festoon.bench fromenv
+
+Per-call overheads are measured against the undecorated function, with
+logging enabled, filtered out by level, and with the decorator disabled
+through the registry. The "decorate" and "memory" benchmarks measure the
+cost of decorating a function, and the memory kept per wrapper. With
+`--check`, the results are compared with :code:`THRESHOLDS`, and the
+command fails if any case is over its threshold::
+
+    $ python -m festoon.bench --check logit timeit retry
+"""
+import argparse
+import contextlib
+import logging
+import os
+import subprocess
+import sys
+import timeit as _timeit
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+#: Default number of calls per timing of :code:`measure`. Slow cases are
+#: timed over a tenth of it.
+NUMBER = 100_000
+
+
+def measure(
+    fn: Callable,
+    number: Optional[int] = None,
+    repeat: int = 5,
+) -> float:
+    """Return the best observed time per call of `fn()` in nanoseconds"""
+    number = NUMBER if number is None else max(number, 1)
+    timer = _timeit.Timer(fn)
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1e9
+
+
+def bench_fromenv() -> Dict[str, float]:
+    from .environment_tools import fromenv
+
+    def func(x: int = 0, y: int = 42):
+        return x + y
+
+    decorated = fromenv(func, prefix="FESTOON_BENCH")
+
+    os.environ["FESTOON_BENCH_X"] = "100"
+    try:
+        return {
+            "undecorated": measure(func),
+            "fromenv": measure(decorated),
+        }
+    finally:
+        del os.environ["FESTOON_BENCH_X"]
+
+
+class _FormattingNullHandler(logging.Handler):
+    """Handler that formats records, like a real handler would, then drops
+    them"""
+    def emit(self, record: logging.LogRecord):
+        self.format(record)
+
+
+@contextlib.contextmanager
+def _bench_logger(level: int):
+    """Yield the name of a logger set to `level` that formats and drops"""
+    logger = logging.getLogger("festoon.bench.sink")
+    handler = _FormattingNullHandler()
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    logger.propagate = False
+    try:
+        yield logger.name
+    finally:
+        logger.removeHandler(handler)
+
+
+def bench_logit() -> Dict[str, float]:
+    from .logging_tools import logit
+    from .queue_tools import configure
+
+    def func(x, y=2):
+        return x + y
+
+    results = {"undecorated": measure(lambda: func(1))}
+    with _bench_logger(logging.WARNING) as name:
+        decorated = logit(func, name=name)
+        results["logit (level disabled)"] = measure(lambda: decorated(1))
+        decorated.registration.enabled = False
+        results["logit (registry disabled)"] = measure(
+            lambda: decorated(1)
+        )
+    with _bench_logger(logging.INFO) as name:
+        decorated = logit(func, name=name)
+        results["logit (level enabled)"] = measure(
+            lambda: decorated(1), number=NUMBER // 10,
+        )
+        configure(async_logging=True)
+        try:
+            results["logit (async logging)"] = measure(
+                lambda: decorated(1), number=NUMBER // 10,
+            )
+        finally:
+            configure(async_logging=False)
+    return results
+
+
+def _format_time_eval(fn: Callable, seconds: float) -> str:
+    """Former eval-based implementation of format_time, as a reference"""
+    result = "TIME {fn.__qualname__} {seconds:.2f}s"
+    return eval("f'"+result+"'")
+
+
+def bench_timeit() -> Dict[str, float]:
+    from .logging_tools import _TimeFormatter, timeit
+
+    def func():
+        pass
+
+    compiled = _TimeFormatter("{seconds:.2f}s")
+    results = {
+        "undecorated": measure(func),
+        "format_time (eval)": measure(
+            lambda: _format_time_eval(func, 0.5), number=NUMBER // 10,
+        ),
+        "format_time (compiled)": measure(lambda: compiled(func, 0.5)),
+    }
+    with _bench_logger(logging.WARNING) as name:
+        decorated = timeit(func, name=name)
+        results["timeit (level disabled)"] = measure(decorated)
+        decorated.registration.enabled = False
+        results["timeit (registry disabled)"] = measure(decorated)
+    with _bench_logger(logging.INFO) as name:
+        decorated = timeit(func, name=name, fmttime="{ms:.1f}ms")
+        results["timeit (level enabled)"] = measure(
+            decorated, number=NUMBER // 10,
+        )
+    return results
+
+
+def bench_retry() -> Dict[str, float]:
+    from .exception_tools import retry
+
+    def func(x, y=2):
+        return x + y
+
+    decorated = retry(func)
+    results = {
+        "undecorated": measure(lambda: func(1)),
+        "retry (no failure)": measure(lambda: decorated(1)),
+    }
+    decorated.registration.enabled = False
+    results["retry (registry disabled)"] = measure(lambda: decorated(1))
+    return results
+
+
+def bench_docfill() -> Dict[str, float]:
+    from .docstring_tools import docfill
+
+    def func(x, y=2):
+        """Add {0} to x"""
+        return x + y
+
+    # docfill returns the function itself, so calls cost nothing more
+    decorated = docfill("y")(func)
+    return {
+        "undecorated": measure(lambda: func(1)),
+        "docfill": measure(lambda: decorated(1)),
+    }
+
+
+def bench_traceit() -> Dict[str, float]:
+    from .trace_tools import RingBufferSink, set_tracer, traceit, Tracer
+
+    def func(x, y=2):
+        return x + y
+
+    decorated = traceit(func)
+    results = {
+        "undecorated": measure(lambda: func(1)),
+        "traceit (no tracer)": measure(lambda: decorated(1)),
+    }
+    previous = set_tracer(Tracer(RingBufferSink(1000)))
+    try:
+        results["traceit (ring buffer)"] = measure(lambda: decorated(1))
+    finally:
+        set_tracer(previous)
+    return results
+
+
+def bench_profileit() -> Dict[str, float]:
+    from .profile_tools import profileit
+
+    def func(x, y=2):
+        return x + y
+
+    decorated = profileit(func, name="festoon.bench.profileit")
+    return {
+        "undecorated": measure(lambda: func(1)),
+        "profileit (disabled)": measure(lambda: decorated(1)),
+    }
+
+
+def bench_cacheit() -> Dict[str, float]:
+    import functools
+    from .cache_tools import cacheit
+
+    def func(x, y=2):
+        return x + y
+
+    lru_cached = functools.lru_cache(maxsize=128)(func)
+    with _bench_logger(logging.WARNING) as name:
+        cached = cacheit(func, name=name)
+        lfu_cached = cacheit(func, name=name, policy="lfu", ttl=60)
+        return {
+            "undecorated": measure(lambda: func(1)),
+            "lru_cache (hit)": measure(lambda: lru_cached(1)),
+            "cacheit (hit)": measure(lambda: cached(1)),
+            "cacheit (lfu, ttl, hit)": measure(lambda: lfu_cached(1)),
+        }
+
+
+def _import_time(code: str, repeat: int = 5) -> float:
+    """Return the best observed time of running `code`, such as imports, in
+    a new interpreter in nanoseconds"""
+    timed = (
+        "import time\n"
+        "start = time.perf_counter()\n"
+        f"{code}\n"
+        "print(time.perf_counter() - start)\n"
+    )
+    return min(
+        float(subprocess.check_output([sys.executable, "-c", timed]))
+        for _ in range(repeat)
+    ) * 1e9
+
+
+def bench_import() -> Dict[str, float]:
+    """Time of importing festoon, and then of its first access to a
+    decorator, which imports the decorator's module. For the breakdown by
+    module, run `python -X importtime -c "import festoon; festoon.logit"`"""
+    cases = {"import festoon": "import festoon"}
+    for name in ("docfill", "fromenv", "logit", "retry", "cacheit"):
+        cases[f"festoon.{name}"] = f"import festoon; festoon.{name}"
+    return {case: _import_time(code) for case, code in cases.items()}
+
+
+def _decorators() -> Dict[str, Callable[[Callable], Callable]]:
+    """Decorators applied by the "decorate" and "memory" benchmarks"""
+    from .docstring_tools import docfill
+    from .environment_tools import fromenv
+    from .exception_tools import retry
+    from .logging_tools import logit, timeit
+
+    return {
+        "logit": logit,
+        "timeit": timeit,
+        "retry": retry,
+        "fromenv": fromenv(prefix="FESTOON_BENCH"),
+        "docfill": docfill("y"),
+    }
+
+
+def _to_decorate(x, y=2):
+    """Add {0} to x"""
+    return x + y
+
+
+def bench_decorate() -> Dict[str, float]:
+    """Time of decorating a function, once per decorator call"""
+    return {
+        name: measure(
+            lambda: decorate(_to_decorate), number=NUMBER // 100
+        )
+        for name, decorate in _decorators().items()
+    }
+
+
+def _wrapper_size(decorate: Callable, count: int) -> float:
+    """Return the memory allocated per wrapper by `decorate` in bytes"""
+    # Caches filled by the first decoration, e.g., parsers of annotations,
+    # are shared by wrappers
+    decorate(_to_decorate)
+    wrappers: List[Optional[Callable]] = [None] * count
+    tracemalloc.start()
+    try:
+        for i in range(count):
+            wrappers[i] = decorate(_to_decorate)
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return size / count
+
+
+def bench_memory() -> Dict[str, float]:
+    """Memory kept alive per wrapper, in bytes, including its registration
+    and the state of its closures"""
+    count = max(NUMBER // 100, 1)
+    return {
+        name: _wrapper_size(decorate, count)
+        for name, decorate in _decorators().items()
+    }
+
+
+#: Registered benchmarks. Each returns a mapping of case name to the time
+#: per call in nanoseconds, or to the unit of :code:`UNITS`.
+BENCHMARKS: Dict[str, Callable[[], Dict[str, float]]] = {
+    "fromenv": bench_fromenv,
+    "logit": bench_logit,
+    "timeit": bench_timeit,
+    "retry": bench_retry,
+    "docfill": bench_docfill,
+    "traceit": bench_traceit,
+    "profileit": bench_profileit,
+    "cacheit": bench_cacheit,
+    "decorate": bench_decorate,
+    "memory": bench_memory,
+    "import": bench_import,
+}
+
+UNITS = {
+    "decorate": "ns/decoration",
+    "memory": "bytes/wrapper",
+    "import": "ns",
+}
+
+#: Upper bounds of the cases of benchmarks, checked with `--check`. Per-call
+#: times are bounded over the "undecorated" case of their benchmark, and
+#: are loose enough for slow machines: they catch work added to the hot
+#: paths of wrappers, such as formatting the arguments of calls that are
+#: not logged, not a few percent of noise.
+THRESHOLDS: Dict[str, Dict[str, float]] = {
+    "fromenv": {"fromenv": 5_000},
+    "logit": {
+        "logit (level disabled)": 3_000,
+        "logit (registry disabled)": 2_000,
+    },
+    "timeit": {
+        "timeit (level disabled)": 3_000,
+        "timeit (registry disabled)": 2_000,
+    },
+    "retry": {
+        "retry (no failure)": 2_000,
+        "retry (registry disabled)": 1_000,
+    },
+    "docfill": {"docfill": 100},
+    "memory": {
+        "logit": 20_000,
+        "timeit": 20_000,
+        "retry": 10_000,
+        "fromenv": 20_000,
+        "docfill": 100,
+    },
+}
+
+
+def check(name: str, results: Dict[str, float]) -> List[str]:
+    """Return descriptions of the cases of the benchmark `name` over their
+    :code:`THRESHOLDS`"""
+    baseline = results.get("undecorated", 0.0)
+    failures = []
+    for case, threshold in THRESHOLDS.get(name, {}).items():
+        overhead = results[case] - baseline
+        if overhead > threshold:
+            failures.append(
+                f"{name} {case}: {overhead:.0f} over the threshold of "
+                f"{threshold:.0f} {UNITS.get(name, 'ns/call')}"
+            )
+    return failures
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(prog="python -m festoon.bench")
+    parser.add_argument(
+        "names", nargs="*", help=f"any of {', '.join(BENCHMARKS)}",
+    )
+    parser.add_argument(
+        "--check", action="store_true",
+        help="fail if any case is over its threshold",
+    )
+    args = parser.parse_args(argv)
+    for name in args.names:
+        if name not in BENCHMARKS:
+            parser.error(f"unknown benchmark {name!r}")
+
+    failures = []
+    for name in args.names or BENCHMARKS:
+        results = BENCHMARKS[name]()
+        unit = UNITS.get(name, "ns/call")
+        for case, value in results.items():
+            print(f"{name:>12} {case:<28} {value:>10.0f} {unit}")
+        failures += check(name, results)
+    if args.check and failures:
+        parser.exit(1, "\n".join(["Over threshold:", *failures]) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+import threading
+import time
+from typing import Dict, Optional, Union
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a function while its circuit is open"""
+    def __init__(self, breaker: "CircuitBreaker"):
+        name = f" {breaker.name}" if breaker.name else ""
+        super().__init__(f"Circuit{name} is open")
+        self.breaker = breaker
+
+
+class RetryBudget:
+    """Token bucket bounding retries to a fraction of calls
+
+    Every call deposits `ratio` tokens and every retry withdraws one, so that
+    retries are at most about `ratio` of calls. Additionally, `min_per_second`
+    tokens are deposited every second, so that retries are possible at low
+    call rates. Tokens never exceed `max_tokens`.
+
+    A single budget can be shared by several :code:`retry`-decorated
+    functions calling the same dependency. During an outage, the whole
+    process then stops retrying as soon as the budget is spent, instead of
+    multiplying the load on the dependency.
+
+    Args:
+        ratio: tokens deposited by each call
+        min_per_second: tokens deposited each second
+        max_tokens: maximum number of tokens. Default is
+            :code:`max(10, min_per_second)`.
+
+    Examples:
+        >>> db_budget = RetryBudget(ratio=0.1)
+        >>> @retry(budget=db_budget)
+        >>> def read():
+        >>>     ...
+        >>> @retry(budget=db_budget)
+        >>> def write():
+        >>>     ...
+    """
+    def __init__(
+        self,
+        ratio: float = 0.1,
+        min_per_second: float = 1.0,
+        max_tokens: Optional[float] = None,
+    ):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = (
+            max(10.0, min_per_second) if max_tokens is None else max_tokens
+        )
+        self._lock = threading.Lock()
+        self._tokens = self.max_tokens
+        self._last = time.monotonic()
+        #: Number of calls recorded
+        self.calls = 0
+        #: Number of retries allowed
+        self.retries = 0
+        #: Number of retries refused because the budget was spent
+        self.rejected = 0
+
+    def _refill(self, deposit: float):
+        now = time.monotonic()
+        self._tokens = min(
+            self.max_tokens,
+            self._tokens + deposit + (now - self._last) * self.min_per_second,
+        )
+        self._last = now
+
+    @property
+    def tokens(self) -> float:
+        """Number of retries currently available"""
+        with self._lock:
+            self._refill(0)
+            return self._tokens
+
+    def record_call(self):
+        """Deposit the tokens of a call"""
+        with self._lock:
+            self.calls += 1
+            self._refill(self.ratio)
+
+    def try_spend(self) -> bool:
+        """Withdraw the token of a retry, if available"""
+        with self._lock:
+            self._refill(0)
+            if self._tokens >= 1:
+                self._tokens -= 1
+                self.retries += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def stats(self) -> Dict[str, float]:
+        """Counters of the budget, for monitoring"""
+        return {
+            "tokens": self.tokens,
+            "calls": self.calls,
+            "retries": self.retries,
+            "rejected": self.rejected,
+        }
+
+
+class CircuitBreaker:
+    """Fail fast while a dependency keeps failing
+
+    The circuit starts "closed": calls are allowed. After
+    `failure_threshold` consecutive failures it "opens": calls are rejected
+    with :code:`CircuitOpenError` without reaching the dependency. After
+    `reset_timeout` seconds it becomes "half-open": up to
+    `half_open_max_calls` trial calls are allowed. A successful trial
+    closes the circuit, a failed one opens it again.
+
+    Like :code:`RetryBudget`, a breaker can be shared by several decorated
+    functions calling the same dependency.
+
+    Args:
+        failure_threshold: consecutive failures opening the circuit
+        reset_timeout: seconds before an open circuit allows trial calls
+        half_open_max_calls: concurrent trial calls of a half-open circuit
+        name: name used in error messages and monitoring
+
+    Examples:
+        >>> db_breaker = CircuitBreaker(failure_threshold=5, name="db")
+        >>> @retry(breaker=db_breaker, catch=ConnectionError)
+        >>> def read():
+        >>>     ...
+        >>> db_breaker.state
+        'closed'
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        half_open_max_calls: int = 1,
+        name: Optional[str] = None,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.name = name
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._trials = 0
+        #: Number of successful calls recorded
+        self.successes = 0
+        #: Number of failed calls recorded
+        self.failures = 0
+        #: Number of calls rejected while open
+        self.rejected = 0
+        #: Number of times the circuit opened
+        self.opened = 0
+
+    @property
+    def state(self) -> str:
+        """One of "closed", "open" or "half-open\""""
+        with self._lock:
+            self._update()
+            return self._state
+
+    def _update(self):
+        if (
+            self._state == self.OPEN and
+            time.monotonic() >= self._opened_at + self.reset_timeout
+        ):
+            self._state = self.HALF_OPEN
+            self._trials = 0
+
+    def _open(self):
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self.opened += 1
+
+    def allow(self) -> bool:
+        """Whether a call may proceed. Each allowed call must be followed by
+        :code:`record_success`, :code:`record_failure`, or
+        :code:`record_cancelled`."""
+        with self._lock:
+            self._update()
+            if self._state == self.CLOSED:
+                return True
+            if (
+                self._state == self.HALF_OPEN and
+                self._trials < self.half_open_max_calls
+            ):
+                self._trials += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def check(self):
+        """Raise :code:`CircuitOpenError` if a call may not proceed"""
+        if not self.allow():
+            raise CircuitOpenError(self)
+
+    def record_success(self):
+        with self._lock:
+            self.successes += 1
+            self._consecutive_failures = 0
+            if self._state == self.HALF_OPEN:
+                self._state = self.CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._consecutive_failures += 1
+            if self._state == self.HALF_OPEN or (
+                self._state == self.CLOSED and
+                self._consecutive_failures >= self.failure_threshold
+            ):
+                self._open()
+
+    def record_cancelled(self):
+        """Record an allowed call that ended without telling whether the
+        dependency works, e.g., a cancelled call. Its trial slot of a
+        half-open circuit is given back."""
+        with self._lock:
+            if self._state == self.HALF_OPEN and self._trials > 0:
+                self._trials -= 1
+
+    def stats(self) -> Dict[str, Union[str, int]]:
+        """State and counters of the breaker, for monitoring"""
+        return {
+            "state": self.state,
+            "successes": self.successes,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "opened": self.opened,
+        }
@@ -0,0 +1,506 @@
+"""Memoization of function results, with expiry, eviction policies and
+deduplication of concurrent computations"""
+import collections
+import functools
+import inspect
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, NamedTuple, Optional, Tuple
+
+from . import queue_tools
+from .disk_tools import DiskStore, source_hash
+from .logging_tools import _CallFormatter, _LazyMessage, FMTVALUE_TYPE
+from .registry_tools import register
+
+
+LOG = logging.getLogger(__name__)
+
+POLICIES = ("lru", "lfu")
+
+
+class CacheInfo(NamedTuple):
+    """Statistics of a cache"""
+    hits: int
+    misses: int
+    #: Calls that waited for the computation of a concurrent call
+    waits: int
+    evictions: int
+    expirations: int
+    maxsize: Optional[int]
+    currsize: int
+    #: Misses found in the disk store
+    disk_hits: int = 0
+
+
+class _LRUStore:
+    """Entries by key, evicting the least recently used"""
+    def __init__(self):
+        self._entries: collections.OrderedDict = collections.OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[tuple]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: Hashable, entry: tuple):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+
+    def pop(self, key: Hashable):
+        del self._entries[key]
+
+    def evict(self):
+        self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class _LFUStore:
+    """Entries by key, evicting the least frequently used, and the least
+    recently used among those. All operations take constant time."""
+    def __init__(self):
+        self._entries: Dict[Hashable, tuple] = {}
+        self._counts: Dict[Hashable, int] = {}
+        # Keys by use count, each in order of last use
+        self._by_count: Dict[int, collections.OrderedDict] = {}
+        self._min_count = 0
+
+    def _touch(self, key: Hashable):
+        count = self._counts[key]
+        keys = self._by_count[count]
+        del keys[key]
+        if not keys:
+            del self._by_count[count]
+            if self._min_count == count:
+                self._min_count = count + 1
+        self._counts[key] = count + 1
+        self._by_count.setdefault(count + 1, collections.OrderedDict())[
+            key
+        ] = None
+
+    def get(self, key: Hashable) -> Optional[tuple]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._touch(key)
+        return entry
+
+    def put(self, key: Hashable, entry: tuple):
+        if key in self._entries:
+            self._entries[key] = entry
+            self._touch(key)
+            return
+        self._entries[key] = entry
+        self._counts[key] = 1
+        self._by_count.setdefault(1, collections.OrderedDict())[key] = None
+        self._min_count = 1
+
+    def pop(self, key: Hashable):
+        del self._entries[key]
+        count = self._counts.pop(key)
+        keys = self._by_count[count]
+        del keys[key]
+        if not keys:
+            del self._by_count[count]
+            if self._min_count == count:
+                self._min_count = min(self._by_count, default=0)
+
+    def evict(self):
+        keys = self._by_count[self._min_count]
+        key = next(iter(keys))
+        self.pop(key)
+
+    def clear(self):
+        self._entries.clear()
+        self._counts.clear()
+        self._by_count.clear()
+        self._min_count = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class _Flight:
+    """A computation in progress, shared by concurrent callers"""
+    __slots__ = ("done", "value", "error", "abandoned")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[Exception] = None
+        self.abandoned = False
+
+
+class _Cache:
+    """Thread-safe cache shared by the wrappers of a single function"""
+    def __init__(
+        self,
+        maxsize: Optional[int],
+        ttl: Optional[float],
+        policy: str,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.store = _LRUStore() if policy == "lru" else _LFUStore()
+        self.lock = threading.Lock()
+        self.flights: Dict[Hashable, Any] = {}
+        self.hits = self.misses = self.waits = 0
+        self.evictions = self.expirations = self.disk_hits = 0
+
+    def lookup(self, key: Hashable) -> Tuple[bool, Any]:
+        """Return (True, value) on a hit, or (False, None). Must be called
+        with the lock held."""
+        entry = self.store.get(key)
+        if entry is None:
+            return False, None
+        value, expires = entry
+        if expires is not None and time.monotonic() >= expires:
+            self.store.pop(key)
+            self.expirations += 1
+            return False, None
+        self.hits += 1
+        return True, value
+
+    def put(self, key: Hashable, value: Any):
+        """Store a computed value. Must be called with the lock held."""
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        self.store.put(key, (value, expires))
+        if self.maxsize is not None:
+            while len(self.store) > self.maxsize:
+                self.store.evict()
+                self.evictions += 1
+
+    def info(self) -> CacheInfo:
+        with self.lock:
+            return CacheInfo(
+                self.hits, self.misses, self.waits, self.evictions,
+                self.expirations, self.maxsize, len(self.store),
+                self.disk_hits,
+            )
+
+    def clear(self):
+        with self.lock:
+            self.store.clear()
+
+
+_KWD_MARK = object()
+
+
+def _make_key(*args, **kwargs) -> Hashable:
+    if not kwargs and len(args) == 1 and type(args[0]) in (int, str):
+        return args[0]
+    if kwargs:
+        return args + (_KWD_MARK,) + tuple(sorted(kwargs.items()))
+    return args
+
+
+def _disk_lookup(
+    disk: DiskStore,
+    namespace: str,
+    cache_key: Hashable,
+) -> Tuple[Optional[str], bool, Any]:
+    """Return (digest, found, value) of `cache_key` in `disk`, where digest
+    is None if the key cannot be stored. Errors of the store, such as keys
+    that cannot be pickled, or unreadable directories, are logged and the
+    value is treated as missing, so that they never fail the cached call."""
+    try:
+        digest = disk.key(namespace, cache_key)
+    except Exception:
+        LOG.warning(
+            f"Not using the disk cache for unpicklable key of {namespace}",
+            exc_info=True,
+        )
+        return None, False, None
+    try:
+        found, value = disk.get(digest)
+    except Exception:
+        LOG.warning(
+            f"Failed to read the disk cache {disk.directory}",
+            exc_info=True,
+        )
+        return digest, False, None
+    return digest, found, value
+
+
+def _disk_store(disk: DiskStore, digest: Optional[str], value: Any):
+    """Store `value` in `disk` if its key could be computed, logging
+    errors"""
+    if digest is None:
+        return
+    try:
+        disk.put(digest, value)
+    except Exception:
+        LOG.warning(
+            f"Failed to write the disk cache {disk.directory}",
+            exc_info=True,
+        )
+
+
+def cacheit(
+    fn: Optional[Callable] = None,
+    *,
+    maxsize: Optional[int] = 128,
+    ttl: Optional[float] = None,
+    policy: str = "lru",
+    key: Optional[Callable[..., Hashable]] = None,
+    name: Optional[str] = None,
+    level: int = logging.DEBUG,
+    fmtvalue: Optional[FMTVALUE_TYPE] = None,
+    disk: Optional[DiskStore] = None,
+):
+    """Cache the results of this function by arguments
+
+    Concurrent calls with the same key, whether from threads or from
+    asyncio tasks of the same event loop, share a single computation: only
+    one of them calls the function, and the others wait for its result.
+    Exceptions are shared by the waiting calls, but never cached.
+
+    Coroutine functions are supported, in which case their results (not the
+    coroutines) are cached. Async generator functions are not supported.
+
+    The decorated function has :code:`cache_info()`, which returns a
+    :code:`CacheInfo`, and :code:`cache_clear()`, like with
+    :code:`functools.lru_cache`.
+
+    With a `disk` store, results also persist across processes and
+    restarts: misses look the result up in the store before calling the
+    function, and computed results are written to it. Disk keys include a
+    hash of the source of the function, so results are recomputed once it
+    changes, but not when the functions it calls change. Only use it for
+    pure functions with picklable arguments and results.
+
+    Args:
+        fn: function to be decorated
+        maxsize: maximum number of cached results, or None for no limit
+        ttl: seconds after which a cached result expires, or None to keep
+            results until evicted
+        policy: "lru" to evict the least recently used result first, or
+            "lfu" to evict the least frequently used one first
+        key: function computing the cache key from the arguments of a call.
+            By default, the key is made of the positional and keyword
+            arguments, which must be hashable.
+        name: name of logger to use. If None, then fn.__module__ will be used.
+        level: logging level of "CACHE HIT" and "CACHE MISS" messages.
+            Default is logging.DEBUG.
+        fmtvalue: a callable that formats each argument value in messages,
+            see :data:`FMTVALUE_TYPE`
+        disk: store of results shared by processes, see :code:`DiskStore`
+
+    Examples:
+        >>> @cacheit(maxsize=1000, ttl=60)
+        >>> def get_user(user_id):
+        >>>     return db.fetch_user(user_id)
+        >>> get_user(42)
+        # DEBUG:__main__:CACHE MISS get_user(user_id=42)
+        >>> get_user(42)
+        # DEBUG:__main__:CACHE HIT get_user(user_id=42)
+        >>> get_user.cache_info()
+        CacheInfo(hits=1, misses=1, waits=0, evictions=0, expirations=0,
+                  maxsize=1000, currsize=1)
+
+        Keys can ignore arguments that do not change the result:
+
+        >>> @cacheit(key=lambda url, session: url)
+        >>> async def fetch(url, session):
+        >>>     async with session.get(url) as response:
+        >>>         return await response.text()
+
+        Results of a batch job can survive restarts, and large arrays are
+        read back without copies:
+
+        >>> @cacheit(maxsize=8, disk=DiskStore("/var/cache/job", 2**34))
+        >>> def features(day):
+        >>>     return np.stack([...])
+        # DEBUG:__main__:CACHE DISK HIT features(day='2021-10-18')
+    """
+    if fn is None:
+        return functools.partial(
+            cacheit,
+            maxsize=maxsize,
+            ttl=ttl,
+            policy=policy,
+            key=key,
+            name=name,
+            level=level,
+            fmtvalue=fmtvalue,
+            disk=disk,
+        )
+
+    if not callable(fn):
+        raise ValueError(f"{fn} is not callable")
+    if inspect.isasyncgenfunction(fn):
+        raise ValueError(f"{fn} is an async generator, which is not supported")
+    if policy not in POLICIES:
+        raise ValueError(f"policy must be one of {POLICIES}, got {policy}")
+
+    make_key = key or _make_key
+    cache = _Cache(maxsize, ttl, policy)
+    logger = logging.getLogger(name or fn.__module__)
+    fmthit = _CallFormatter(fn, fmtvalue, prefix="CACHE HIT")
+    fmtmiss = _CallFormatter(fn, fmtvalue, prefix="CACHE MISS")
+    fmtdisk = _CallFormatter(fn, fmtvalue, prefix="CACHE DISK HIT")
+    registration = register("cacheit", fn, {
+        "maxsize": maxsize,
+        "ttl": ttl,
+        "policy": policy,
+        "disk": None if disk is None else disk.directory,
+    })
+    namespace = (
+        None if disk is None else f"{registration.name}:{source_hash(fn)}"
+    )
+    lock = cache.lock
+    flights = cache.flights
+
+    def log(format: _CallFormatter, args: tuple, kwargs: dict):
+        if logger.isEnabledFor(level):
+            queue_tools.log(
+                logger, level, _LazyMessage(format, fn, args, kwargs)
+            )
+
+    if inspect.iscoroutinefunction(fn):
+        # Slow to import, so imported only for coroutine functions
+        import asyncio
+
+        @functools.wraps(fn)
+        async def wrapped(*args, **kwargs):
+            if not registration.enabled:
+                return await fn(*args, **kwargs)
+            registration.calls += 1
+            cache_key = make_key(*args, **kwargs)
+            loop = asyncio.get_running_loop()
+            leader = False
+            while True:
+                with lock:
+                    hit, value = cache.lookup(cache_key)
+                    if hit:
+                        break
+                    flight = flights.get(cache_key)
+                    if (
+                        not isinstance(flight, asyncio.Future) or
+                        flight.get_loop() is not loop
+                    ):
+                        cache.misses += 1
+                        flight = flights[cache_key] = loop.create_future()
+                        leader = True
+                        break
+                    cache.waits += 1
+                try:
+                    value = await asyncio.shield(flight)
+                    break
+                except asyncio.CancelledError:
+                    if not flight.cancelled():
+                        raise
+                    # The computing call was cancelled, compute again
+
+            if not leader:
+                log(fmthit, args, kwargs)
+                return value
+
+            found = False
+            try:
+                if disk is not None:
+                    digest, found, value = await loop.run_in_executor(
+                        None, _disk_lookup, disk, namespace, cache_key
+                    )
+                if found:
+                    log(fmtdisk, args, kwargs)
+                else:
+                    log(fmtmiss, args, kwargs)
+                    value = await fn(*args, **kwargs)
+            except Exception as e:
+                registration.errors += 1
+                flight.set_exception(e)
+                # Waiting calls retrieve it, so it is never unretrieved
+                flight.exception()
+                raise
+            except BaseException:
+                flight.cancel()
+                raise
+            else:
+                flight.set_result(value)
+                with lock:
+                    cache.put(cache_key, value)
+                    cache.disk_hits += found
+                if disk is not None and not found:
+                    await loop.run_in_executor(
+                        None, _disk_store, disk, digest, value
+                    )
+                return value
+            finally:
+                with lock:
+                    if flights.get(cache_key) is flight:
+                        del flights[cache_key]
+
+    else:
+        @functools.wraps(fn)
+        def wrapped(*args, **kwargs):
+            if not registration.enabled:
+                return fn(*args, **kwargs)
+            registration.calls += 1
+            cache_key = make_key(*args, **kwargs)
+            leader = False
+            while True:
+                with lock:
+                    hit, value = cache.lookup(cache_key)
+                    if hit:
+                        break
+                    flight = flights.get(cache_key)
+                    if not isinstance(flight, _Flight):
+                        cache.misses += 1
+                        flight = flights[cache_key] = _Flight()
+                        leader = True
+                        break
+                    cache.waits += 1
+                flight.done.wait()
+                if flight.error is not None:
+                    raise flight.error
+                if not flight.abandoned:
+                    value = flight.value
+                    break
+                # The computing call was interrupted, compute again
+
+            if not leader:
+                log(fmthit, args, kwargs)
+                return value
+
+            found = False
+            try:
+                if disk is not None:
+                    digest, found, value = _disk_lookup(
+                        disk, namespace, cache_key
+                    )
+                if found:
+                    log(fmtdisk, args, kwargs)
+                else:
+                    log(fmtmiss, args, kwargs)
+                    value = fn(*args, **kwargs)
+            except Exception as e:
+                registration.errors += 1
+                flight.error = e
+                raise
+            except BaseException:
+                flight.abandoned = True
+                raise
+            else:
+                flight.value = value
+                with lock:
+                    cache.put(cache_key, value)
+                    cache.disk_hits += found
+                if disk is not None and not found:
+                    _disk_store(disk, digest, value)
+                return value
+            finally:
+                with lock:
+                    if flights.get(cache_key) is flight:
+                        del flights[cache_key]
+                flight.done.set()
+
+    wrapped.cache_info = cache.info
+    wrapped.cache_clear = cache.clear
+    wrapped.registration = registration
+    return wrapped
@@ -0,0 +1,83 @@
+"""Cooperative cancellation of abandoned calls"""
+import contextlib
+import contextvars
+import threading
+from typing import Optional
+
+
+class OperationCancelled(Exception):
+    """Raised by :code:`CancelToken.check` once the token is cancelled"""
+
+
+class AttemptTimeoutError(TimeoutError):
+    """An attempt of a retried call did not finish in time, and was
+    abandoned"""
+
+
+class CancelToken:
+    """Flag telling a running call that its result is no longer wanted
+
+    Python cannot interrupt a running thread, so cancellation is
+    cooperative: long running functions should call :code:`check` between
+    steps, or wait with :code:`sleep` instead of :code:`time.sleep`. A token
+    is also cancelled once its `parent` is.
+
+    Examples:
+        >>> @retry(timeout=10)
+        >>> def export(rows):
+        >>>     token = current_token()
+        >>>     for chunk in chunks(rows):
+        >>>         token.check()  # stop once the attempt was abandoned
+        >>>         upload(chunk)
+    """
+    __slots__ = ("_event", "parent")
+
+    def __init__(self, parent: Optional["CancelToken"] = None):
+        self._event = threading.Event()
+        self.parent = parent
+
+    def cancel(self):
+        """Cancel the token, and wake up calls sleeping on it"""
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        token = self
+        while token is not None:
+            if token._event.is_set():
+                return True
+            token = token.parent
+        return False
+
+    def check(self):
+        """Raise :code:`OperationCancelled` if the token is cancelled"""
+        if self.cancelled:
+            raise OperationCancelled()
+
+    def sleep(self, seconds: float) -> bool:
+        """Sleep for `seconds`, or until the token itself is cancelled, and
+        return whether it is cancelled"""
+        self._event.wait(seconds)
+        return self.cancelled
+
+
+_current_token: contextvars.ContextVar = contextvars.ContextVar(
+    "festoon_current_token", default=None
+)
+
+
+def current_token() -> Optional[CancelToken]:
+    """Return the token of the current attempt of a retried call, in the
+    current thread or asyncio task, or None outside of attempts run with a
+    timeout, deadline or executor"""
+    return _current_token.get()
+
+
+@contextlib.contextmanager
+def using_token(token: CancelToken):
+    """Make `token` the current token within the context"""
+    reset = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(reset)
@@ -0,0 +1,291 @@
+"""Configuration files layered under the environment, for :code:`fromenv`
+
+Files are read once into an immutable snapshot of environment-style
+variables, e.g., "DB_TABLE_NAME", which :code:`fromenv` reads after the
+environment itself. Snapshots can be reloaded atomically when the files
+change.
+"""
+import configparser
+import json
+import logging
+import os
+import re
+import threading
+import types
+from typing import Any, Dict, List, Mapping, Optional, Tuple, Union
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+
+LOG = logging.getLogger(__name__)
+
+
+class Source:
+    """A file of configuration variables
+
+    Missing files have no variables, so that optional files, such as a
+    local ".env", can be listed.
+
+    Args:
+        path: path of the file
+    """
+    def __init__(self, path: Union[str, os.PathLike]):
+        self.path = os.fspath(path)
+
+    def load(self) -> Dict[str, str]:
+        """Read the variables of the file"""
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return {}
+        return self.parse(data)
+
+    def parse(self, data: bytes) -> Dict[str, str]:
+        raise NotImplementedError
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.path!r})"
+
+
+_DOTENV_LINE = re.compile(
+    r"""
+    ^\s*(?:export\s+)?
+    (?P<key>[A-Za-z_][A-Za-z0-9_.]*)\s*=\s*
+    (?:
+        "(?P<double>(?:[^"\\]|\\.)*)"
+        |'(?P<single>[^']*)'
+        |(?P<bare>[^#]*?)
+    )
+    \s*(?:\#.*)?$
+    """,
+    re.VERBOSE,
+)
+_DOTENV_ESCAPES = {"n": "\n", "t": "\t", "r": "\r"}
+
+
+class DotEnvSource(Source):
+    """A ".env" file of "KEY=value" lines
+
+    Lines may start with "export", values may be quoted, and comments start
+    with "#". Escapes such as "\\n" are replaced in double quoted values.
+    """
+    def parse(self, data: bytes) -> Dict[str, str]:
+        variables = {}
+        for number, line in enumerate(data.decode().splitlines(), 1):
+            if not line.strip() or line.lstrip().startswith("#"):
+                continue
+            match = _DOTENV_LINE.match(line)
+            if match is None:
+                raise ValueError(f"{self.path}:{number}: invalid line")
+            double = match.group("double")
+            if double is not None:
+                value = re.sub(
+                    r"\\(.)",
+                    lambda m: _DOTENV_ESCAPES.get(m.group(1), m.group(1)),
+                    double,
+                )
+            else:
+                value = match.group("single")
+                if value is None:
+                    value = match.group("bare")
+            variables[match.group("key")] = value
+        return variables
+
+
+#: Types of values of configuration files encoded as JSON
+_JSON_TYPES = (bool, int, float, list, tuple, type(None))
+
+
+def _flatten(
+    table: Mapping[str, Any],
+    prefix: str = "",
+) -> Dict[str, str]:
+    """Flatten nested tables into variables named after their path, such as
+    {"db": {"table_name": "x"}} into {"DB_TABLE_NAME": "x"}. Numbers,
+    booleans, null and arrays are encoded as JSON, which :code:`fromenv`
+    parses back, and other values, such as TOML dates, as strings."""
+    variables = {}
+    for key, value in table.items():
+        name = f"{prefix}{key.upper()}"
+        if isinstance(value, Mapping):
+            variables.update(_flatten(value, name + "_"))
+        elif isinstance(value, _JSON_TYPES):
+            variables[name] = json.dumps(value, default=str)
+        else:
+            variables[name] = str(value)
+    return variables
+
+
+class JsonSource(Source):
+    """A JSON file of a single object, which may nest tables named after
+    prefixes"""
+    def parse(self, data: bytes) -> Dict[str, str]:
+        table = json.loads(data)
+        if not isinstance(table, dict):
+            raise ValueError(f"{self.path}: expected a JSON object")
+        return _flatten(table)
+
+
+class TomlSource(Source):
+    """A TOML file, which may nest tables named after prefixes
+
+    Requires Python 3.11, or else the "tomli" package.
+    """
+    def parse(self, data: bytes) -> Dict[str, str]:
+        if tomllib is None:
+            raise ImportError(
+                f"Reading {self.path} requires Python 3.11 or tomli"
+            )
+        return _flatten(tomllib.loads(data.decode()))
+
+
+class IniSource(Source):
+    """An INI file, whose sections are named after prefixes. Variables of
+    the DEFAULT section have no prefix."""
+    def parse(self, data: bytes) -> Dict[str, str]:
+        # DEFAULT is read as a plain section, so that other sections do not
+        # inherit its values, but keep their own values of the same keys
+        parser = configparser.ConfigParser(
+            interpolation=None, default_section="\0"
+        )
+        parser.optionxform = str
+        parser.read_string(data.decode(), self.path)
+        variables = {}
+        for section in parser.sections():
+            prefix = "" if section == "DEFAULT" else f"{section.upper()}_"
+            for key, value in parser.items(section):
+                variables[f"{prefix}{key.upper()}"] = value
+        return variables
+
+
+def source_for(path: Union[str, os.PathLike]) -> Source:
+    """Return the source of the file at `path`, by its name: ".env" files
+    (or "*.env"), and files with the suffixes ".json", ".toml", ".ini" or
+    ".cfg"."""
+    path = os.fspath(path)
+    name = os.path.basename(path)
+    suffix = os.path.splitext(name)[1].lower()
+    if name == ".env" or suffix == ".env":
+        return DotEnvSource(path)
+    if suffix == ".json":
+        return JsonSource(path)
+    if suffix == ".toml":
+        return TomlSource(path)
+    if suffix in (".ini", ".cfg"):
+        return IniSource(path)
+    raise ValueError(f"Unknown kind of configuration file {path}")
+
+
+class Config:
+    """Layered configuration files, read into an immutable snapshot
+
+    Variables of earlier sources take precedence over those of later ones.
+    With :code:`fromenv(config=...)`, the precedence of a parameter is then:
+    explicit arguments, environment variables, sources in order, and
+    defaults.
+
+    All sources are read once, when the config is created. With `watch`, a
+    background thread checks the files every `interval` seconds, and
+    reloads all sources into a new snapshot when any of them changed. The
+    snapshot is replaced atomically, so a call never sees a mix of old and
+    new variables, and is kept if reloading fails.
+
+    Args:
+        sources: sources, or paths of files (see :code:`source_for`), in
+            order of precedence
+        watch: whether to reload the snapshot when files change
+        interval: seconds between checks of the files, with `watch`
+
+    Examples:
+        With a "config.toml" file containing::
+
+            [db]
+            table_name = "events"
+            batch_size = 500
+
+        and a ".env" file containing "DB_BATCH_SIZE=100", then:
+
+        >>> config = Config(".env", "config.toml")
+        >>> @fromenv(prefix="DB", config=config)
+        >>> def write(rows, table_name="test", batch_size: int = 10):
+        >>>     return table_name, batch_size
+        >>> write([])
+        ('events', 100)
+        $ DB_BATCH_SIZE=1 python main.py
+        ('events', 1)
+    """
+    def __init__(
+        self,
+        *sources: Union[Source, str, os.PathLike],
+        watch: bool = False,
+        interval: float = 1.0,
+    ):
+        self.sources: List[Source] = [
+            source if isinstance(source, Source) else source_for(source)
+            for source in sources
+        ]
+        self.interval = interval
+        self._stamps = self._stat()
+        self._snapshot = self._load()
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        if watch:
+            self._watcher = threading.Thread(
+                target=self._watch, name="festoon-config", daemon=True
+            )
+            self._watcher.start()
+
+    @property
+    def snapshot(self) -> Mapping[str, str]:
+        """The current variables, as a read-only mapping"""
+        return self._snapshot
+
+    def _load(self) -> Mapping[str, str]:
+        variables: Dict[str, str] = {}
+        for source in reversed(self.sources):
+            variables.update(source.load())
+        return types.MappingProxyType(variables)
+
+    def _stat(self) -> List[Optional[Tuple[int, int]]]:
+        stamps = []
+        for source in self.sources:
+            try:
+                stat = os.stat(source.path)
+            except OSError:
+                stamps.append(None)
+            else:
+                stamps.append((stat.st_mtime_ns, stat.st_size))
+        return stamps
+
+    def reload(self) -> bool:
+        """Reload the snapshot if any file changed, and return whether it
+        did"""
+        stamps = self._stat()
+        if stamps == self._stamps:
+            return False
+        # A file that fails to load is not retried until it changes again
+        self._stamps = stamps
+        self._snapshot = self._load()
+        LOG.info(f"Reloaded configuration from {self.sources}")
+        return True
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.reload()
+            except Exception:
+                LOG.exception("Failed to reload configuration, keeping it")
+
+    def close(self):
+        """Stop watching files"""
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
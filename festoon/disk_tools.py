@@ -0,0 +1,252 @@
+"""Persistent storage of function results on disk, shared by processes"""
+import contextlib
+import hashlib
+import inspect
+import logging
+import mmap
+import os
+import pickle
+import struct
+import tempfile
+import threading
+from typing import Any, Callable, Hashable, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+LOG = logging.getLogger(__name__)
+
+_MAGIC = b"FESTOON\x01"
+#: Magic, length of the pickle stream, and number of out-of-band buffers
+_HEADER = struct.Struct("<8sQI")
+_LENGTH = struct.Struct("<Q")
+#: Alignment of out-of-band buffers in files, suitable for any array dtype
+_ALIGN = 64
+_SUFFIX = ".pkl"
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // _ALIGN) * _ALIGN
+
+
+def source_hash(fn: Callable) -> str:
+    """Return a hash of the source code of `fn`, or of its bytecode if the
+    source is not available"""
+    fn = inspect.unwrap(fn)
+    try:
+        source = inspect.getsource(fn).encode()
+    except (OSError, TypeError):
+        code = getattr(fn, "__code__", None)
+        source = b"" if code is None else code.co_code
+    return hashlib.sha256(source).hexdigest()
+
+
+class DiskStore:
+    """Directory of pickled values, addressed by the hash of their key
+
+    Values are pickled with protocol 5, and their out-of-band buffers, such
+    as the data of numpy arrays, are stored after the pickle stream. Reading
+    a value maps its file in memory, so these buffers are not copied: large
+    arrays are backed by the page cache, and read-only.
+
+    Writes go to a temporary file that atomically replaces the entry, so
+    processes sharing the directory never read partial entries. Once the
+    entries exceed `max_bytes`, the least recently used ones are deleted,
+    under a lock file on platforms that support :code:`fcntl`.
+
+    Unreadable entries, e.g. of an incompatible version of a class, are
+    deleted and treated as missing, and errors writing entries are logged.
+    :code:`cacheit` also logs the other errors of the store, such as keys
+    that cannot be pickled, so the store never fails the calls it caches.
+
+    Args:
+        directory: directory of the entries, created if missing
+        max_bytes: maximum total size of the entries, or None for no limit
+
+    Examples:
+        >>> store = DiskStore("/var/cache/pipeline", max_bytes=10 * 2**30)
+        >>> key = store.key("pipeline.features", (day,))
+        >>> found, features = store.get(key)
+        >>> if not found:
+        >>>     features = compute_features(day)
+        >>>     store.put(key, features)
+    """
+    def __init__(self, directory: str, max_bytes: Optional[int] = None):
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        #: Estimate of the total size of entries, None until first counted
+        self._size: Optional[int] = None
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, namespace: str, key: Hashable) -> str:
+        """Return the hex digest addressing `key` within `namespace`
+
+        Keys must pickle to the same bytes in every process: avoid sets of
+        strings, whose order depends on hash randomization.
+        """
+        digest = hashlib.sha256(namespace.encode())
+        digest.update(pickle.dumps(key, protocol=5))
+        return digest.hexdigest()
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], digest[2:] + _SUFFIX)
+
+    def get(self, digest: str) -> Tuple[bool, Any]:
+        """Return (True, value) if an entry exists for `digest`, or
+        (False, None)"""
+        path = self._path(digest)
+        try:
+            with open(path, "rb") as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            # ValueError is raised for empty files
+            return False, None
+        try:
+            value = self._load(data)
+        except Exception:
+            LOG.warning(f"Deleting unreadable entry {path}", exc_info=True)
+            with contextlib.suppress(OSError):
+                os.remove(path)
+            return False, None
+        with contextlib.suppress(OSError):
+            # The modification time orders entries for eviction
+            os.utime(path)
+        return True, value
+
+    @staticmethod
+    def _load(data: mmap.mmap) -> Any:
+        magic, length, count = _HEADER.unpack_from(data)
+        if magic != _MAGIC:
+            raise ValueError("not an entry")
+        offset = _HEADER.size
+        lengths = []
+        for _ in range(count):
+            lengths.append(_LENGTH.unpack_from(data, offset)[0])
+            offset += _LENGTH.size
+        view = memoryview(data)
+        stream = view[offset:offset + length]
+        offset += length
+        buffers = []
+        for size in lengths:
+            offset = _aligned(offset)
+            buffers.append(view[offset:offset + size])
+            offset += size
+        try:
+            return pickle.loads(stream, buffers=buffers)
+        finally:
+            stream.release()
+            if not count:
+                view.release()
+                data.close()
+            # Otherwise, the mapping lives as long as the buffers of the
+            # value that use it
+
+    def put(self, digest: str, value: Any):
+        """Store `value` as the entry for `digest`"""
+        buffers: List[pickle.PickleBuffer] = []
+        try:
+            stream = pickle.dumps(
+                value, protocol=5, buffer_callback=buffers.append
+            )
+        except Exception:
+            LOG.warning(
+                f"Not storing unpicklable {type(value).__qualname__}",
+                exc_info=True,
+            )
+            return
+        path = self._path(digest)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(
+                prefix=".", suffix=".tmp", dir=os.path.dirname(path)
+            )
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    size = self._dump(f, stream, buffers)
+                os.replace(tmp_path, path)
+            except BaseException:
+                with contextlib.suppress(OSError):
+                    os.remove(tmp_path)
+                raise
+        except OSError:
+            LOG.warning(f"Failed to store entry {path}", exc_info=True)
+            return
+        with self._lock:
+            if self._size is not None:
+                self._size += size
+        if self.max_bytes is not None:
+            self._evict()
+
+    @staticmethod
+    def _dump(f, stream: bytes, buffers: List[pickle.PickleBuffer]) -> int:
+        raws = [buffer.raw() for buffer in buffers]
+        f.write(_HEADER.pack(_MAGIC, len(stream), len(raws)))
+        for raw in raws:
+            f.write(_LENGTH.pack(raw.nbytes))
+        f.write(stream)
+        offset = f.tell()
+        for raw in raws:
+            padding = _aligned(offset) - offset
+            f.write(b"\0" * padding)
+            f.write(raw)
+            offset += padding + raw.nbytes
+        return offset
+
+    def _entries(self) -> List[Tuple[float, int, str]]:
+        """Return the (mtime, size, path) of all entries"""
+        entries = []
+        for subdir in os.scandir(self.directory):
+            if not subdir.is_dir():
+                continue
+            for entry in os.scandir(subdir.path):
+                if not entry.name.endswith(_SUFFIX):
+                    continue
+                with contextlib.suppress(FileNotFoundError):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def size(self) -> int:
+        """Return the total size of the entries, in bytes"""
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        with self._lock:
+            if self._size is not None and self._size <= self.max_bytes:
+                return
+            with self._file_lock():
+                entries = self._entries()
+                total = sum(size for _, size, _ in entries)
+                entries.sort()
+                for _, size, path in entries:
+                    if total <= self.max_bytes:
+                        break
+                    # Processes that mapped the entry keep reading it
+                    with contextlib.suppress(OSError):
+                        os.remove(path)
+                        total -= size
+                self._size = total
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.directory, ".lock"), "a") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def clear(self):
+        """Delete all entries"""
+        with self._lock, self._file_lock():
+            for _, _, path in self._entries():
+                with contextlib.suppress(OSError):
+                    os.remove(path)
+            self._size = 0
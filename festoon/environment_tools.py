@@ -1,25 +1,273 @@
+import dataclasses
+import enum
 import functools
 import inspect
 import os
-from typing import Any, Callable, get_args, List, Optional
-
-
-def _cast(value: Any, param: inspect.Parameter) -> Any:
-
-    types = set()
+import pathlib
+import threading
+import typing
+from typing import (
+    Any, Callable, Dict, List, Mapping, NamedTuple, Optional, Tuple,
+)
+
+from .config_tools import Config
+from .parse_tools import ParseError, parser_for, PARSER_TYPE
+from .registry_tools import register
+
+
+def _parser(param: inspect.Parameter, hints: Dict[str, Any]) -> PARSER_TYPE:
+    """Return the parser of environment values of `param`, from its type
+    annotation, or else from the type of its default value"""
+    annotation = hints.get(param.name, param.annotation)
+    if annotation is param.empty or isinstance(annotation, str):
+        # Unannotated, or an annotation that could not be resolved
+        annotation = (
+            str if param.default in (None, param.empty)
+            else type(param.default)
+        )
+    return parser_for(annotation)
 
-    if param.annotation is not param.empty:
-        types.add(param.annotation)
-        for t in get_args(param.annotation):
-            types.add(t)
-    if param.default is not param.empty:
-        types.add(type(param.default))
 
-    for Type in types:
+def _type_hints(fn: Callable) -> Dict[str, Any]:
+    """Return the resolved annotations of `fn`, or of the fields and
+    constructor of a class"""
+    targets = [fn.__init__, fn] if inspect.isclass(fn) else [fn]
+    hints: Dict[str, Any] = {}
+    for target in targets:
         try:
-            return Type(value)
+            hints.update(typing.get_type_hints(target))
         except Exception:
+            # E.g., forward references to undefined names, or builtins
             pass
+    return hints
+
+
+def _parse(
+    parser: PARSER_TYPE,
+    value: str,
+    env_name: str,
+    from_environ: bool,
+) -> Any:
+    """Parse `value`, naming the variable it comes from in errors"""
+    try:
+        return parser(value)
+    except ParseError as e:
+        source = (
+            "environment variable" if from_environ
+            else "configuration variable"
+        )
+        raise ParseError(
+            e.value, e.annotation, e.reason, source=f"{source} {env_name}",
+        ) from None
+
+
+#: Types whose values may be shared by calls
+_IMMUTABLE_TYPES = (
+    str, bytes, int, float, complex, bool, type(None), enum.Enum,
+    pathlib.PurePath,
+)
+
+
+def _is_immutable(value: Any) -> bool:
+    """Whether a parsed value may be reused by later calls, rather than
+    parsed again for each call, so that calls never see the changes other
+    calls made to mutable values, such as lists"""
+    if isinstance(value, (tuple, frozenset)):
+        return all(_is_immutable(item) for item in value)
+    return isinstance(value, _IMMUTABLE_TYPES)
+
+
+class _Binding(NamedTuple):
+    name: str
+    env_name: str
+    #: Number of positional arguments after which the parameter is no longer
+    #: supplied positionally. None for keyword-only parameters.
+    position: Optional[int]
+    parser: PARSER_TYPE
+
+
+def _plan(
+    fn: Callable,
+    prefix: str,
+    include: Optional[List[str]],
+    exclude: Optional[List[str]],
+    required: bool = False,
+) -> List[_Binding]:
+    """Compute, once, which parameters of `fn` may be read from the env,
+    including those without default if `required`"""
+    plan = []
+    parameters = inspect.signature(fn).parameters
+    hints = _type_hints(fn)
+    for i, (name, param) in enumerate(parameters.items()):
+        if (
+            (param.default is param.empty and not required) or
+            (exclude is not None and name in exclude) or
+            (include is not None and name not in include)
+        ):
+            continue
+        if param.kind is param.POSITIONAL_OR_KEYWORD:
+            position = i + 1
+        elif param.kind is param.KEYWORD_ONLY:
+            position = None
+        else:
+            continue
+        plan.append(_Binding(
+            name, f"{prefix}{name.upper()}", position, _parser(param, hints)
+        ))
+    return plan
+
+
+class _ClassPlan(NamedTuple):
+    cls: type
+    bindings: List[_Binding]
+    #: Names of parameters without default
+    required: List[str]
+    #: (name, plan) pairs of nested config objects
+    nested: List[Tuple[str, "_ClassPlan"]]
+
+
+def _is_config_class(annotation: Any) -> bool:
+    """Whether fields annotated with `annotation` are nested config objects
+    rather than values"""
+    return inspect.isclass(annotation) and (
+        dataclasses.is_dataclass(annotation) or
+        (issubclass(annotation, tuple) and hasattr(annotation, "_fields")) or
+        hasattr(annotation, "from_env")
+    )
+
+
+def _class_plan(
+    cls: type,
+    prefix: str,
+    include: Optional[List[str]],
+    exclude: Optional[List[str]],
+) -> _ClassPlan:
+    """Compute, once, the variables of the fields of `cls`, and of its
+    nested config objects"""
+    hints = _type_hints(cls)
+    parameters = inspect.signature(cls).parameters
+    nested = [
+        (name, _class_plan(
+            hints[name], f"{prefix}{name.upper()}_", None, None
+        ))
+        for name in parameters
+        if _is_config_class(hints.get(name)) and
+        (exclude is None or name not in exclude) and
+        (include is None or name in include)
+    ]
+    bindings = _plan(
+        cls, prefix, include,
+        list(exclude or []) + [name for name, _ in nested],
+        required=True,
+    )
+    required = [
+        name for name, param in parameters.items()
+        if param.default is param.empty
+    ]
+    return _ClassPlan(cls, bindings, required, nested)
+
+
+def _resolve(plan: _ClassPlan, snapshot: Optional[Mapping[str, str]]):
+    """Create an instance of a config class from the environment"""
+    kwargs = {}
+    for binding in plan.bindings:
+        raw = os.environ.get(binding.env_name)
+        from_environ = raw is not None
+        if not from_environ and snapshot is not None:
+            raw = snapshot.get(binding.env_name)
+        if raw is None:
+            if binding.name in plan.required:
+                raise ValueError(
+                    f"Missing environment variable {binding.env_name} for "
+                    f"{plan.cls.__qualname__}.{binding.name}"
+                )
+            continue
+        kwargs[binding.name] = _parse(
+            binding.parser, raw, binding.env_name, from_environ
+        )
+    for name, nested in plan.nested:
+        kwargs[name] = _resolve(nested, snapshot)
+    return plan.cls(**kwargs)
+
+
+def _fromenv_class(
+    cls: type,
+    prefix: str,
+    include: Optional[List[str]],
+    exclude: Optional[List[str]],
+    config: Optional[Config],
+) -> type:
+    plan = _class_plan(cls, prefix, include, exclude)
+    registration = register(
+        "fromenv",
+        cls,
+        {
+            "prefix": prefix,
+            "include": include,
+            "exclude": exclude,
+            "config": config,
+        },
+        toggleable=False,
+    )
+    lock = threading.Lock()
+    # The resolved instance, and the config snapshot it was resolved with
+    resolved: Tuple[Any, Any] = (None, None)
+
+    def from_env():
+        """Return the instance resolved from the environment, creating it
+        on first use"""
+        nonlocal resolved
+        snapshot = None if config is None else config.snapshot
+        instance, resolved_snapshot = resolved
+        if instance is None or resolved_snapshot is not snapshot:
+            with lock:
+                instance, resolved_snapshot = resolved
+                if instance is None or resolved_snapshot is not snapshot:
+                    registration.calls += 1
+                    instance = _resolve(plan, snapshot)
+                    resolved = (instance, snapshot)
+        return instance
+
+    def refresh():
+        """Resolve the instance again on next use"""
+        nonlocal resolved
+        with lock:
+            resolved = (None, None)
+
+    from_env.refresh = refresh
+    from_env.registration = registration
+    cls.from_env = staticmethod(from_env)
+    return cls
+
+
+class _EnvironReader:
+    """Fast lookups of the environment variables of a binding plan
+
+    :code:`os.environ.get` raises and catches a KeyError internally for every
+    missing key, which dominates the cost of a decorated call. When possible,
+    keys are encoded once and looked up directly in the underlying mapping.
+    """
+    def __init__(self, environ: Mapping[str, str], plan: List[_Binding]):
+        self.environ = environ
+        data = getattr(environ, "_data", None)
+        encodekey = getattr(environ, "encodekey", None)
+        decodevalue = getattr(environ, "decodevalue", None)
+        if data is None or encodekey is None or decodevalue is None:
+            self.get = environ.get
+            encodekey = _identity
+            self.decode = _identity
+        else:
+            self.get = data.get
+            self.decode = decodevalue
+        #: (name, position, parser, env_name, key) tuples, with the key to
+        #: look up
+        self.plan = [
+            (b.name, b.position, b.parser, b.env_name, encodekey(b.env_name))
+            for b in plan
+        ]
+
+
+def _identity(value: Any) -> Any:
     return value
 
 
@@ -28,13 +276,18 @@ def fromenv(
     prefix: Optional[str] = None,
     include: Optional[List[str]] = None,
     exclude: Optional[List[str]] = None,
+    config: Optional[Config] = None,
+    as_config: bool = False,
 ):
     """Allow any keyword argument to be supplied by an environment variable
 
     Notes:
-        If a keyword argument has type annotations, then variable will
-        be attempted to be cast as the respective type if it is read
-        from the environment.
+        Values read from the environment are parsed according to the type
+        annotation of their parameter, or else the type of its default
+        value, see :code:`festoon.parse_tools.parser_for` for the supported
+        annotations. Parsers are compiled once, when the function is
+        decorated. Invalid values raise :code:`ParseError`, a ValueError,
+        naming the environment variable.
 
 
     Args:
@@ -47,6 +300,10 @@ def fromenv(
             all caps.
         include: only include these listed parameter names for substitution
         exclude: list of paramters names to ignore
+        config: configuration files providing the variables missing from
+            the environment, see :code:`festoon.config_tools.Config`
+        as_config: resolve a decorated class as a whole config object with
+            :code:`from_env`, instead of wrapping its constructor
 
     Examples:
 
@@ -86,6 +343,54 @@ def fromenv(
 
         Note that in the second execution, FOO_Y=-1 has no effect because
         "y" was in the excludes list.
+
+        The decorated function's signature is inspected only once, when it
+        is decorated. Immutable values read from the environment, such as
+        numbers and strings, are cast once and reused for as long as the
+        environment variable keeps the same value. Mutable values, such as
+        lists, are cast anew for each call.
+        The cached values can be dropped explicitly with :code:`refresh`::
+
+            func.refresh()
+
+        Decorated classes are wrapped like functions, so that calling them
+        reads missing constructor arguments from the environment. With
+        :code:`as_config=True`, classes, such as dataclasses and NamedTuples,
+        are resolved as whole config objects instead. The decorated class is
+        returned unchanged, except for a :code:`from_env` static method,
+        which creates an instance from the environment on first use, and
+        returns the same instance after that (until
+        :code:`from_env.refresh()`, or until a watched :code:`Config`
+        reloads). Fields without default are required. Fields annotated with
+        another dataclass, NamedTuple or class decorated with `as_config`
+        are nested config objects, whose variables are prefixed with the name
+        of the field::
+
+            @dataclass(frozen=True)
+            class Pool:
+                size: int = 4
+                timeout: float = 1.0
+
+            @dataclass(frozen=True)
+            class Database:
+                url: str
+                pool: Pool = Pool()
+
+            @fromenv(prefix="", as_config=True)
+            @dataclass(frozen=True)
+            class Settings:
+                db: Database
+                debug: bool = False
+
+            $ DB_URL=postgres://db DB_POOL_SIZE=16 python main.py
+
+            >>> Settings.from_env()
+            Settings(db=Database(url='postgres://db', pool=Pool(size=16,
+            timeout=1.0)), debug=False)
+
+        Instances are shared by all threads, so they should be immutable:
+        declare dataclasses with :code:`frozen=True` (and :code:`slots=True`
+        since Python 3.10), or use NamedTuples.
     """
     if fn is None:
         return functools.partial(
@@ -93,6 +398,8 @@ def fromenv(
             prefix=prefix,
             include=include,
             exclude=exclude,
+            config=config,
+            as_config=as_config,
         )
 
     if not callable(fn):
@@ -101,37 +408,77 @@ def fromenv(
     if prefix is None:
         prefix = fn.__name__.upper()
 
-    if not prefix.endswith("_"):
+    if prefix and not prefix.endswith("_"):
         prefix = prefix + "_"
 
+    if as_config:
+        if not inspect.isclass(fn):
+            raise ValueError(f"{fn} must be a class with as_config")
+        return _fromenv_class(fn, prefix, include, exclude, config)
+
+    plan = _plan(fn, prefix, include, exclude)
+    # Maps parameter name to (raw environment value, cast value)
+    cache: Dict[str, Tuple[Any, Any]] = {}
+    reader = _EnvironReader(os.environ, plan)
+    registration = register(
+        "fromenv",
+        fn,
+        {
+            "prefix": prefix,
+            "include": include,
+            "exclude": exclude,
+            "config": config,
+        },
+        toggleable=False,
+    )
+
     @functools.wraps(fn)
     def wrapped(*args, **kwargs):
-
-        parameters = inspect.signature(fn).parameters
-
-        for name, param in parameters.items():
+        nonlocal reader
+        registration.calls += 1
+        if reader.environ is not os.environ:
+            reader = _EnvironReader(os.environ, plan)
+        get = reader.get
+        decode = reader.decode
+        snapshot = None if config is None else config.snapshot
+
+        nargs = len(args)
+        for name, position, parser, env_name, key in reader.plan:
             if (
                 name in kwargs or
-                param.default is param.empty or
-                (exclude is not None and name in exclude) or
-                (include is not None and name not in include)
+                (position is not None and nargs >= position)
             ):
                 continue
 
-            # Try to get the value from the environment
-            env_name = f"{prefix}{name.upper()}"
-            try:
-                value = os.environ[env_name]
-            except KeyError:
-                continue
-
-            # Try to cast the value as annotation type if it has one
-            value = _cast(value, param)
-
-            kwargs[name] = _cast(value, param)
+            # Try to get the value from the environment, then from the
+            # configuration files
+            raw = get(key)
+            from_environ = raw is not None
+            if not from_environ:
+                if snapshot is None:
+                    continue
+                raw = snapshot.get(env_name)
+                if raw is None:
+                    continue
+
+            # Parse the value as annotation type only if it changed
+            cached = cache.get(name)
+            if cached is not None and cached[0] == raw:
+                kwargs[name] = cached[1]
+            else:
+                value = _parse(
+                    parser, decode(raw) if from_environ else raw, env_name,
+                    from_environ,
+                )
+                if _is_immutable(value):
+                    cache[name] = (raw, value)
+                kwargs[name] = value
 
         return fn(*args, **kwargs)
 
+    wrapped.refresh = cache.clear
+    wrapped.registration = registration
+
     return wrapped
 
 
@@ -1,28 +1,123 @@
+import contextvars
 import functools
+import inspect
 import logging
+import threading
 import time
-from typing import Callable, List, Optional, Type, Union
+from typing import (
+    Any, Callable, Iterable, Iterator, List, Optional, Sequence, Type,
+    TYPE_CHECKING, Union,
+)
 
+from .breaker_tools import CircuitBreaker, CircuitOpenError, RetryBudget
+from .cancel_tools import AttemptTimeoutError, CancelToken, current_token
+from .cancel_tools import using_token
+from .metrics_tools import as_registry, FunctionMetrics, instrument
+from .metrics_tools import METRICS_TYPE
+from .registry_tools import register
+
+if TYPE_CHECKING:
+    # Slow to import, like asyncio, so imported only once decorating a
+    # function that needs it
+    import concurrent.futures
 
 LOG = logging.getLogger(__name__)
 
 
+def _start_daemon(
+    name: str,
+    fn: Callable,
+    *args: Any,
+) -> "concurrent.futures.Future":
+    """Run `fn(*args)` in a new daemon thread, and return the future of its
+    result. Unlike the workers of a thread pool, the thread is not joined
+    at exit, so a hung call does not keep the process alive."""
+    import concurrent.futures
+
+    future: concurrent.futures.Future = concurrent.futures.Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            result = fn(*args)
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+
+    threading.Thread(target=run, name=name, daemon=True).start()
+    return future
+
+
 def retry(
     fn: Optional[Callable] = None,
     *,
-    schedule: Optional[List[int]] = None,
+    schedule: Optional[Iterable[float]] = None,
     catch: Union[Type[Exception], List[Type[Exception]]] = Exception,
     log_exceptions: bool = True,
+    budget: Optional[RetryBudget] = None,
+    breaker: Optional[CircuitBreaker] = None,
+    metrics: METRICS_TYPE = False,
+    timeout: Optional[float] = None,
+    deadline: Optional[float] = None,
+    executor: Optional["concurrent.futures.Executor"] = None,
 ):
     """Repeatedly retry a function on exception after sleeping
 
+    Coroutine functions and async generator functions are also supported.
+    In that case the decorated function is awaitable (or async iterable) and
+    the delay between attempts uses :code:`asyncio.sleep`, so that retrying
+    never blocks the event loop. An async generator is only retried if it
+    fails before yielding its first item; once items have been handed to the
+    caller, an exception is propagated as-is.
+
+    With a `timeout`, a `deadline` or an `executor`, attempts of functions
+    run on the executor, or by default each on a new daemon thread, while
+    the calling thread waits for them. An attempt that does not finish
+    within `timeout` seconds is abandoned, and retried like a caught
+    exception: it fails with :code:`AttemptTimeoutError`, and the
+    :code:`CancelToken` of the attempt is cancelled. Threads cannot be
+    interrupted, so the abandoned attempt keeps running until it checks its
+    token (see :code:`current_token`) or returns. A call thus leaves behind
+    at most one thread per attempt, and hung attempts that never check
+    their token pile up, one thread each, for the life of the process.
+    Daemon threads do not hold the process at exit, whereas an `executor`
+    must have room for abandoned attempts, and its threads are joined at
+    exit. Attempts of coroutine functions are cancelled instead. Async
+    generator functions support none of these options.
+
+    With a process pool executor, no token reaches the attempts, and the
+    retried function must be picklable, so wrap it without the decorator
+    syntax, e.g. :code:`fetch_retried = retry(fetch, executor=pool)`.
+
     Args:
         fn: callable being decorated
-        schedule: sequence of delay times to sleep in between call attempts
+        schedule: sequence of delay times to sleep in between call attempts,
+            or a backoff policy from :code:`festoon.backoff_tools`, such as
+            :code:`ExponentialBackoff`, with jitter, capped delays or a
+            deadline. It is iterated anew on each call, so it must not be a
+            one-shot iterator. Default is [1, 2, 4, ..., 64].
         catch: Exception class or list of Exception classes that are caught
             when invoking the decoratee.
         log_exceptions: If True, then logging.exception is called whenever
             an error is caught.
+        budget: if not None, then a retry happens only if the budget has a
+            token left. Share a budget between the functions calling the same
+            dependency to bound the total retry load on it.
+        breaker: if not None, then every attempt first checks the circuit
+            breaker, and fails fast with :code:`CircuitOpenError` while the
+            circuit is open. Exceptions in `catch` are recorded as failures,
+            any other outcome as a success.
+        metrics: if True, or a :code:`festoon.metrics_tools.MetricsRegistry`,
+            then calls, errors by exception type, latencies (including
+            retries) and retried attempts are recorded into the default or
+            given registry.
+        timeout: seconds after which an attempt is abandoned, or None
+        deadline: seconds after the call after which no attempt is made,
+            and the last attempt is abandoned, or None. The call gives up
+            instead of sleeping a delay that would end past the deadline.
+        executor: executor running attempts of functions, see above
 
     Examples:
         >>> count = 0
@@ -47,6 +142,41 @@ def retry(
         # INFO:__main__:Sleeping for 2 seconds and then retrying...
         # SUCCESS!
 
+        Many clients failing at once should use a jittered backoff, so that
+        they do not all retry at the same instants:
+
+        >>> @retry(schedule=ExponentialBackoff(
+        >>>     base=0.5, max_delay=30, jitter="full", deadline=120,
+        >>> ))
+        >>> def func():
+        >>>     ...
+
+        Functions calling the same dependency can share a retry budget and
+        a circuit breaker, so that an outage of the dependency makes them
+        fail fast instead of multiplying its load:
+
+        >>> budget = RetryBudget(ratio=0.1)
+        >>> breaker = CircuitBreaker(failure_threshold=5, reset_timeout=30)
+        >>> @retry(budget=budget, breaker=breaker, catch=ConnectionError)
+        >>> def read():
+        >>>     ...
+        >>> @retry(budget=budget, breaker=breaker, catch=ConnectionError)
+        >>> def write():
+        >>>     ...
+
+        Coroutine functions are retried without blocking the event loop:
+
+        >>> @retry(schedule=[0.1, 0.5], catch=ConnectionError)
+        >>> async def fetch(session, url):
+        >>>     async with session.get(url) as response:
+        >>>         return await response.text()
+
+        Hung calls are abandoned after 5 seconds, without holding the
+        calling thread for more than 30 seconds overall:
+
+        >>> @retry(timeout=5, deadline=30, catch=ConnectionError)
+        >>> def fetch(url):
+        >>>     ...
     """
     # Allows @retry or @retry(...)
     if fn is None:
@@ -55,30 +185,500 @@ def retry(
             schedule=schedule,
             catch=catch,
             log_exceptions=log_exceptions,
+            budget=budget,
+            breaker=breaker,
+            metrics=metrics,
+            timeout=timeout,
+            deadline=deadline,
+            executor=executor,
         )
 
     if not callable(fn):
         raise ValueError(f"{fn} is not callable")
 
-    if issubclass(catch, Exception):
+    if isinstance(catch, type) and issubclass(catch, BaseException):
         catch = (catch,)
+    else:
+        catch = tuple(catch)
+
+    attempts_off_thread = (
+        timeout is not None or deadline is not None or executor is not None
+    )
+    if attempts_off_thread:
+        if inspect.isasyncgenfunction(fn):
+            raise ValueError(
+                "timeout, deadline and executor are not supported for async "
+                "generator functions"
+            )
+        if executor is not None and inspect.iscoroutinefunction(fn):
+            raise ValueError(
+                "executor is not supported for coroutine functions"
+            )
+        # Abandoned attempts are retried, whatever is caught
+        catch += (AttemptTimeoutError,)
+
+    if inspect.iscoroutinefunction(fn) or inspect.isasyncgenfunction(fn):
+        import asyncio
+    elif attempts_off_thread:
+        import concurrent.futures
 
     if schedule is None:
         schedule = [2**p for p in range(7)]
 
-    @functools.wraps(fn)
-    def wrapped(*args, **kwargs):
-        for delay in schedule:
-            try:
+    registration = register("retry", fn, {
+        "schedule": schedule,
+        "catch": catch,
+        "budget": budget,
+        "breaker": breaker,
+        "timeout": timeout,
+        "deadline": deadline,
+    })
+
+    registry = as_registry(metrics)
+    function_metrics = None
+    if registry is not None:
+        function_metrics = FunctionMetrics(
+            registry, registration.name, "retry"
+        )
+
+    def before_attempt():
+        if breaker is not None and not breaker.allow():
+            registration.errors += 1
+            raise CircuitOpenError(breaker)
+
+    def on_success():
+        if breaker is not None:
+            breaker.record_success()
+
+    def on_interrupted():
+        """Give back the breaker slot of an attempt ended by a
+        BaseException, such as a cancellation, without an outcome"""
+        if breaker is not None:
+            breaker.record_cancelled()
+
+    def on_failure(
+        e: Exception,
+        delays: Iterator[float],
+        deadline_at: Optional[float] = None,
+    ) -> Optional[float]:
+        """Return the delay before retrying, or None to give up"""
+        if breaker is not None:
+            breaker.record_failure()
+        delay = next(delays, None)
+        if delay is None:
+            registration.errors += 1
+            return None
+        if deadline_at is not None and time.monotonic() + delay >= deadline_at:
+            LOG.info("Retry deadline reached, not retrying.")
+            registration.errors += 1
+            return None
+        if budget is not None and not budget.try_spend():
+            LOG.info("Retry budget exhausted, not retrying.")
+            registration.errors += 1
+            return None
+        if log_exceptions:
+            LOG.exception(e)
+        LOG.info(f"Sleeping for {delay:.3g} seconds and then retrying...")
+        registration.retries += 1
+        if function_metrics is not None:
+            function_metrics.retries.inc(function_metrics.labels)
+        return delay
+
+    def attempt_timeout(deadline_at: Optional[float]) -> Optional[float]:
+        if deadline_at is None:
+            return timeout
+        remaining = max(deadline_at - time.monotonic(), 0.0)
+        return remaining if timeout is None else min(timeout, remaining)
+
+    def call_with_token(token: CancelToken, args: tuple, kwargs: dict):
+        with using_token(token):
+            return fn(*args, **kwargs)
+
+    def attempt(args: tuple, kwargs: dict, deadline_at: Optional[float]):
+        """Run an attempt on the executor, abandoning it on timeout"""
+        seconds = attempt_timeout(deadline_at)
+        token = CancelToken(current_token())
+        if executor is None:
+            future = _start_daemon(
+                f"festoon-retry {registration.name}",
+                contextvars.copy_context().run,
+                call_with_token, token, args, kwargs,
+            )
+        elif isinstance(executor, concurrent.futures.ProcessPoolExecutor):
+            future = executor.submit(fn, *args, **kwargs)
+        else:
+            future = executor.submit(
+                contextvars.copy_context().run,
+                call_with_token, token, args, kwargs,
+            )
+        try:
+            return future.result(seconds)
+        except concurrent.futures.TimeoutError:
+            token.cancel()
+            future.cancel()
+            raise AttemptTimeoutError(
+                f"Attempt abandoned after {seconds:.3g} seconds"
+            ) from None
+        except BaseException:
+            # E.g., KeyboardInterrupt while waiting
+            token.cancel()
+            raise
+
+    async def attempt_async(
+        args: tuple,
+        kwargs: dict,
+        deadline_at: Optional[float],
+    ):
+        """Await an attempt, cancelling it on timeout"""
+        seconds = attempt_timeout(deadline_at)
+        token = CancelToken(current_token())
+        try:
+            with using_token(token):
+                return await asyncio.wait_for(fn(*args, **kwargs), seconds)
+        except asyncio.TimeoutError:
+            raise AttemptTimeoutError(
+                f"Attempt cancelled after {seconds:.3g} seconds"
+            ) from None
+        finally:
+            token.cancel()
+
+    def deadline_from_now() -> Optional[float]:
+        return None if deadline is None else time.monotonic() + deadline
+
+    if inspect.isasyncgenfunction(fn):
+        @functools.wraps(fn)
+        async def wrapped(*args, **kwargs):
+            if not registration.enabled:
+                async for item in fn(*args, **kwargs):
+                    yield item
+                return
+            registration.calls += 1
+            if budget is not None:
+                budget.record_call()
+            delays = iter(schedule)
+            while True:
+                before_attempt()
+                started = False
+                try:
+                    async for item in fn(*args, **kwargs):
+                        if not started:
+                            started = True
+                            on_success()
+                        yield item
+                    if not started:
+                        on_success()
+                    return
+                except catch as e:
+                    if started:
+                        registration.errors += 1
+                        raise
+                    delay = on_failure(e, delays)
+                    if delay is None:
+                        raise
+                except Exception:
+                    registration.errors += 1
+                    if not started:
+                        on_success()
+                    raise
+                except BaseException:
+                    if not started:
+                        on_interrupted()
+                    raise
+                await asyncio.sleep(delay)
+
+    elif inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def wrapped(*args, **kwargs):
+            if not registration.enabled:
+                return await fn(*args, **kwargs)
+            registration.calls += 1
+            if budget is not None:
+                budget.record_call()
+            delays = iter(schedule)
+            deadline_at = deadline_from_now()
+            while True:
+                before_attempt()
+                try:
+                    if attempts_off_thread:
+                        result = await attempt_async(args, kwargs, deadline_at)
+                    else:
+                        result = await fn(*args, **kwargs)
+                except catch as e:
+                    delay = on_failure(e, delays, deadline_at)
+                    if delay is None:
+                        raise
+                except Exception:
+                    registration.errors += 1
+                    on_success()
+                    raise
+                except BaseException:
+                    on_interrupted()
+                    raise
+                else:
+                    on_success()
+                    return result
+                await asyncio.sleep(delay)
+
+    else:
+        @functools.wraps(fn)
+        def wrapped(*args, **kwargs):
+            if not registration.enabled:
                 return fn(*args, **kwargs)
-            except tuple(catch) as e:
-                if log_exceptions:
-                    LOG.exception(e)
-                LOG.info(f"Sleeping for {delay} seconds and then retrying...")
+            registration.calls += 1
+            if budget is not None:
+                budget.record_call()
+            delays = iter(schedule)
+            deadline_at = deadline_from_now()
+            while True:
+                before_attempt()
+                try:
+                    if attempts_off_thread:
+                        result = attempt(args, kwargs, deadline_at)
+                    else:
+                        result = fn(*args, **kwargs)
+                except catch as e:
+                    delay = on_failure(e, delays, deadline_at)
+                    if delay is None:
+                        raise
+                except Exception:
+                    registration.errors += 1
+                    on_success()
+                    raise
+                except BaseException:
+                    on_interrupted()
+                    raise
+                else:
+                    on_success()
+                    return result
+                time.sleep(delay)
+
+    if function_metrics is not None:
+        wrapped = instrument(wrapped, function_metrics, registration)
+    wrapped.registration = registration
+    return wrapped
+
+
+class BatchRetryError(Exception):
+    """Some items of a batch still failed after the last retry
+
+    Attributes:
+        results: results of all items, in their original order, where the
+            results of failed items are their exceptions
+        failed: indices of the failed items
+    """
+    def __init__(self, results: List[Any], failed: List[int]):
+        super().__init__(
+            f"{len(failed)} of {len(results)} items failed after retrying"
+        )
+        self.results = results
+        self.failed = failed
+
+
+def retry_batch(
+    fn: Optional[Callable] = None,
+    *,
+    schedule: Optional[Iterable[float]] = None,
+    catch: Union[Type[Exception], List[Type[Exception]]] = Exception,
+    log_exceptions: bool = True,
+    budget: Optional[RetryBudget] = None,
+    raise_on_failure: bool = True,
+):
+    """Retry the failed items of a bulk operation after sleeping
+
+    The first argument of the decorated function is a sequence of items,
+    and it returns a sequence of results of the same length and order, in
+    which failed items have an exception instead of a result, like
+    :code:`asyncio.gather(..., return_exceptions=True)`. Items whose
+    exception is in `catch` are resubmitted together after each delay of
+    `schedule`, with the same other arguments, and the results are merged
+    back in the original order of the items. If the function raises an
+    exception in `catch`, then all the items it was called with are
+    retried.
+
+    Coroutine functions are also supported, in which case the delay between
+    attempts uses :code:`asyncio.sleep`.
+
+    Args:
+        fn: callable being decorated
+        schedule: sequence of delay times to sleep in between attempts, or a
+            backoff policy, see :code:`retry`. Default is [1, 2, 4, ..., 64].
+        catch: Exception class or list of Exception classes of the items
+            (or calls) that are retried
+        log_exceptions: If True, then the first exception of each failed
+            attempt is logged, with the number of failed items.
+        budget: if not None, then a retry happens only if the budget has a
+            token left, see :code:`retry`. Each retry of a batch spends a
+            single token.
+        raise_on_failure: if True, then :code:`BatchRetryError` is raised
+            if items still fail after the last retry. Otherwise, the merged
+            results are returned with the exceptions of those items.
+
+    Examples:
+        >>> @retry_batch(schedule=[1, 5, 30], catch=ThrottledError)
+        >>> def write(records, table):
+        >>>     response = client.batch_write(table, records)
+        >>>     return [
+        >>>         ThrottledError(item.error) if item.error else item.id
+        >>>         for item in response.items
+        >>>     ]
+        >>>
+        >>> ids = write(records, "events")
+        # INFO:__main__:12 of 10000 items failed, sleeping for 1 seconds and
+        # then retrying them...
+    """
+    # Allows @retry_batch or @retry_batch(...)
+    if fn is None:
+        return functools.partial(
+            retry_batch,
+            schedule=schedule,
+            catch=catch,
+            log_exceptions=log_exceptions,
+            budget=budget,
+            raise_on_failure=raise_on_failure,
+        )
+
+    if not callable(fn):
+        raise ValueError(f"{fn} is not callable")
+    if inspect.isasyncgenfunction(fn):
+        raise ValueError(f"{fn} is an async generator, which is not supported")
+
+    if isinstance(catch, type) and issubclass(catch, BaseException):
+        catch = (catch,)
+    else:
+        catch = tuple(catch)
+
+    if schedule is None:
+        schedule = [2**p for p in range(7)]
+
+    registration = register("retry_batch", fn, {
+        "schedule": schedule,
+        "catch": catch,
+        "budget": budget,
+    })
+
+    def merge(
+        pending: List[int],
+        results: Sequence[Any],
+        merged: List[Any],
+    ) -> List[int]:
+        """Merge the results of the pending items, and return the indices
+        of the items to retry"""
+        if len(results) != len(pending):
+            raise ValueError(
+                f"{registration.name} returned {len(results)} results for "
+                f"{len(pending)} items"
+            )
+        failed = []
+        for index, result in zip(pending, results):
+            merged[index] = result
+            if isinstance(result, catch):
+                failed.append(index)
+        return failed
+
+    def fail(pending: List[int], e: Exception, merged: List[Any]):
+        for index in pending:
+            merged[index] = e
+
+    def on_failure(
+        failed: List[int],
+        merged: List[Any],
+        delays: Iterator[float],
+    ) -> Optional[float]:
+        """Return the delay before retrying the failed items, or None to
+        give up"""
+        delay = next(delays, None)
+        if delay is None:
+            return None
+        if budget is not None and not budget.try_spend():
+            LOG.info("Retry budget exhausted, not retrying.")
+            return None
+        if log_exceptions:
+            LOG.error(
+                f"{len(failed)} of {len(merged)} items failed",
+                exc_info=merged[failed[0]],
+            )
+        LOG.info(
+            f"{len(failed)} of {len(merged)} items failed, sleeping for "
+            f"{delay:.3g} seconds and then retrying them..."
+        )
+        registration.retries += 1
+        return delay
+
+    def give_up(failed: List[int], merged: List[Any]) -> List[Any]:
+        if raise_on_failure:
+            registration.errors += 1
+            raise BatchRetryError(merged, failed)
+        return merged
+
+    if inspect.iscoroutinefunction(fn):
+        import asyncio
+
+        @functools.wraps(fn)
+        async def wrapped(items, *args, **kwargs):
+            if not registration.enabled:
+                return await fn(items, *args, **kwargs)
+            registration.calls += 1
+            if budget is not None:
+                budget.record_call()
+            items = list(items)
+            merged: List[Any] = [None] * len(items)
+            pending = list(range(len(items)))
+            delays = iter(schedule)
+            while True:
+                try:
+                    results = await fn(
+                        [items[index] for index in pending], *args, **kwargs
+                    )
+                except catch as e:
+                    fail(pending, e, merged)
+                    failed = pending
+                except Exception:
+                    registration.errors += 1
+                    raise
+                else:
+                    failed = merge(pending, results, merged)
+                if not failed:
+                    return merged
+                delay = on_failure(failed, merged, delays)
+                if delay is None:
+                    return give_up(failed, merged)
+                pending = failed
+                await asyncio.sleep(delay)
+
+    else:
+        @functools.wraps(fn)
+        def wrapped(items, *args, **kwargs):
+            if not registration.enabled:
+                return fn(items, *args, **kwargs)
+            registration.calls += 1
+            if budget is not None:
+                budget.record_call()
+            items = list(items)
+            merged: List[Any] = [None] * len(items)
+            pending = list(range(len(items)))
+            delays = iter(schedule)
+            while True:
+                try:
+                    results = fn(
+                        [items[index] for index in pending], *args, **kwargs
+                    )
+                except catch as e:
+                    fail(pending, e, merged)
+                    failed = pending
+                except Exception:
+                    registration.errors += 1
+                    raise
+                else:
+                    failed = merge(pending, results, merged)
+                if not failed:
+                    return merged
+                delay = on_failure(failed, merged, delays)
+                if delay is None:
+                    return give_up(failed, merged)
+                pending = failed
                 time.sleep(delay)
-        # Last chance: no try except safety net!
-        return fn(*args, **kwargs)
 
+    wrapped.registration = registration
     return wrapped
 
 
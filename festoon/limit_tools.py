@@ -0,0 +1,355 @@
+"""Limits on the number of concurrent calls of functions"""
+import collections
+import functools
+import inspect
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, TYPE_CHECKING
+
+from . import queue_tools
+from .logging_tools import _fn_name
+from .registry_tools import register
+
+if TYPE_CHECKING:
+    import asyncio
+
+
+class BulkheadFullError(Exception):
+    """Raised instead of calling a function when its bulkhead has no slot
+    available in time"""
+    def __init__(self, bulkhead: "Bulkhead", reason: str):
+        name = f" {bulkhead.name}" if bulkhead.name else ""
+        super().__init__(f"Bulkhead{name} is full, {reason}")
+        self.bulkhead = bulkhead
+
+
+class _Waiter:
+    """A call waiting for a slot, in a thread or in an asyncio task"""
+    __slots__ = ("granted", "event", "future")
+
+    def __init__(
+        self,
+        event: Optional[threading.Event] = None,
+        future: Optional["asyncio.Future"] = None,
+    ):
+        self.granted = False
+        self.event = event
+        self.future = future
+
+    def wake(self):
+        if self.event is not None:
+            self.event.set()
+        else:
+            self.future.get_loop().call_soon_threadsafe(_set_granted, self)
+
+
+def _set_granted(waiter: _Waiter):
+    if not waiter.future.done():
+        waiter.future.set_result(None)
+
+
+class Bulkhead:
+    """Slots for at most `max_concurrent` concurrent calls
+
+    Calls from threads and from asyncio tasks, of any number of event
+    loops, share the same slots. Calls take a slot if one is free, and
+    otherwise wait in line, first come first served. Waiting calls block
+    their thread, or only their task for coroutine functions.
+
+    Args:
+        max_concurrent: maximum number of calls in flight
+        max_waiting: maximum number of waiting calls, or None for no limit.
+            Calls arriving while the line is full are rejected with
+            :code:`BulkheadFullError`, so 0 rejects calls immediately when
+            all slots are taken.
+        timeout: seconds after which a waiting call is rejected with
+            :code:`BulkheadFullError`, or None to wait as long as necessary
+        name: name used in errors and messages
+
+    Examples:
+        Functions calling the same dependency can share a bulkhead, so
+        that a slow dependency can only hold some of the worker threads:
+
+        >>> search_bulkhead = Bulkhead(8, max_waiting=16, timeout=1)
+        >>> @limitit(bulkhead=search_bulkhead)
+        >>> def search(query):
+        >>>     ...
+        >>> @limitit(bulkhead=search_bulkhead)
+        >>> def suggest(prefix):
+        >>>     ...
+    """
+    def __init__(
+        self,
+        max_concurrent: int = 10,
+        max_waiting: Optional[int] = None,
+        timeout: Optional[float] = None,
+        name: Optional[str] = None,
+    ):
+        if max_concurrent < 1:
+            raise ValueError(
+                f"max_concurrent must be at least 1, got {max_concurrent}"
+            )
+        self.max_concurrent = max_concurrent
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self.name = name
+        self._lock = threading.Lock()
+        self._waiters: collections.deque = collections.deque()
+        #: Number of calls holding a slot
+        self.in_flight = 0
+        #: Number of calls admitted
+        self.admitted = 0
+        #: Number of calls rejected because the line was full
+        self.rejected = 0
+        #: Number of calls rejected after waiting for `timeout`
+        self.timeouts = 0
+
+    @property
+    def waiting(self) -> int:
+        """Number of calls waiting for a slot"""
+        return len(self._waiters)
+
+    def _try_acquire(self, waiter_factory: Callable[[], _Waiter]):
+        """Take a free slot and return None, or return a new waiter in
+        line. Must be called with the lock held."""
+        if self.in_flight < self.max_concurrent and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return None
+        if (
+            self.max_waiting is not None and
+            len(self._waiters) >= self.max_waiting
+        ):
+            self.rejected += 1
+            raise BulkheadFullError(
+                self, f"{len(self._waiters)} calls already waiting"
+            )
+        waiter = waiter_factory()
+        self._waiters.append(waiter)
+        return waiter
+
+    def _give_up(self, waiter: _Waiter) -> bool:
+        """Leave the line, and return whether a slot had been granted in
+        the meantime. Must be called with the lock held."""
+        if waiter.granted:
+            return True
+        self._waiters.remove(waiter)
+        return False
+
+    def acquire(self) -> float:
+        """Take a slot, waiting if necessary, and return the number of
+        seconds waited"""
+        with self._lock:
+            waiter = self._try_acquire(
+                lambda: _Waiter(event=threading.Event())
+            )
+        if waiter is None:
+            return 0.0
+        start = time.perf_counter()
+        try:
+            granted = waiter.event.wait(self.timeout)
+        except BaseException:
+            # Interrupted while waiting, pass on a slot granted meanwhile
+            with self._lock:
+                granted = self._give_up(waiter)
+            if granted:
+                self.release()
+            raise
+        if not granted:
+            with self._lock:
+                if not self._give_up(waiter):
+                    self.timeouts += 1
+                    raise BulkheadFullError(
+                        self, f"no slot within {self.timeout:.3g} seconds"
+                    )
+        return time.perf_counter() - start
+
+    async def acquire_async(self) -> float:
+        """Take a slot, waiting without blocking the event loop if
+        necessary, and return the number of seconds waited"""
+        # Slow to import, but already imported by the running event loop
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            waiter = self._try_acquire(
+                lambda: _Waiter(future=loop.create_future())
+            )
+        if waiter is None:
+            return 0.0
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter.future, self.timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                if not self._give_up(waiter):
+                    self.timeouts += 1
+                    raise BulkheadFullError(
+                        self, f"no slot within {self.timeout:.3g} seconds"
+                    ) from None
+        except BaseException:
+            # Cancelled while waiting, pass on a slot granted meanwhile
+            with self._lock:
+                granted = self._give_up(waiter)
+            if granted:
+                self.release()
+            raise
+        return time.perf_counter() - start
+
+    def release(self):
+        """Give back a slot, to the first waiting call if any"""
+        with self._lock:
+            if self._waiters:
+                waiter = self._waiters.popleft()
+                waiter.granted = True
+                self.admitted += 1
+                waiter.wake()
+            else:
+                self.in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """State and counters of the bulkhead, for monitoring"""
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+        }
+
+
+def limitit(
+    fn: Optional[Callable] = None,
+    *,
+    max_concurrent: int = 10,
+    max_waiting: Optional[int] = None,
+    timeout: Optional[float] = None,
+    bulkhead: Optional[Bulkhead] = None,
+    name: Optional[str] = None,
+    level: int = logging.DEBUG,
+):
+    """Limit the number of concurrent calls of this function
+
+    Calls hold a slot of a :code:`Bulkhead` while they run, and wait for
+    one, or are rejected with :code:`BulkheadFullError`, while all slots are
+    taken. Coroutine functions are supported, in which case calls wait
+    without blocking the event loop. Async generator functions are not
+    supported.
+
+    Each call logs the numbers of calls in flight and waiting once it has
+    a slot, and how long it waited, like :code:`timeit` logs durations.
+    Rejected calls are logged at WARNING level.
+
+    Decorate with :code:`retry` outside of :code:`limitit`, so that each
+    attempt takes a slot and gives it back before sleeping, rather than
+    holding it for all attempts. To retry rejected calls too, include
+    :code:`BulkheadFullError` in the exceptions it catches.
+
+    Args:
+        fn: function to be decorated
+        max_concurrent: maximum number of calls in flight
+        max_waiting: maximum number of waiting calls, or None for no limit,
+            see :code:`Bulkhead`
+        timeout: seconds after which a waiting call is rejected, or None
+        bulkhead: bulkhead shared with other functions. If not None, then
+            max_concurrent, max_waiting and timeout are those of the
+            bulkhead.
+        name: name of logger to use. If None, then fn.__module__ will be used.
+        level: logging level of the messages of admitted calls. Default is
+            logging.DEBUG.
+
+    Examples:
+        >>> @retry(schedule=[0.1, 0.5], catch=[BulkheadFullError, IOError])
+        >>> @limitit(max_concurrent=4, max_waiting=8, timeout=2)
+        >>> def fetch(url):
+        >>>     ...
+        >>> fetch("https://example.com")
+        # DEBUG:__main__:LIMIT fetch 4/4 in flight, 3 waiting, waited 0.21s
+    """
+    if fn is None:
+        return functools.partial(
+            limitit,
+            max_concurrent=max_concurrent,
+            max_waiting=max_waiting,
+            timeout=timeout,
+            bulkhead=bulkhead,
+            name=name,
+            level=level,
+        )
+
+    if not callable(fn):
+        raise ValueError(f"{fn} is not callable")
+    if inspect.isasyncgenfunction(fn):
+        raise ValueError(f"{fn} is an async generator, which is not supported")
+
+    if bulkhead is None:
+        bulkhead = Bulkhead(max_concurrent, max_waiting, timeout)
+    logger = logging.getLogger(name or fn.__module__)
+    fn_name = _fn_name(fn)
+    registration = register("limitit", fn, {
+        "max_concurrent": bulkhead.max_concurrent,
+        "max_waiting": bulkhead.max_waiting,
+        "timeout": bulkhead.timeout,
+        "bulkhead": bulkhead.name,
+    })
+
+    def admitted(waited: float):
+        if logger.isEnabledFor(level):
+            queue_tools.log(
+                logger, level,
+                f"LIMIT {fn_name} {bulkhead.in_flight}/"
+                f"{bulkhead.max_concurrent} in flight, {bulkhead.waiting} "
+                f"waiting, waited {waited:.2f}s",
+            )
+
+    def rejected(e: BulkheadFullError):
+        registration.errors += 1
+        if logger.isEnabledFor(logging.WARNING):
+            queue_tools.log(
+                logger, logging.WARNING, f"LIMIT {fn_name} rejected: {e}"
+            )
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def wrapped(*args, **kwargs):
+            if not registration.enabled:
+                return await fn(*args, **kwargs)
+            registration.calls += 1
+            try:
+                waited = await bulkhead.acquire_async()
+            except BulkheadFullError as e:
+                rejected(e)
+                raise
+            try:
+                admitted(waited)
+                return await fn(*args, **kwargs)
+            except Exception:
+                registration.errors += 1
+                raise
+            finally:
+                bulkhead.release()
+
+    else:
+        @functools.wraps(fn)
+        def wrapped(*args, **kwargs):
+            if not registration.enabled:
+                return fn(*args, **kwargs)
+            registration.calls += 1
+            try:
+                waited = bulkhead.acquire()
+            except BulkheadFullError as e:
+                rejected(e)
+                raise
+            try:
+                admitted(waited)
+                return fn(*args, **kwargs)
+            except Exception:
+                registration.errors += 1
+                raise
+            finally:
+                bulkhead.release()
+
+    wrapped.bulkhead = bulkhead
+    wrapped.registration = registration
+    return wrapped
@@ -1,15 +1,34 @@
+import atexit
 import inspect
 import itertools
+import json
 import logging
 import functools
+import math
+import string
+import threading
 import time
 import traceback
-from typing import Any, Callable, NamedTuple, Optional, Union
+import weakref
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
+from . import queue_tools
+from ._wrapping import _always, wrap
+from .metrics_tools import as_registry, FunctionMetrics, instrument
+from .metrics_tools import METRICS_TYPE
+from .registry_tools import register
+from .repr_tools import bounded_repr
+from .sampling_tools import as_sampler, SAMPLE_TYPE
+from .stats_tools import (
+    format_summary, Histogram, LatencySummary, ShardedHistogram,
+)
+from .trace_tools import current_span, traceit
 
-class _KwargItem(NamedTuple):
-    name: str
-    value: Any
+
+#: Type signature of :code:`fmtvalue` option of :code:`logit` decorator. The
+#: value formatter returns the string used for a single argument or return
+#: value in the default CALL and DONE messages.
+FMTVALUE_TYPE = Callable[[Any], str]
 
 
 def _fn_name(fn: Callable) -> str:
@@ -19,57 +38,297 @@ def _fn_name(fn: Callable) -> str:
         return fn.__name__
 
 
-def format_call(fn: Callable, args: tuple, kwargs: dict) -> str:
-    params = inspect.signature(fn).parameters
-    sentinel = object()
-    kwarg_items = [_KwargItem(k, v) for k, v in kwargs.items()]
-    result = []
+class StructuredMessage:
+    """Log message carrying structured fields
+
+    Formatters passed to :code:`logit` may return a structured message
+    instead of a string. In structured mode, its fields are attached to the
+    log record as :code:`extra` attributes. Fields named like attributes of
+    every log record, such as "name" or "message", are attached with a
+    "field_" prefix, e.g., "field_name", since logging forbids overwriting
+    them.
+
+    Args:
+        text: the text of the message
+        fields: mapping of field name to JSON-serializable value
+    """
+    __slots__ = ("text", "fields")
+
+    def __init__(self, text: str, fields: Dict[str, Any]):
+        self.text = text
+        self.fields = fields
+
+    def __str__(self) -> str:
+        return self.text
 
-    named_positionals = [
-        ...
-    ]
+    def __repr__(self) -> str:
+        return f"StructuredMessage({self.text!r}, {self.fields!r})"
 
-    for i, arg in enumerate(args):
-        pass
 
+#: Attributes of every log record, which are not extra fields
+_RECORD_ATTRS = frozenset(
+    logging.LogRecord("", 0, "", 0, "", (), None).__dict__
+) | {"message", "asctime"}
 
-    param_items = []
-    for (name, param) in params.items():
-        param: inspect.Parameter
-        if param.kind is param.VAR_POSITIONAL:
-            param_items.extend([(None, ...)])
-        elif param.kind is None: ## TODO FIX
-            pass
 
-    for (name, param), input_item in itertools.zip_longest(
-        params.items(),
-        [*args, *kwarg_items],
-        fillvalue=sentinel,
+def _extra_fields(fields: Dict[str, Any]) -> Dict[str, Any]:
+    """Return `fields` as extra attributes of a log record, renaming those
+    that would overwrite its attributes, which makes logging raise"""
+    return {
+        f"field_{key}" if key in _RECORD_ATTRS else key: value
+        for key, value in fields.items()
+    }
+
+
+class JsonFormatter(logging.Formatter):
+    """Format log records as single-line JSON objects
+
+    Each object has the "time", "level", "logger" and "message" of the
+    record, followed by its extra attributes, such as the fields of
+    :code:`logit(structured=True)`, and "exc_info" if an exception is
+    attached. Values that are not JSON-serializable are converted with
+    :code:`str`.
+
+    Examples:
+        >>> handler = logging.StreamHandler()
+        >>> handler.setFormatter(JsonFormatter())
+        >>> logging.getLogger().addHandler(handler)
+    """
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                data[key] = value
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(data, separators=(",", ":"), default=str)
+
+
+class _CallFormatter:
+    """Call formatter with the signature of a function bound once
+
+    Instances are themselves valid :code:`fmtcall` formatters (see
+    :data:`FMTCALL_TYPE`), which avoids inspecting the signature of the
+    decorated function on each call. If `structured`, then they return a
+    :code:`StructuredMessage` with the formatted arguments, by name, in the
+    "arguments" field. Messages start with `prefix`.
+    """
+    def __init__(
+        self,
+        fn: Callable,
+        fmtvalue: Optional[FMTVALUE_TYPE] = None,
+        structured: bool = False,
+        prefix: str = "CALL",
     ):
-        if input_item is sentinel:
-            value = param.default
-        elif name == "self":  # HACK
-            continue
-        elif isinstance(input_item, _KwargItem):
-            value = input_item.value
-        else:
-            value = input_item
+        self.name = _fn_name(fn)
+        self.prefix = prefix
+        self.fmtvalue = fmtvalue
+        self.structured = structured
+        #: Names of parameters that may be given positionally, in order
+        self.positional: List[str] = []
+        #: Names of all named parameters, in order
+        self.named: List[str] = []
+        self.defaults: Dict[str, Any] = {}
+        self.skip_self = False
+        #: Name of the *args parameter, if any
+        self.var_positional = "args"
 
-        if name is None:
-            result.append(f"{value}")
-        else:
-            result.append(f"{name}={value}")
+        try:
+            params = inspect.signature(fn).parameters.values()
+        except (TypeError, ValueError):
+            # No signature available (some builtins): all positional args are
+            # formatted without names.
+            return
+
+        for param in params:
+            if param.kind is param.VAR_POSITIONAL:
+                self.var_positional = param.name
+            if param.kind in (param.VAR_POSITIONAL, param.VAR_KEYWORD):
+                continue
+            if param.kind is not param.KEYWORD_ONLY:
+                self.positional.append(param.name)
+            self.named.append(param.name)
+            if param.default is not param.empty:
+                self.defaults[param.name] = param.default
+
+        self.skip_self = self.positional[:1] == ["self"]
+
+    def bind(
+        self, args: tuple, kwargs: dict
+    ) -> List[Tuple[Optional[str], str]]:
+        """Return formatted (name, value) pairs of a call, in signature order.
+        The name is None for values of *args."""
+        fmtvalue = self.fmtvalue or bounded_repr
+        result = []
+        positional = self.positional
+        npositional = len(positional)
+
+        for i, arg in enumerate(args):
+            if i >= npositional:
+                result.append((None, fmtvalue(arg)))
+            elif i or not self.skip_self:
+                result.append((positional[i], fmtvalue(arg)))
+
+        defaults = self.defaults
+        consumed = 0
+        for name in self.named[min(len(args), npositional):]:
+            if name in kwargs:
+                value = kwargs[name]
+                consumed += 1
+            elif name in defaults:
+                value = defaults[name]
+            else:
+                continue
+            result.append((name, fmtvalue(value)))
+
+        if consumed < len(kwargs):
+            named = self.named
+            for name, value in kwargs.items():
+                if name not in named:
+                    result.append((name, fmtvalue(value)))
+
+        return result
+
+    def __call__(
+        self, fn: Callable, args: tuple, kwargs: dict
+    ) -> Union[str, StructuredMessage]:
+        items = self.bind(args, kwargs)
+        paramstr = ", ".join(
+            value if name is None else f"{name}={value}"
+            for name, value in items
+        )
+        text = f"{self.prefix} {self.name}({paramstr})"
+        if not self.structured:
+            return text
+
+        arguments: Dict[str, Any] = {}
+        for name, value in items:
+            if name is None:
+                arguments.setdefault(self.var_positional, []).append(value)
+            else:
+                arguments[name] = value
+        return StructuredMessage(text, {"arguments": arguments})
+
+
+class _LazyMessage:
+    """Log message that is only formatted if a handler needs its text
+
+    Logging calls :code:`str` on the message of a record when it is formatted
+    by a handler, so no formatting work happens for records that are never
+    emitted.
+    """
+    __slots__ = ("_format", "_args", "_text")
 
-    paramstr = ", ".join(result)
-    return f"CALL {_fn_name(fn)}({paramstr})"
+    def __init__(self, format: Callable[..., str], *args: Any):
+        self._format = format
+        self._args = args
+        self._text: Optional[str] = None
+
+    def __str__(self) -> str:
+        if self._text is None:
+            self._text = str(self._format(*self._args))
+        return self._text
+
+
+def format_call(
+    fn: Callable,
+    args: tuple,
+    kwargs: dict,
+    fmtvalue: Optional[FMTVALUE_TYPE] = None,
+) -> str:
+    return _CallFormatter(fn, fmtvalue)(fn, args, kwargs)
+
+
+def format_call_structured(
+    fn: Callable,
+    args: tuple,
+    kwargs: dict,
+    fmtvalue: Optional[FMTVALUE_TYPE] = None,
+) -> StructuredMessage:
+    return _CallFormatter(fn, fmtvalue, structured=True)(fn, args, kwargs)
 
 
 def format_excp(fn: Callable, excp: Exception) -> str:
-    return f"EXCP {_fn_name(fn)}\n{traceback.format_exc()}"
+    tb = "".join(
+        traceback.format_exception(type(excp), excp, excp.__traceback__)
+    )
+    return f"EXCP {_fn_name(fn)}\n{tb}"
+
+
+def format_done(
+    fn: Callable,
+    output: Any,
+    fmtvalue: Optional[FMTVALUE_TYPE] = None,
+) -> str:
+    return f"DONE {_fn_name(fn)}->{(fmtvalue or bounded_repr)(output)}"
 
 
-def format_done(fn: Callable, output: Any) -> str:
-    return f"DONE {_fn_name(fn)}->{output}"
+def format_excp_structured(
+    fn: Callable, excp: Exception
+) -> StructuredMessage:
+    return StructuredMessage(
+        format_excp(fn, excp),
+        {
+            "exception": type(excp).__qualname__,
+            "exception_message": str(excp),
+        },
+    )
+
+
+def format_done_structured(
+    fn: Callable,
+    output: Any,
+    fmtvalue: Optional[FMTVALUE_TYPE] = None,
+) -> StructuredMessage:
+    result = (fmtvalue or bounded_repr)(output)
+    return StructuredMessage(
+        f"DONE {_fn_name(fn)}->{result}", {"result": result}
+    )
+
+
+class _TimeFormatter:
+    """Time formatter with its format string parsed once
+
+    The format string may only use the fields "seconds", "ms", "us" and
+    "name", with any format spec and conversion. Unknown fields, attribute
+    or item access and nested fields are rejected when the formatter is
+    created, so formatting on each call is a plain :code:`str.format`.
+    Instances are themselves valid :code:`fmttime` formatters (see
+    :data:`FMTTIME_TYPE`).
+    """
+    FIELDS = ("seconds", "ms", "us", "name")
+
+    def __init__(self, fmtstr: str):
+        for _, field, spec, _ in string.Formatter().parse(fmtstr):
+            if field is None:
+                continue
+            if field not in self.FIELDS:
+                raise ValueError(
+                    f"Unsupported field {{{field}}} in {fmtstr!r}, "
+                    f"expected any of {', '.join(self.FIELDS)}"
+                )
+            if spec and "{" in spec:
+                raise ValueError(f"Nested fields are not supported: {spec}")
+        self.fmtstr = fmtstr
+        self._template = "TIME {name} " + fmtstr
+
+    def __call__(self, fn: Callable, seconds: float) -> str:
+        return self._template.format(
+            name=_fn_name(fn),
+            seconds=seconds,
+            ms=seconds * 1e3,
+            us=seconds * 1e6,
+        )
+
+
+@functools.lru_cache(maxsize=64)
+def _time_formatter(fmtstr: str) -> _TimeFormatter:
+    return _TimeFormatter(fmtstr)
 
 
 def format_time(
@@ -77,9 +336,11 @@ def format_time(
     seconds: float,
     fmtstr: str = "{seconds:.2f}s"
 ) -> str:
-    result = "TIME {_fn_name(fn)} "
-    result += fmtstr
-    return eval("f'"+result+"'")  # eval bad, yea yea
+    return _time_formatter(fmtstr)(fn, seconds)
+
+
+def format_stats(fn: Callable, summary: LatencySummary) -> str:
+    return f"STATS {_fn_name(fn)} {format_summary(summary)}"
 
 
 #: Type signature of :code:`fmtcall` option of :code:`logit` decorator. The
@@ -96,6 +357,10 @@ FMTDONE_TYPE = Callable[[Callable, Any], str]
 
 #: Type signature of :code:`fmttime` option :code:`timeit` decorator.
 FMTTIME_TYPE = Callable[[Callable, float], str]
+#: Type signature of :code:`fmtstats` option of :code:`timeit` decorator. The
+#: formatter takes the decorated function and the latency statistics
+#: aggregated so far and returns the message of a periodic summary.
+FMTSTATS_TYPE = Callable[[Callable, LatencySummary], str]
 
 
 def logit(
@@ -106,9 +371,24 @@ def logit(
     fmtcall: Optional[FMTCALL_TYPE] = format_call,
     fmtexcp: Optional[FMTEXCP_TYPE] = format_excp,
     fmtdone: Optional[FMTDONE_TYPE] = format_done,
+    fmtvalue: Optional[FMTVALUE_TYPE] = None,
+    sample: Optional[SAMPLE_TYPE] = None,
+    structured: bool = False,
+    trace: bool = False,
+    metrics: METRICS_TYPE = False,
 ):
     """Log a function on call, exception, and return
 
+    Coroutine functions and async generator functions are supported: the
+    decorated function is then awaitable (or async iterable) as well. For
+    async generators, the DONE message is logged with a :code:`None` result
+    once the generator is exhausted.
+
+    Nothing is formatted if the logger is not enabled for `level`. Otherwise,
+    CALL and DONE messages are only formatted once a logging handler needs
+    their text. The signature of `fn` is inspected once, at decoration time,
+    when the default :code:`format_call` is used.
+
     Args:
         fn: function to be decorated
         name: name of logger to use. If None, then fn.__module__ will be used.
@@ -119,6 +399,34 @@ def logit(
             invoking `fn`. If None, then no logging called is made.
         fmtdone: a callable that formats the data returned by invoking `fn`.
             If None, then no logging call is made on the returned data.
+        fmtvalue: a callable that formats each argument and the return value
+            in the messages of the default `fmtcall` and `fmtdone`. If None,
+            then :code:`festoon.repr_tools.bounded_repr` is used, whose
+            size limits can be changed globally with
+            :code:`festoon.repr_tools.set_default_repr`.
+        sample: sampling policy deciding which calls are logged, see
+            :code:`festoon.sampling_tools.Sampler`. A float is a shorthand
+            for the probability of logging each call. If None, then every
+            call is logged. Calls that are not sampled are not formatted
+            at all, unless they turn out to be outliers, in which case their
+            CALL message is logged after the fact, just before DONE or EXCP.
+        structured: if True, then log records carry structured fields as
+            :code:`extra` attributes: "function" (module-qualified name),
+            "outcome" ("call", "done" or "error"), "duration" (seconds, on
+            done and error), as well as any field of a
+            :code:`StructuredMessage` returned by the formatters. The
+            default formatters are replaced by their structured variants,
+            adding "arguments" (formatted values by parameter name) on call,
+            "result" on done, and "exception" and "exception_message" on
+            error. Messages are then formatted as soon as the logger is
+            enabled for `level`. See also :code:`JsonFormatter`.
+        trace: if True, then each call is also recorded as a span, see
+            :code:`festoon.trace_tools.traceit`. Messages are logged within
+            the span, and in structured mode carry its "trace_id" and
+            "span_id".
+        metrics: if True, or a :code:`festoon.metrics_tools.MetricsRegistry`,
+            then calls, errors by exception type and latencies are recorded
+            into the default or given registry, whatever the logging level.
 
     Examples:
         The default settings add a logging statement when the function
@@ -156,6 +464,50 @@ def logit(
         >>> Foo().func(1)
         # INFO.__main__: CALL Foo.func(x=1, y=2)
         # INFO.__main__: DONE Foo.func->3
+
+        Arguments and return values are logged with a size-bounded repr, so
+        that large inputs never produce huge log messages. The bounds can be
+        set per decorator:
+
+        >>> @logit(fmtvalue=BoundedRepr(maxitems=2).repr)
+        >>> def func(data):
+        >>>     return len(data)
+        >>> func(numpy.zeros((1000, 1000)))
+        # INFO.__main__: CALL func(data=ndarray(shape=(1000, 1000), dtype=...
+        >>> func(list(range(1000)))
+        # INFO.__main__: CALL func(data=[0, 1, ...] (len=1000))
+
+        On hot paths, a sampling policy logs only some calls. Here, 1% of
+        calls are logged, as well as all calls raising an exception:
+
+        >>> @logit(sample=ProbabilitySampler(0.01, exceptions=True))
+        >>> def func(x):
+        >>>     return 1 / x
+
+        Structured mode attaches fields to log records, so that log pipelines
+        need not parse messages. Combined with :code:`JsonFormatter`:
+
+        >>> handler = logging.StreamHandler()
+        >>> handler.setFormatter(JsonFormatter())
+        >>> logging.basicConfig(level=logging.INFO, handlers=[handler])
+        >>> @logit(structured=True)
+        >>> def func(x, y=2):
+        >>>     return x+y
+        >>> func(1)
+        # {"time":1634567890.1,"level":"INFO","logger":"__main__",
+        #  "message":"CALL func(x=1, y=2)","function":"__main__.func",
+        #  "outcome":"call","arguments":{"x":"1","y":"2"}}
+        # {"time":1634567890.1,"level":"INFO","logger":"__main__",
+        #  "message":"DONE func->3","function":"__main__.func",
+        #  "outcome":"done","duration":1.2e-06,"result":"3"}
+
+        Tracing records which decorated calls happened within which other
+        ones, see :code:`festoon.trace_tools`:
+
+        >>> set_tracer(Tracer(ChromeTraceSink("trace.json")))
+        >>> @logit(trace=True)
+        >>> def func(x):
+        >>>     return x
     """
 
     # Allows @logit or @logit(...)
@@ -167,33 +519,232 @@ def logit(
             fmtcall=fmtcall,
             fmtexcp=fmtexcp,
             fmtdone=fmtdone,
+            fmtvalue=fmtvalue,
+            sample=sample,
+            structured=structured,
+            trace=trace,
+            metrics=metrics,
         )
 
     if not callable(fn):
         raise ValueError(f"{fn} is not callable")
 
     name = name or fn.__module__
+    logger = logging.getLogger(name)
+
+    if structured:
+        if fmtcall is format_call:
+            fmtcall = format_call_structured
+        if fmtexcp is format_excp:
+            fmtexcp = format_excp_structured
+        if fmtdone is format_done:
+            fmtdone = format_done_structured
+    if fmtcall in (format_call, format_call_structured):
+        fmtcall = _CallFormatter(fn, fmtvalue, structured)
+    if fmtdone in (format_done, format_done_structured) and fmtvalue:
+        fmtdone = functools.partial(fmtdone, fmtvalue=fmtvalue)
+
+    sampler = as_sampler(sample)
+    qualified_name = f"{fn.__module__}.{_fn_name(fn)}"
+
+    def emit(
+        outcome: str,
+        format: Callable,
+        fmtargs: tuple,
+        duration: Optional[float] = None,
+        lazy: bool = True,
+    ):
+        if not structured:
+            if lazy:
+                msg = _LazyMessage(format, fn, *fmtargs)
+            else:
+                msg = format(fn, *fmtargs)
+            queue_tools.log(logger, level, msg)
+            return
+        msg = format(fn, *fmtargs)
+        extra = {"function": qualified_name, "outcome": outcome}
+        if duration is not None:
+            extra["duration"] = duration
+        span = current_span()
+        if span is not None:
+            extra["trace_id"] = f"{span.trace_id:016x}"
+            extra["span_id"] = f"{span.span_id:016x}"
+        if isinstance(msg, StructuredMessage):
+            extra.update(_extra_fields(msg.fields))
+        queue_tools.log(logger, level, msg, extra)
+
+    def on_call(args: tuple, kwargs: dict):
+        if fmtcall:
+            emit("call", fmtcall, (args, kwargs))
+
+    def on_excp(e: Exception, duration: float):
+        # Formatted right away, since user formatters may rely on the
+        # exception currently being handled (e.g. traceback.format_exc)
+        if fmtexcp:
+            emit("error", fmtexcp, (e,), duration, lazy=False)
+
+    def on_done(result: Any, duration: float):
+        if fmtdone:
+            emit("done", fmtdone, (result,), duration)
+
+    def before(args: tuple, kwargs: dict) -> Optional[tuple]:
+        sampled = sampler is None or sampler.sample()
+        if sampled:
+            on_call(args, kwargs)
+        elif not sampler.outliers:
+            return None
+        return (args, kwargs, sampled, time.perf_counter())
+
+    def after(state: tuple, result: Any):
+        args, kwargs, sampled, start = state
+        duration = time.perf_counter() - start
+        registration.add_time(duration)
+        if not sampled:
+            if not sampler.keep(duration, None):
+                return
+            on_call(args, kwargs)
+        on_done(result, duration)
+
+    def error(state: tuple, e: Exception):
+        args, kwargs, sampled, start = state
+        duration = time.perf_counter() - start
+        registration.add_time(duration)
+        if not sampled:
+            if not sampler.keep(duration, e):
+                return
+            on_call(args, kwargs)
+        on_excp(e, duration)
+
+    registration = register("logit", fn, {
+        "name": name,
+        "level": level,
+        "sample": sample,
+        "structured": structured,
+        "trace": trace,
+    })
+    wrapped = wrap(
+        fn, before, after, error, registration, logger.isEnabledFor, level
+    )
+    registry = as_registry(metrics)
+    if registry is not None:
+        function_metrics = FunctionMetrics(
+            registry, registration.name, "logit"
+        )
+        wrapped = instrument(wrapped, function_metrics, registration)
+    if trace:
+        wrapped = traceit(wrapped, name=qualified_name)
+    return wrapped
+
+
+class _TimeAggregate:
+    """Latency statistics of a function decorated with timeit(aggregate=True)
+    """
+    def __init__(
+        self,
+        fn: Callable,
+        logger: logging.Logger,
+        level: int,
+        fmtstats: FMTSTATS_TYPE,
+        flush_interval: Optional[float],
+        flush_calls: Optional[int],
+    ):
+        self.fn = fn
+        #: Module-qualified name of the function
+        self.name = f"{fn.__module__}.{_fn_name(fn)}"
+        self.logger = logger
+        self.level = level
+        self.fmtstats = fmtstats
+        self.flush_interval = flush_interval
+        self.flush_calls = flush_calls
+        self.histogram = ShardedHistogram()
+        self._calls = itertools.count(1)
+        self._lock = threading.Lock()
+        self._flushed_count = 0
+        self._next_flush = (
+            time.perf_counter() + flush_interval if flush_interval
+            else math.inf
+        )
 
-    @functools.wraps(fn)
-    def wrapped(*args, **kwargs):
-        logger = logging.getLogger(name)
-        result = no_result_flag = object()
+    def record(self, seconds: float, now: float):
+        self.histogram.record(seconds)
+        ncalls = next(self._calls)
+        if now >= self._next_flush or (
+            self.flush_calls and ncalls % self.flush_calls == 0
+        ):
+            self.flush(now)
+
+    def flush(self, now: Optional[float] = None):
+        """Log a summary of the statistics, unless another thread is"""
+        if not self._lock.acquire(blocking=False):
+            return
         try:
-            if fmtcall:
-                msg = fmtcall(fn, args, kwargs)
-                logger.log(level, msg)
-            result = fn(*args, **kwargs)
-        except Exception as e:
-            if fmtexcp:
-                logger.log(level, fmtexcp(fn, e))
-            raise e
+            if self.flush_interval:
+                now = time.perf_counter() if now is None else now
+                self._next_flush = now + self.flush_interval
+            summary = self.histogram.summary()
+            if summary.count == self._flushed_count:
+                return
+            self._flushed_count = summary.count
+            if self.logger.isEnabledFor(self.level):
+                queue_tools.log(
+                    self.logger,
+                    self.level,
+                    _LazyMessage(self.fmtstats, self.fn, summary),
+                )
         finally:
-            if fmtdone and result is not no_result_flag:
-                msg = fmtdone(fn, result)
-                logger.log(level, msg)
-        return result
+            self._lock.release()
 
-    return wrapped
+
+#: Aggregates of functions decorated with timeit(aggregate=True). They are
+#: kept alive by their wrappers only.
+_time_aggregates: "weakref.WeakSet[_TimeAggregate]" = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_time_aggregates():
+    for aggregate in list(_time_aggregates):
+        aggregate.flush()
+
+
+#: Thread flushing the aggregates that are not called, see _flush_idle
+_flusher: Optional[threading.Thread] = None
+_flusher_lock = threading.Lock()
+_flusher_wakeup = threading.Event()
+
+
+def _start_flusher():
+    """Start the flushing thread if needed, and have it take the flush
+    interval of a new aggregate into account"""
+    global _flusher
+    with _flusher_lock:
+        if _flusher is None or not _flusher.is_alive():
+            _flusher = threading.Thread(
+                target=_run_flusher, name="festoon-timeit", daemon=True
+            )
+            _flusher.start()
+    _flusher_wakeup.set()
+
+
+def _run_flusher():
+    while True:
+        _flusher_wakeup.clear()
+        timeout = _flush_idle() - time.perf_counter()
+        if timeout > 0:
+            _flusher_wakeup.wait(None if timeout == math.inf else timeout)
+
+
+def _flush_idle() -> float:
+    """Flush the aggregates whose interval elapsed without a call flushing
+    them, and return the time of the next flush. Aggregates are only
+    referenced during the call, so that they are released with their
+    wrappers."""
+    now = time.perf_counter()
+    next_flush = math.inf
+    for aggregate in list(_time_aggregates):
+        if now >= aggregate._next_flush:
+            aggregate.flush(now)
+        next_flush = min(next_flush, aggregate._next_flush)
+    return next_flush
 
 
 def timeit(
@@ -202,9 +753,22 @@ def timeit(
     name: Optional[str] = None,
     level: Optional[int] = logging.INFO,
     fmttime: Union[FMTTIME_TYPE, str] = format_time,
+    aggregate: bool = False,
+    flush_interval: Optional[float] = 60.0,
+    flush_calls: Optional[int] = None,
+    fmtstats: FMTSTATS_TYPE = format_stats,
+    sample: Optional[SAMPLE_TYPE] = None,
+    metrics: METRICS_TYPE = False,
 ):
     """Log time ellapsed by this function
 
+    Coroutine functions and async generator functions are supported, in which
+    case the awaited wall time is measured. For async generators, this is the
+    time from the first iteration until the generator is exhausted.
+
+    Unless `aggregate` is True, nothing is timed or formatted if the logger
+    is not enabled for `level`.
+
     Args:
         fn: function to be decorated
         name: name of logger to use. If None, then fn.__module__ will be used.
@@ -212,8 +776,32 @@ def timeit(
         fmttime: fmttime can either be a function or a format string. If it
             is a function, then it should accept (fn: Callable, seconds: float)
             and return a message string. If `fmttime` is a string, then it
-            should be a format string with argument "seconds". See examples
-            below
+            should be a format string with any of the fields "seconds", "ms",
+            "us" (the ellapsed time in each unit) and "name" (the name of
+            the function), optionally with format specs. It is parsed once,
+            and unknown fields raise a ValueError. See examples below
+        aggregate: if True, then no message is logged per call. Instead,
+            latency statistics are aggregated in-process and a summary is
+            logged every `flush_interval` seconds and/or every `flush_calls`
+            calls, as well as at interpreter exit. Periodic summaries are
+            logged by a background thread if no call logs them on time.
+            Statistics are also available from :code:`timeit.stats()`, or
+            from the :code:`stats()` attribute of the decorated function.
+        flush_interval: seconds between summaries in aggregate mode. If None,
+            then summaries are not logged periodically.
+        flush_calls: number of calls between summaries in aggregate mode. If
+            None, then summaries are not logged every N calls.
+        fmtstats: a callable that formats the summary logged in aggregate
+            mode, see :data:`FMTSTATS_TYPE`.
+        sample: sampling policy deciding which calls are timed and logged,
+            see :code:`festoon.sampling_tools.Sampler`. A float is a
+            shorthand for the probability of logging each call. Failed calls
+            are only logged if the policy keeps exceptions. Cannot be
+            combined with `aggregate`.
+        metrics: if True, or a :code:`festoon.metrics_tools.MetricsRegistry`,
+            then calls, errors by exception type and latencies are recorded
+            into the default or given registry, whatever the logging level
+            and sampling policy.
 
     Examples:
 
@@ -229,7 +817,7 @@ def timeit(
 
         A format string can be used to customize the log message:
 
-        >>> @timeit(fmttime="{seconds*1000:.0f} milliseconds")
+        >>> @timeit(fmttime="{ms:.0f} milliseconds")
         >>> def func():
         >>>     import time
         >>>     time.sleep(0.75)
@@ -245,6 +833,27 @@ def timeit(
         >>> func()
         # INFO:__main__:func took 0.7508368770004381 seconds!
 
+        Hot functions can aggregate their timings instead of logging a
+        message per call. The summary is also available programmatically:
+
+        >>> @timeit(aggregate=True, flush_interval=10)
+        >>> def func():
+        >>>     pass
+        >>> for _ in range(100_000):
+        >>>     func()
+        # INFO:__main__:STATS func count=100000 mean=0.001ms min=0.000ms ...
+        >>> func.stats().p99
+        1.2e-06
+        >>> timeit.stats()
+        {'__main__.func': LatencySummary(count=100000, ...)}
+
+        Alternatively, only some calls can be logged. Here, at most 10 calls
+        per second are logged, as well as any call slower than 500ms:
+
+        >>> @timeit(sample=RateLimitSampler(10, slow_ms=500))
+        >>> def func():
+        >>>     pass
+
     """
 
     # Allows @timeit or @timeit(...)
@@ -254,28 +863,112 @@ def timeit(
             name=name,
             level=level,
             fmttime=fmttime,
+            aggregate=aggregate,
+            flush_interval=flush_interval,
+            flush_calls=flush_calls,
+            fmtstats=fmtstats,
+            sample=sample,
+            metrics=metrics,
         )
 
     if not callable(fn):
         raise ValueError(f"{fn} is not callable")
 
     if isinstance(fmttime, str):
-        fmttime = functools.partial(format_time, fmtstr=fmttime)
+        fmttime = _TimeFormatter(fmttime)
+    elif fmttime is format_time:
+        fmttime = _time_formatter("{seconds:.2f}s")
 
     name = name or fn.__module__
+    logger = logging.getLogger(name)
+
+    sampler = as_sampler(sample)
+
+    if aggregate:
+        if sampler is not None:
+            raise ValueError("sample and aggregate cannot be combined")
+        time_aggregate = _TimeAggregate(
+            fn, logger, level, fmtstats, flush_interval, flush_calls
+        )
+        _time_aggregates.add(time_aggregate)
+        if flush_interval:
+            _start_flusher()
+
+        def before(args: tuple, kwargs: dict) -> Optional[tuple]:
+            return (True, time.perf_counter())
+
+        def on_time(seconds: float, now: float):
+            time_aggregate.record(seconds, now)
 
-    @functools.wraps(fn)
-    def wrapped(*args, **kwargs):
-        logger = logging.getLogger(name)
-        start = time.perf_counter()
-        result = fn(*args, **kwargs)
+        enabled = _always
+    else:
+        def before(args: tuple, kwargs: dict) -> Optional[tuple]:
+            sampled = sampler is None or sampler.sample()
+            if not sampled and not sampler.outliers:
+                return None
+            return (sampled, time.perf_counter())
+
+        def on_time(seconds: float, now: float):
+            queue_tools.log(logger, level, _LazyMessage(fmttime, fn, seconds))
+
+        enabled = logger.isEnabledFor
+
+    def after(state: tuple, result: Any):
+        sampled, start = state
         stop = time.perf_counter()
-        logger.log(level, fmttime(fn, stop-start))
-        return result
+        registration.add_time(stop - start)
+        if sampled or sampler.keep(stop - start, None):
+            on_time(stop - start, stop)
+
+    def error(state: tuple, e: Exception):
+        # Failed calls are only timed when asked by the sampling policy
+        sampled, start = state
+        stop = time.perf_counter()
+        registration.add_time(stop - start)
+        if sampler is not None and sampler.keep(stop - start, e):
+            on_time(stop - start, stop)
+
+    registration = register("timeit", fn, {
+        "name": name,
+        "level": level,
+        "aggregate": aggregate,
+        "sample": sample,
+    })
+    wrapped = wrap(fn, before, after, error, registration, enabled, level)
+    registry = as_registry(metrics)
+    if registry is not None:
+        function_metrics = FunctionMetrics(
+            registry, registration.name, "timeit"
+        )
+        wrapped = instrument(wrapped, function_metrics, registration)
+
+    if aggregate:
+        wrapped.stats = time_aggregate.histogram.summary
+        wrapped.flush = time_aggregate.flush
 
     return wrapped
 
 
+def _timeit_stats() -> Dict[str, LatencySummary]:
+    """Return latency statistics of all functions decorated with
+    timeit(aggregate=True), by module-qualified function name. Statistics
+    of functions with the same name, e.g., decorated several times, are
+    merged."""
+    histograms: Dict[str, Histogram] = {}
+    for aggregate in list(_time_aggregates):
+        snapshot = aggregate.histogram.snapshot()
+        merged = histograms.get(aggregate.name)
+        if merged is None:
+            histograms[aggregate.name] = snapshot
+        else:
+            merged.merge(snapshot)
+    return {
+        name: histogram.summary() for name, histogram in histograms.items()
+    }
+
+
+timeit.stats = _timeit_stats
+
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
 
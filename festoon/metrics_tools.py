@@ -0,0 +1,453 @@
+"""In-process metrics of decorated functions, exported in OpenMetrics text
+format"""
+import bisect
+import functools
+import inspect
+import math
+import os
+import tempfile
+import threading
+import time
+import weakref
+from typing import (
+    Callable, Dict, List, Optional, Sequence, Tuple, TYPE_CHECKING, Union,
+)
+
+from .registry_tools import Registration
+from .stats_tools import _ShardOwner
+
+if TYPE_CHECKING:
+    # Imported by start_http_server only, as it is slow to import
+    import http.server
+
+
+#: Default upper bounds of latency histogram buckets, in seconds
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+    2.5, 5.0, 10.0,
+)
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+LABELS_TYPE = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return (
+        value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    )
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, int) or value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    """Metric family with values by label values, recorded in per-thread
+    shards that are only merged when rendered. The shards of threads that
+    ended are folded into a single one."""
+    type = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str]):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._shards: List[dict] = []
+        #: Values recorded by threads that ended
+        self._ended: dict = {}
+
+    def _shard(self) -> dict:
+        try:
+            return self._local.owner.shard
+        except AttributeError:
+            shard: dict = {}
+            owner = _ShardOwner(shard)
+            weakref.finalize(owner, _fold_shard, weakref.ref(self), shard)
+            with self._lock:
+                self._shards.append(shard)
+                self._local.owner = owner
+            return shard
+
+    def _merge(self, result: dict, shard: dict):
+        """Add the values of `shard` to `result`, without sharing mutable
+        values between them"""
+        raise NotImplementedError
+
+    def _merged(self) -> dict:
+        """Return the values of all shards, merged"""
+        result: dict = {}
+        with self._lock:
+            self._merge(result, self._ended)
+            shards = list(self._shards)
+        for shard in shards:
+            # Copying a dict does not release the GIL, so it is consistent
+            self._merge(result, dict(shard))
+        return result
+
+    def render(self) -> List[str]:
+        lines = [f"# TYPE {self.name} {self.type}"]
+        if self.help:
+            lines.append(f"# HELP {self.name} {_escape(self.help)}")
+        return lines
+
+
+def _fold_shard(ref: "weakref.ref[_Metric]", shard: dict):
+    """Fold the shard of a thread that ended into the values of ended
+    threads of its metric, if the metric was not dropped in the meantime"""
+    metric = ref()
+    if metric is None:
+        return
+    with metric._lock:
+        for i, other in enumerate(metric._shards):
+            if other is shard:
+                del metric._shards[i]
+                metric._merge(metric._ended, shard)
+                return
+
+
+class CounterMetric(_Metric):
+    """Monotonic counter family, see :code:`MetricsRegistry.counter`"""
+    type = "counter"
+
+    def inc(self, labels: LABELS_TYPE = (), amount: float = 1):
+        """Increment the counter with label values `labels`, in the order of
+        the label names"""
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def values(self) -> Dict[LABELS_TYPE, float]:
+        """Return the counts by label values, merged across threads"""
+        return self._merged()
+
+    def _merge(self, result: dict, shard: dict):
+        for labels, value in shard.items():
+            result[labels] = result.get(labels, 0) + value
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        for labels, value in sorted(self.values().items()):
+            lines.append(
+                f"{self.name}_total"
+                f"{_format_labels(self.labelnames, labels)} "
+                f"{_format_value(value)}"
+            )
+        return lines
+
+
+class HistogramMetric(_Metric):
+    """Histogram family with fixed buckets, see
+    :code:`MetricsRegistry.histogram`"""
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str],
+        buckets: Sequence[float],
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, labels: LABELS_TYPE = ()):
+        """Record `value` for the label values `labels`"""
+        shard = self._shard()
+        counts = shard.get(labels)
+        if counts is None:
+            # One count per bucket, one for +Inf, then the sum
+            counts = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def values(self) -> Dict[LABELS_TYPE, List[float]]:
+        """Return the per-bucket counts, followed by the sum, by label values,
+        merged across threads"""
+        return self._merged()
+
+    def _merge(self, result: dict, shard: dict):
+        for labels, counts in shard.items():
+            merged = result.setdefault(labels, [0] * len(counts))
+            for i, count in enumerate(list(counts)):
+                merged[i] += count
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        bounds = self.buckets + (math.inf,)
+        for labels, counts in sorted(self.values().items()):
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                bucket_labels = _format_labels(
+                    self.labelnames + ("le",), labels + (_format_value(bound),)
+                )
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            formatted = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_count{formatted} {cumulative}")
+            lines.append(
+                f"{self.name}_sum{formatted} {_format_value(counts[-1])}"
+            )
+        return lines
+
+
+class MetricsRegistry:
+    """Collection of metric families, rendered together
+
+    Recording a value only touches a dict of the current thread, so
+    threads never contend on metrics; shards are merged when rendering.
+
+    The decorators :code:`logit`, :code:`timeit` and :code:`retry` record
+    these families when given :code:`metrics=True` (for the default
+    registry) or a registry, with labels "function" (module-qualified name)
+    and "decorator":
+
+    - festoon_calls: calls
+    - festoon_errors: calls that raised, also labelled by "exception"
+    - festoon_latency_seconds: histogram of call durations, with
+      `latency_buckets`
+    - festoon_retries: retried attempts of :code:`retry`
+
+    Args:
+        latency_buckets: upper bounds of the buckets of
+            festoon_latency_seconds, in seconds
+    """
+    def __init__(self, latency_buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.latency_buckets = tuple(latency_buckets)
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _get(self, name: str, factory: Callable[[], _Metric]) -> _Metric:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = factory()
+        return metric
+
+    def counter(
+        self,
+        name: str,
+        help: str = "",
+        labelnames: Sequence[str] = (),
+    ) -> CounterMetric:
+        """Return the counter family `name`, creating it if needed. Its
+        samples are named `name` followed by "_total"."""
+        metric = self._get(
+            name, lambda: CounterMetric(name, help, labelnames)
+        )
+        if not isinstance(metric, CounterMetric):
+            raise ValueError(f"{name} is already a {metric.type}")
+        return metric
+
+    def histogram(
+        self,
+        name: str,
+        help: str = "",
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> HistogramMetric:
+        """Return the histogram family `name`, creating it if needed"""
+        metric = self._get(
+            name, lambda: HistogramMetric(name, help, labelnames, buckets)
+        )
+        if not isinstance(metric, HistogramMetric):
+            raise ValueError(f"{name} is already a {metric.type}")
+        return metric
+
+    def render(self) -> str:
+        """Render all metric families in OpenMetrics text format"""
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+        lines = []
+        for _, metric in metrics:
+            lines.extend(metric.render())
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+#: Registry used by decorators given :code:`metrics=True`
+REGISTRY = MetricsRegistry()
+
+#: Type of the :code:`metrics` option of decorators
+METRICS_TYPE = Union[bool, MetricsRegistry]
+
+
+def as_registry(metrics: Optional[METRICS_TYPE]) -> Optional[MetricsRegistry]:
+    """Return the registry selected by the :code:`metrics` option of a
+    decorator, or None if metrics are off"""
+    if isinstance(metrics, MetricsRegistry):
+        return metrics
+    return REGISTRY if metrics else None
+
+
+class FunctionMetrics:
+    """The metrics of a single decorated function, with its labels bound"""
+    def __init__(
+        self,
+        registry: MetricsRegistry,
+        function: str,
+        decorator: str,
+    ):
+        self.function = function
+        self.labels = (function, decorator)
+        self.calls = registry.counter(
+            "festoon_calls",
+            "Calls of decorated functions",
+            ("function", "decorator"),
+        )
+        self.errors = registry.counter(
+            "festoon_errors",
+            "Calls of decorated functions that raised an exception",
+            ("function", "decorator", "exception"),
+        )
+        self.latency = registry.histogram(
+            "festoon_latency_seconds",
+            "Duration of calls of decorated functions",
+            ("function", "decorator"),
+            registry.latency_buckets,
+        )
+        self.retries = registry.counter(
+            "festoon_retries",
+            "Retried attempts of decorated functions",
+            ("function", "decorator"),
+        )
+
+    def done(self, seconds: float):
+        self.calls.inc(self.labels)
+        self.latency.observe(seconds, self.labels)
+
+    def failed(self, seconds: float, excp: BaseException):
+        self.done(seconds)
+        self.errors.inc(self.labels + (type(excp).__qualname__,))
+
+
+def instrument(
+    fn: Callable,
+    metrics: FunctionMetrics,
+    registration: Registration,
+) -> Callable:
+    """Wrap `fn`, recording the calls, errors and latency of each call in
+    `metrics`, unless the decorator of `registration` is disabled"""
+    perf_counter = time.perf_counter
+
+    if inspect.isasyncgenfunction(fn):
+        @functools.wraps(fn)
+        async def wrapped(*args, **kwargs):
+            if not registration.enabled:
+                async for item in fn(*args, **kwargs):
+                    yield item
+                return
+            start = perf_counter()
+            try:
+                async for item in fn(*args, **kwargs):
+                    yield item
+            except Exception as e:
+                metrics.failed(perf_counter() - start, e)
+                raise
+            metrics.done(perf_counter() - start)
+
+    elif inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def wrapped(*args, **kwargs):
+            if not registration.enabled:
+                return await fn(*args, **kwargs)
+            start = perf_counter()
+            try:
+                result = await fn(*args, **kwargs)
+            except Exception as e:
+                metrics.failed(perf_counter() - start, e)
+                raise
+            metrics.done(perf_counter() - start)
+            return result
+
+    else:
+        @functools.wraps(fn)
+        def wrapped(*args, **kwargs):
+            if not registration.enabled:
+                return fn(*args, **kwargs)
+            start = perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                metrics.failed(perf_counter() - start, e)
+                raise
+            metrics.done(perf_counter() - start)
+            return result
+
+    return wrapped
+
+
+class _MetricsHandler:
+    """Request handler methods, mixed into BaseHTTPRequestHandler"""
+    registry = REGISTRY
+
+    def do_GET(self):
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(
+    port: int,
+    addr: str = "127.0.0.1",
+    registry: Optional[MetricsRegistry] = None,
+) -> "http.server.ThreadingHTTPServer":
+    """Serve the metrics of `registry` (default: :code:`REGISTRY`) over HTTP
+    from a daemon thread, for scraping
+
+    Returns:
+        the server, which can be stopped with :code:`shutdown()`
+
+    Examples:
+        >>> server = start_http_server(9464)
+        $ curl localhost:9464/metrics
+    """
+    import http.server
+
+    handler = type(
+        "MetricsHandler",
+        (_MetricsHandler, http.server.BaseHTTPRequestHandler),
+        {"registry": registry or REGISTRY},
+    )
+    server = http.server.ThreadingHTTPServer((addr, port), handler)
+    server.daemon_threads = True
+    threading.Thread(
+        target=server.serve_forever, name="festoon-metrics", daemon=True
+    ).start()
+    return server
+
+
+def write_textfile(path: str, registry: Optional[MetricsRegistry] = None):
+    """Atomically write the metrics of `registry` (default:
+    :code:`REGISTRY`) to `path`, e.g., for the textfile collector of the
+    Prometheus node exporter"""
+    text = (registry or REGISTRY).render()
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".festoon-metrics-")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
@@ -0,0 +1,359 @@
+"""Parsers of strings, such as environment variables, by type annotation"""
+import collections.abc
+import enum
+import functools
+import json
+import pathlib
+import types
+import typing
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+
+
+PARSER_TYPE = Callable[[str], Any]
+
+#: Strings parsed as True and False by the parser of bool, in lower case
+TRUE_STRINGS = ("1", "true", "yes", "on", "y", "t")
+FALSE_STRINGS = ("0", "false", "no", "off", "n", "f")
+#: Strings parsed as None in an Optional annotation, in lower case
+NONE_STRINGS = ("", "none", "null")
+
+_UNION_TYPES: Tuple[Any, ...] = (typing.Union,)
+if hasattr(types, "UnionType"):  # Python 3.10+, e.g., "int | None"
+    _UNION_TYPES += (types.UnionType,)
+
+
+class ParseError(ValueError):
+    """A string is not a valid value of a type
+
+    Attributes:
+        value: the invalid string
+        annotation: the type annotation it was parsed for
+        reason: why it is invalid, possibly empty
+        source: where the string comes from, e.g., an environment variable,
+            or None
+    """
+    def __init__(
+        self,
+        value: str,
+        annotation: Any,
+        reason: str = "",
+        source: Optional[str] = None,
+    ):
+        message = f"Invalid {_type_name(annotation)} {value!r}"
+        if source is not None:
+            message += f" in {source}"
+        if reason:
+            message += f": {reason}"
+        super().__init__(message)
+        self.value = value
+        self.annotation = annotation
+        self.reason = reason
+        self.source = source
+
+
+def _type_name(annotation: Any) -> str:
+    if isinstance(annotation, type) and not typing.get_args(annotation):
+        return annotation.__qualname__
+    return str(annotation).replace("typing.", "")
+
+
+def _parse_str(value: str) -> str:
+    return value
+
+
+def _parse_bool(value: str) -> bool:
+    lowered = value.strip().lower()
+    if lowered in TRUE_STRINGS:
+        return True
+    if lowered in FALSE_STRINGS:
+        return False
+    raise ParseError(
+        value, bool, f"expected one of {', '.join(TRUE_STRINGS)} or "
+        f"{', '.join(FALSE_STRINGS)}"
+    )
+
+
+def _parse_none(value: str) -> None:
+    if value.strip().lower() in NONE_STRINGS:
+        return None
+    raise ParseError(value, type(None))
+
+
+def _parse_json(value: str) -> Any:
+    try:
+        return json.loads(value)
+    except ValueError as e:
+        raise ParseError(value, "JSON", str(e)) from None
+
+
+#: Concrete types of collections parsed for abstract annotations
+_COLLECTIONS = {
+    list: list,
+    tuple: tuple,
+    set: set,
+    frozenset: frozenset,
+    collections.abc.Iterable: list,
+    collections.abc.Collection: list,
+    collections.abc.Sequence: list,
+    collections.abc.MutableSequence: list,
+    collections.abc.Set: frozenset,
+    collections.abc.MutableSet: set,
+}
+
+#: Parsers of types, see :code:`register_parser`
+_parsers: Dict[Any, PARSER_TYPE] = {
+    str: _parse_str,
+    bool: _parse_bool,
+    int: int,
+    float: float,
+    complex: complex,
+    type(None): _parse_none,
+    Any: _parse_str,
+}
+
+
+def register_parser(annotation: Any, parser: PARSER_TYPE):
+    """Parse strings with `parser` for the annotation `annotation`, which
+    may also be a part of other annotations, e.g., of lists
+
+    Parsers may raise any exception for invalid strings, which is turned
+    into a :code:`ParseError`.
+
+    Examples:
+        >>> register_parser(datetime.date, datetime.date.fromisoformat)
+        >>> @fromenv
+        >>> def report(day: Optional[datetime.date] = None):
+        >>>     ...
+    """
+    _parsers[annotation] = parser
+    _compile.cache_clear()
+
+
+def _ordered(annotation: Any) -> Tuple[Any, ...]:
+    """Key telling apart annotations that are equal despite the different
+    orders of their members, such as Union[int, str] and Union[str, int]"""
+    return tuple(
+        (arg, _ordered(arg)) for arg in typing.get_args(annotation)
+    )
+
+
+def parser_for(annotation: Any) -> PARSER_TYPE:
+    """Return the parser of strings into values of `annotation`
+
+    The parser is compiled once per annotation, and raises
+    :code:`ParseError` for invalid strings. Supported annotations are:
+
+    - str, int, float, complex, and bool, which accepts "1", "true", "yes",
+      "on" and "0", "false", "no", "off", in any case
+    - subclasses of :code:`enum.Enum`, by member name or by value
+    - :code:`pathlib.PurePath` and its subclasses, such as :code:`Path`
+    - dict, Dict[...] and Mapping[...], from JSON objects
+    - list, tuple, set, frozenset and their typing generics, such as
+      List[int], Sequence[float] or Tuple[str, int], from comma separated
+      items, or from JSON arrays if the string starts with "[", whose
+      items other than strings must be of the item type, or losslessly
+      converted to it, e.g., 1 to 1.0 for float
+    - Optional and Union, trying each member in declared order. None is
+      parsed from "", "none" and "null".
+    - Literal, by string value of its values
+    - Any, which keeps the string as-is
+    - types registered with :code:`register_parser`
+    - any other callable, such as a class, which is called with the string
+    """
+    return _compile(annotation, _ordered(annotation))
+
+
+@functools.lru_cache(maxsize=None)
+def _compile(annotation: Any, ordered: Tuple[Any, ...]) -> PARSER_TYPE:
+    parser = _parsers.get(annotation)
+    if parser is not None:
+        return _checked(parser, annotation)
+
+    origin = typing.get_origin(annotation)
+    args = typing.get_args(annotation)
+
+    if origin in _UNION_TYPES:
+        return _union_parser(annotation, args)
+    if origin is typing.Literal:
+        return _literal_parser(annotation, args)
+    if origin in (dict, collections.abc.Mapping) or annotation is dict:
+        return _dict_parser(annotation)
+    collection = _COLLECTIONS.get(origin or annotation)
+    if collection is not None:
+        return _collection_parser(annotation, collection, args)
+    if isinstance(annotation, type):
+        if issubclass(annotation, enum.Enum):
+            return _enum_parser(annotation)
+        if issubclass(annotation, pathlib.PurePath):
+            return _checked(annotation, annotation)
+    if callable(annotation):
+        return _checked(annotation, annotation)
+    raise TypeError(f"No parser for annotation {annotation!r}")
+
+
+def _checked(parser: PARSER_TYPE, annotation: Any) -> PARSER_TYPE:
+    """Turn the errors of `parser` into ParseError"""
+    def parse(value: str) -> Any:
+        try:
+            return parser(value)
+        except ParseError:
+            raise
+        except Exception as e:
+            raise ParseError(value, annotation, str(e)) from None
+
+    return parse
+
+
+def _union_parser(annotation: Any, args: Tuple[Any, ...]) -> PARSER_TYPE:
+    parsers = [parser_for(arg) for arg in args]
+
+    def parse(value: str) -> Any:
+        for parser in parsers:
+            try:
+                return parser(value)
+            except ParseError:
+                pass
+        raise ParseError(value, annotation)
+
+    return parse
+
+
+def _literal_parser(annotation: Any, args: Tuple[Any, ...]) -> PARSER_TYPE:
+    values = {str(arg): arg for arg in args}
+
+    def parse(value: str) -> Any:
+        try:
+            return values[value]
+        except KeyError:
+            raise ParseError(
+                value, annotation, f"expected one of {', '.join(values)}"
+            ) from None
+
+    return parse
+
+
+def _enum_parser(annotation: Type[enum.Enum]) -> PARSER_TYPE:
+    members = dict(annotation.__members__)
+    for member in annotation:
+        members.setdefault(str(member.value), member)
+
+    def parse(value: str) -> enum.Enum:
+        try:
+            return members[value]
+        except KeyError:
+            raise ParseError(
+                value, annotation,
+                f"expected one of {', '.join(annotation.__members__)}",
+            ) from None
+
+    return parse
+
+
+def _dict_parser(annotation: Any) -> PARSER_TYPE:
+    def parse(value: str) -> dict:
+        parsed = _parse_json(value)
+        if not isinstance(parsed, dict):
+            raise ParseError(value, annotation, "expected a JSON object")
+        return parsed
+
+    return parse
+
+
+def _split(value: str) -> List[Any]:
+    """Split comma separated items, or a JSON array"""
+    if value.lstrip().startswith("["):
+        parsed = _parse_json(value)
+        if not isinstance(parsed, list):
+            raise ParseError(value, list, "expected a JSON array")
+        return parsed
+    if not value.strip():
+        return []
+    return [item.strip() for item in value.split(",")]
+
+
+def _collection_parser(
+    annotation: Any,
+    origin: type,
+    args: Tuple[Any, ...],
+) -> PARSER_TYPE:
+    if origin is tuple and args and args[-1] is not Ellipsis:
+        # Fixed length tuple, e.g., Tuple[str, int]
+        item_parsers = [parser_for(arg) for arg in args]
+
+        def parse(value: str) -> tuple:
+            items = _split(value)
+            if len(items) != len(item_parsers):
+                raise ParseError(
+                    value, annotation,
+                    f"expected {len(item_parsers)} items, got {len(items)}",
+                )
+            return tuple(
+                _parse_item(parser, item, annotation, arg)
+                for parser, item, arg in zip(item_parsers, items, args)
+            )
+
+        return parse
+
+    item_annotation = args[0] if args else Any
+    item_parser = parser_for(item_annotation)
+
+    def parse(value: str) -> Any:
+        return origin(
+            _parse_item(item_parser, item, annotation, item_annotation)
+            for item in _split(value)
+        )
+
+    return parse
+
+
+#: Types of the JSON values accepted for scalar annotations, which are
+#: converted to the annotation, e.g., 1 to 1.0 for float
+_JSON_SCALARS: Dict[Any, Tuple[type, ...]] = {
+    str: (str,),
+    bool: (bool,),
+    int: (int,),
+    float: (float, int),
+    complex: (complex, float, int),
+    type(None): (type(None),),
+}
+
+
+def _parse_item(
+    parser: PARSER_TYPE,
+    item: Any,
+    annotation: Any,
+    item_annotation: Any,
+) -> Any:
+    """Parse an item of a collection. Values of JSON arrays other than
+    strings are checked against `item_annotation` instead."""
+    try:
+        if isinstance(item, str):
+            return parser(item)
+        return _from_json(item, item_annotation, parser)
+    except ParseError as e:
+        raise ParseError(e.value, annotation, str(e)) from None
+
+
+def _from_json(item: Any, annotation: Any, parser: PARSER_TYPE) -> Any:
+    """Check a JSON value other than a string against `annotation`,
+    converting it where no information is lost"""
+    if annotation is Any:
+        return item
+    accepted = _JSON_SCALARS.get(annotation)
+    if accepted is not None:
+        # bool is a subclass of int, but true is not a valid int
+        if isinstance(item, accepted) and (
+            annotation is bool or not isinstance(item, bool)
+        ):
+            return None if item is None else annotation(item)
+        raise ParseError(json.dumps(item), annotation)
+    if typing.get_origin(annotation) in _UNION_TYPES:
+        for arg in typing.get_args(annotation):
+            try:
+                return _from_json(item, arg, parser_for(arg))
+            except ParseError:
+                pass
+        raise ParseError(json.dumps(item), annotation)
+    # Collections, dicts, Literal, enums and other types parse the JSON
+    # text, e.g., "[1, 2]" for List[List[int]] or "1" for Literal[1]
+    return parser(json.dumps(item))
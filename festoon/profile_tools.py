@@ -0,0 +1,401 @@
+"""Profiling of decorated functions, switched on and off at runtime"""
+import atexit
+import collections
+import cProfile
+import fnmatch
+import functools
+import inspect
+import io
+import logging
+import os
+import pstats
+import signal
+import sys
+import threading
+import time
+import weakref
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+MODES = ("cprofile", "sampling")
+
+#: Environment variable enabling profilers at decoration time. Its value is
+#: a comma separated list of glob patterns matched against the names of
+#: profilers, or "1" to enable all of them.
+PROFILE_ENV = "FESTOON_PROFILE"
+
+LOG = logging.getLogger(__name__)
+
+#: Only one cProfile profiler can be active at a time
+_cprofile_lock = threading.Lock()
+
+
+class Profiler:
+    """Profiler of the calls of a single function, over windows of time
+
+    While enabled, calls are profiled either with :code:`cProfile`, which
+    records every function call made within them, or by sampling the stacks
+    of the threads running them every `interval` seconds, which has a lower
+    and bounded overhead. When disabled, reports of the window are written
+    to `output_dir`, and named after the profiler, the process id and the
+    time at which the window started:
+
+    - "cprofile" mode writes a :code:`pstats` dump (".pstats") and a table
+      of the `top` functions by self time (".txt")
+    - "sampling" mode writes collapsed stacks (".collapsed"), as used by
+      flamegraph tools, and a table of the `top` functions by self samples
+      (".txt")
+
+    In "cprofile" mode, a single call is profiled at a time in the process;
+    concurrent calls and calls nested in another profiled call run without
+    profiling of their own. Since Python 3.12, profiling also records other
+    threads.
+
+    Args:
+        fn: the profiled function
+        name: name of the profiler, used in file names
+        mode: one of "cprofile" or "sampling"
+        output_dir: directory of reports
+        top: number of rows of report tables
+        interval: seconds between samples, in "sampling" mode
+    """
+    def __init__(
+        self,
+        fn: Callable,
+        name: str,
+        mode: str = "cprofile",
+        output_dir: str = ".",
+        top: int = 20,
+        interval: float = 0.005,
+    ):
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {MODES}, got {mode}")
+        self.fn = fn
+        self.name = name
+        self.mode = mode
+        self.output_dir = output_dir
+        self.top = top
+        self.interval = interval
+        #: Whether calls are currently profiled
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._deadline = float("inf")
+        self._started = 0.0
+        self._profile: Optional[cProfile.Profile] = None
+        self._code = inspect.unwrap(fn).__code__
+        self._active: Dict[int, int] = {}
+        self._samples: Dict[Tuple, int] = collections.Counter()
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    def enable(self, window: Optional[float] = None):
+        """Start profiling calls, for `window` seconds if not None"""
+        with self._lock:
+            if self.enabled:
+                return
+            self._started = time.time()
+            self._deadline = (
+                float("inf") if window is None
+                else time.monotonic() + window
+            )
+            if self.mode == "cprofile":
+                self._profile = cProfile.Profile()
+            else:
+                self._samples = collections.Counter()
+                self._stop = threading.Event()
+                self._sampler = threading.Thread(
+                    target=self._sample,
+                    name=f"festoon-profile-{self.name}",
+                    daemon=True,
+                )
+                self._sampler.start()
+            self.enabled = True
+        LOG.info(f"Profiling {self.name}")
+
+    def disable(self) -> List[str]:
+        """Stop profiling calls, and return the paths of reports written"""
+        with self._lock:
+            if not self.enabled:
+                return []
+            self.enabled = False
+            if self.mode == "cprofile":
+                # Wait for a call being profiled to finish, unless it is
+                # the one disabling its own profiler
+                locked = _cprofile_lock.acquire(timeout=1.0)
+                try:
+                    paths = self._write_cprofile()
+                finally:
+                    if locked:
+                        _cprofile_lock.release()
+            else:
+                self._stop.set()
+                self._sampler.join()
+                paths = self._write_sampling()
+        LOG.info(f"Profiled {self.name}, wrote {', '.join(paths)}")
+        return paths
+
+    def toggle(self):
+        if self.enabled:
+            self.disable()
+        else:
+            self.enable()
+
+    def call(self, args: tuple, kwargs: dict):
+        """Call the function, profiling it if possible"""
+        if time.monotonic() >= self._deadline:
+            self._expire()
+            return self.fn(*args, **kwargs)
+        if self.mode == "sampling":
+            return self._call_sampled(args, kwargs)
+        profile = self._profile
+        if profile is None or not _cprofile_lock.acquire(blocking=False):
+            return self.fn(*args, **kwargs)
+        try:
+            try:
+                profile.enable()
+            except ValueError:
+                # Another profiling tool is active
+                return self.fn(*args, **kwargs)
+            try:
+                return self.fn(*args, **kwargs)
+            finally:
+                profile.disable()
+        finally:
+            _cprofile_lock.release()
+
+    def _call_sampled(self, args: tuple, kwargs: dict):
+        ident = threading.get_ident()
+        active = self._active
+        depth = active.get(ident, 0)
+        active[ident] = depth + 1
+        try:
+            return self.fn(*args, **kwargs)
+        finally:
+            if depth:
+                active[ident] = depth
+            else:
+                del active[ident]
+
+    def _sample(self):
+        code = self._code
+        samples = self._samples
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for ident in list(self._active):
+                frame = frames.get(ident)
+                stack = []
+                cut = 0
+                while frame is not None:
+                    stack.append(frame.f_code)
+                    if frame.f_code is code:
+                        cut = len(stack)
+                    frame = frame.f_back
+                if cut:
+                    samples[tuple(reversed(stack[:cut]))] += 1
+            if time.monotonic() >= self._deadline:
+                self._expire()
+                return
+
+    def _expire(self):
+        """Disable the profiler at the end of its window, in a separate
+        thread, so that neither calls nor the sampler wait for reports to
+        be written"""
+        # Only the first call past the deadline starts a thread
+        self._deadline = float("inf")
+        threading.Thread(target=self.disable, daemon=True).start()
+
+    def _path(self, suffix: str) -> str:
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self._started))
+        return os.path.join(
+            self.output_dir, f"{self.name}.{os.getpid()}.{stamp}{suffix}"
+        )
+
+    def _write_cprofile(self) -> List[str]:
+        profile, self._profile = self._profile, None
+        os.makedirs(self.output_dir, exist_ok=True)
+        dump_path = self._path(".pstats")
+        profile.dump_stats(dump_path)
+        table = io.StringIO()
+        try:
+            stats = pstats.Stats(profile, stream=table)
+        except TypeError:
+            # No call was profiled during the window
+            table.write("No calls profiled\n")
+        else:
+            stats.sort_stats("tottime").print_stats(self.top)
+        table_path = self._path(".txt")
+        with open(table_path, "w") as f:
+            f.write(table.getvalue())
+        return [dump_path, table_path]
+
+    def _write_sampling(self) -> List[str]:
+        samples = self._samples
+        os.makedirs(self.output_dir, exist_ok=True)
+        collapsed_path = self._path(".collapsed")
+        with open(collapsed_path, "w") as f:
+            for stack, count in samples.items():
+                f.write(f"{';'.join(map(_label, stack))} {count}\n")
+        self_samples: Dict[str, int] = collections.Counter()
+        for stack, count in samples.items():
+            self_samples[_label(stack[-1])] += count
+        total = sum(self_samples.values())
+        table_path = self._path(".txt")
+        with open(table_path, "w") as f:
+            f.write(f"{total} samples every {self.interval}s\n")
+            f.write(f"{'self%':>7} {'samples':>8}  function\n")
+            for label, count in self_samples.most_common(self.top):
+                f.write(f"{100*count/total:>6.1f}% {count:>8}  {label}\n")
+        return [collapsed_path, table_path]
+
+
+def _label(code) -> str:
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+#: Profilers of decorated functions, dropped with their function
+_profilers: "weakref.WeakSet[Profiler]" = weakref.WeakSet()
+
+
+def _matching(pattern: str) -> List[Profiler]:
+    return [
+        profiler for profiler in list(_profilers)
+        if fnmatch.fnmatchcase(profiler.name, pattern)
+    ]
+
+
+def enable(pattern: str = "*", window: Optional[float] = None):
+    """Enable the profilers whose name matches the glob `pattern`, for
+    `window` seconds if not None"""
+    for profiler in _matching(pattern):
+        profiler.enable(window)
+
+
+def disable(pattern: str = "*") -> List[str]:
+    """Disable the profilers whose name matches the glob `pattern`, and
+    return the paths of reports written"""
+    paths = []
+    for profiler in _matching(pattern):
+        paths.extend(profiler.disable())
+    return paths
+
+
+def install_signal_handler(
+    signum: Optional[int] = None,
+    pattern: str = "*",
+):
+    """Toggle the profilers matching `pattern` each time the process
+    receives signal `signum`, by default SIGUSR2 (not available on Windows)
+
+    Must be called from the main thread. Reports are written by a separate
+    thread, so as not to block the interrupted code.
+
+    Examples:
+        >>> install_signal_handler()
+        $ kill -USR2 <pid>  # start profiling
+        $ kill -USR2 <pid>  # stop profiling and write reports
+    """
+    def handler(signum, frame):
+        threading.Thread(
+            target=lambda: [p.toggle() for p in _matching(pattern)],
+            daemon=True,
+        ).start()
+
+    signal.signal(signal.SIGUSR2 if signum is None else signum, handler)
+
+
+def _enabled_by_env(name: str) -> bool:
+    value = os.environ.get(PROFILE_ENV, "")
+    if value.lower() in ("1", "true", "yes"):
+        return True
+    return any(
+        fnmatch.fnmatchcase(name, pattern.strip())
+        for pattern in value.split(",") if pattern.strip()
+    )
+
+
+def profileit(
+    fn: Optional[Callable] = None,
+    *,
+    name: Optional[str] = None,
+    mode: str = "cprofile",
+    output_dir: str = ".",
+    top: int = 20,
+    interval: float = 0.005,
+):
+    """Profile this function while switched on at runtime
+
+    Profiling is off by default, in which case the only overhead on each
+    call is checking a flag. It is switched on and off for all profiled
+    functions matching a glob pattern with :code:`enable` and
+    :code:`disable`, by a signal (see :code:`install_signal_handler`), or
+    at decoration time by the environment variable FESTOON_PROFILE. Reports
+    are written when profiling is switched off, and at interpreter exit.
+    See :code:`Profiler` for the modes and reports.
+
+    The profiler is available as the :code:`profiler` attribute of the
+    decorated function. Coroutine and async generator functions are not
+    supported.
+
+    Args:
+        fn: function to be decorated
+        name: name of the profiler. If None, then the module-qualified name
+            of the function is used.
+        mode: one of "cprofile" or "sampling"
+        output_dir: directory of reports
+        top: number of rows of report tables
+        interval: seconds between samples, in "sampling" mode
+
+    Examples:
+        >>> @profileit(output_dir="/tmp/profiles")
+        >>> def handle(request):
+        >>>     ...
+        >>> enable("*handle", window=60)  # profile the next minute
+        >>> ...
+        >>> disable()  # or stop early, and write reports now
+        ['/tmp/profiles/__main__.handle.1234.20211018-120000.pstats',
+         '/tmp/profiles/__main__.handle.1234.20211018-120000.txt']
+
+        Sampling, which is cheaper for hot functions, can be switched on
+        with an environment variable:
+
+        >>> @profileit(mode="sampling")
+        >>> def main():
+        >>>     ...
+        $ FESTOON_PROFILE="*main" python script.py
+    """
+    if fn is None:
+        return functools.partial(
+            profileit,
+            name=name,
+            mode=mode,
+            output_dir=output_dir,
+            top=top,
+            interval=interval,
+        )
+
+    if not callable(fn):
+        raise ValueError(f"{fn} is not callable")
+    if inspect.iscoroutinefunction(fn) or inspect.isasyncgenfunction(fn):
+        raise ValueError(f"{fn} is asynchronous, which is not supported")
+
+    if name is None:
+        name = f"{fn.__module__}.{getattr(fn, '__qualname__', fn.__name__)}"
+
+    profiler = Profiler(fn, name, mode, output_dir, top, interval)
+    _profilers.add(profiler)
+
+    @functools.wraps(fn)
+    def wrapped(*args, **kwargs):
+        if not profiler.enabled:
+            return fn(*args, **kwargs)
+        return profiler.call(args, kwargs)
+
+    wrapped.profiler = profiler
+    if _enabled_by_env(name):
+        profiler.enable()
+    return wrapped
+
+
+@atexit.register
+def _disable_profilers():
+    disable()
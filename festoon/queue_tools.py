@@ -0,0 +1,207 @@
+"""Optional background emission of the log records of festoon decorators"""
+import atexit
+import collections
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+
+OVERFLOWS = ("drop", "block", "drop_count")
+
+LOG = logging.getLogger(__name__)
+
+
+class LogQueue:
+    """Bounded queue of log records handled by a background thread
+
+    Decorated functions only create the log record, in the calling thread,
+    and append it to the queue. A daemon thread then handles it, so the
+    latency of handlers and of formatting messages is moved off the
+    decorated call. Appending to the queue takes no lock.
+
+    Messages of :code:`logit` and :code:`timeit` are formatted lazily, i.e.,
+    in the background thread. Arguments mutated right after the call may
+    therefore be logged with their new value.
+
+    Args:
+        size: maximum number of queued records
+        overflow: what to do with a record when the queue is full: "drop"
+            drops it, "block" waits for room in the queue, and "drop_count"
+            drops it and logs a warning with the number of dropped records
+            once the queue has room again. Dropped records are counted in
+            all cases.
+    """
+    def __init__(self, size: int = 10_000, overflow: str = "drop"):
+        if overflow not in OVERFLOWS:
+            raise ValueError(
+                f"overflow must be one of {OVERFLOWS}, got {overflow}"
+            )
+        if size < 1:
+            raise ValueError(f"size must be at least 1, got {size}")
+        self.size = size
+        self.overflow = overflow
+        self._queue: collections.deque = collections.deque()
+        self._wakeup = threading.Event()
+        self._not_full = threading.Condition()
+        self._closed = False
+        self._reported = 0
+        #: Number of records handled
+        self.handled = 0
+        #: Number of records dropped because the queue was full
+        self.dropped = 0
+        self._thread = threading.Thread(
+            target=self._run, name="festoon-log-queue", daemon=True
+        )
+        self._thread.start()
+
+    def put(self, logger: logging.Logger, record: logging.LogRecord):
+        """Queue `record`, to be handled by `logger`"""
+        queue = self._queue
+        if len(queue) >= self.size:
+            if self.overflow != "block" or self._closed:
+                self.dropped += 1
+                return
+            with self._not_full:
+                while len(queue) >= self.size and not self._closed:
+                    self._wakeup.set()
+                    self._not_full.wait(0.1)
+        queue.append((logger, record))
+        if not self._wakeup.is_set():
+            self._wakeup.set()
+
+    def log(
+        self,
+        logger: logging.Logger,
+        level: int,
+        msg: Any,
+        extra: Optional[Dict[str, Any]] = None,
+    ):
+        """Queue a record like :code:`logger.log(level, msg, extra=extra)`"""
+        # The caller's location is not looked up: for decorators, it is
+        # always the wrapper
+        record = logger.makeRecord(
+            logger.name, level, "(unknown file)", 0, msg, (), None,
+            None, extra,
+        )
+        self.put(logger, record)
+
+    def _drain(self):
+        queue = self._queue
+        while queue:
+            item = queue.popleft()
+            if isinstance(item, threading.Event):
+                item.set()
+                continue
+            logger, record = item
+            try:
+                logger.handle(record)
+            except Exception:
+                # Handlers report their own errors; this only keeps the
+                # thread alive if a filter or a lazy message raised
+                LOG.exception("Failed to handle queued log record")
+            self.handled += 1
+            if self.overflow == "block":
+                with self._not_full:
+                    self._not_full.notify_all()
+        if self.overflow == "drop_count" and self.dropped > self._reported:
+            dropped = self.dropped - self._reported
+            self._reported += dropped
+            LOG.warning(f"Log queue full, dropped {dropped} records")
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(0.5)
+            self._wakeup.clear()
+            self._drain()
+        self._drain()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until the records queued so far are handled
+
+        Returns:
+            False if the records were not handled within `timeout` seconds
+        """
+        if not self._thread.is_alive():
+            self._drain()
+            return True
+        done = threading.Event()
+        self._queue.append(done)
+        self._wakeup.set()
+        return done.wait(timeout)
+
+    def close(self, timeout: Optional[float] = 5.0):
+        """Handle the queued records and stop the background thread"""
+        self._closed = True
+        self._wakeup.set()
+        with self._not_full:
+            self._not_full.notify_all()
+        self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, int]:
+        """Counters of the queue, for monitoring"""
+        return {
+            "queued": len(self._queue),
+            "handled": self.handled,
+            "dropped": self.dropped,
+        }
+
+
+#: Queue used by decorators, if async logging is enabled
+_log_queue: Optional[LogQueue] = None
+
+
+def configure(
+    *,
+    async_logging: bool = False,
+    queue_size: int = 10_000,
+    overflow: str = "drop",
+):
+    """Configure festoon globally
+
+    Args:
+        async_logging: if True, then the log records of :code:`logit` and
+            :code:`timeit` are handled by a background thread instead of
+            the decorated call, see :code:`LogQueue`. Records still queued
+            at interpreter exit are handled before logging shuts down. If
+            False, then records queued so far are handled before returning.
+        queue_size: maximum number of queued records
+        overflow: one of "drop", "block" or "drop_count", see
+            :code:`LogQueue`
+
+    Examples:
+        >>> configure(async_logging=True, overflow="drop_count")
+        >>> get_log_queue().stats()
+        {'queued': 0, 'handled': 0, 'dropped': 0}
+    """
+    global _log_queue
+    queue = LogQueue(queue_size, overflow) if async_logging else None
+    previous, _log_queue = _log_queue, queue
+    if previous is not None:
+        previous.close()
+
+
+def get_log_queue() -> Optional[LogQueue]:
+    """Return the queue of async logging, or None if it is disabled"""
+    return _log_queue
+
+
+def log(
+    logger: logging.Logger,
+    level: int,
+    msg: Any,
+    extra: Optional[Dict[str, Any]] = None,
+):
+    """Log through the queue if async logging is enabled, or directly"""
+    queue = _log_queue
+    if queue is None:
+        logger.log(level, msg, extra=extra)
+    else:
+        queue.log(logger, level, msg, extra)
+
+
+@atexit.register
+def _close_log_queue():
+    # Registered before logging_tools flushes aggregates at exit, so it runs
+    # after them, and before logging shuts down its handlers
+    if _log_queue is not None:
+        _log_queue.close()
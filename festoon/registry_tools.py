@@ -0,0 +1,179 @@
+"""Runtime registry of the functions decorated by festoon
+
+Every function decorated by :code:`logit`, :code:`timeit`, :code:`traceit`,
+:code:`cacheit`, :code:`retry` or :code:`fromenv` is registered with its
+configuration and live counters, and can be listed, and switched on or off,
+by glob patterns matched against its module-qualified name.
+"""
+import fnmatch
+import threading
+import weakref
+from typing import Any, Callable, Dict, List, Optional
+
+
+class Registration:
+    """A function decorated by a festoon decorator, with its configuration
+    and live counters
+
+    Counters are updated without locking, so under heavy concurrency they
+    may miss a few increments.
+
+    Attributes:
+        name: module-qualified name of the decorated function
+        decorator: name of the decorator, e.g. "logit"
+        config: options given to the decorator
+        toggleable: whether the decorator can be disabled. Decorators that
+            change the arguments or results of calls, such as
+            :code:`fromenv`, are not.
+        enabled: whether the decorator is enabled. Disabled decorators call
+            the decorated function directly, and do not count calls.
+        calls: number of calls
+        errors: number of calls that raised an exception
+        retries: number of retried attempts
+        timed: number of calls whose duration was measured
+        time: cumulative duration of timed calls, in seconds
+    """
+    __slots__ = (
+        "name", "decorator", "config", "toggleable", "enabled", "calls",
+        "errors", "retries", "timed", "time", "__weakref__",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        decorator: str,
+        config: Dict[str, Any],
+        toggleable: bool = True,
+    ):
+        self.name = name
+        self.decorator = decorator
+        self.config = config
+        self.toggleable = toggleable
+        self.enabled = True
+        self.reset()
+
+    def reset(self):
+        """Reset counters to zero"""
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.timed = 0
+        self.time = 0.0
+
+    def add_time(self, seconds: float):
+        self.timed += 1
+        self.time += seconds
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters and state of the registration, for monitoring"""
+        return {
+            "name": self.name,
+            "decorator": self.decorator,
+            "enabled": self.enabled,
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "timed": self.timed,
+            "time": self.time,
+        }
+
+    def __repr__(self) -> str:
+        state = "enabled" if self.enabled else "disabled"
+        return f"<Registration {self.decorator} {self.name} ({state})>"
+
+
+# Registrations are forgotten once their wrapper is garbage collected, e.g.,
+# for functions decorated in a loop
+_registrations: "weakref.WeakSet[Registration]" = weakref.WeakSet()
+_lock = threading.Lock()
+
+
+def register(
+    decorator: str,
+    fn: Callable,
+    config: Dict[str, Any],
+    toggleable: bool = True,
+) -> Registration:
+    """Register a function decorated by `decorator`. The returned
+    registration must be kept alive by the wrapper."""
+    qualname = getattr(
+        fn, "__qualname__", getattr(fn, "__name__", type(fn).__qualname__)
+    )
+    name = f"{getattr(fn, '__module__', None)}.{qualname}"
+    registration = Registration(name, decorator, config, toggleable)
+    with _lock:
+        _registrations.add(registration)
+    return registration
+
+
+def registrations(
+    pattern: str = "*",
+    decorator: Optional[str] = None,
+) -> List[Registration]:
+    """Return the registrations whose name matches the glob `pattern`, and
+    whose decorator is `decorator` if not None, sorted by name
+
+    Examples:
+        >>> [r.name for r in registrations("myapp.db.*", decorator="retry")]
+        ['myapp.db.read', 'myapp.db.write']
+    """
+    with _lock:
+        candidates = list(_registrations)
+    return sorted(
+        (
+            registration for registration in candidates
+            if fnmatch.fnmatchcase(registration.name, pattern) and
+            (decorator is None or registration.decorator == decorator)
+        ),
+        key=lambda registration: (registration.name, registration.decorator),
+    )
+
+
+def enable(pattern: str = "*", decorator: Optional[str] = None) -> int:
+    """Enable the matching decorators (see :code:`registrations`), and
+    return how many were changed"""
+    return _set_enabled(pattern, decorator, True)
+
+
+def disable(pattern: str = "*", decorator: Optional[str] = None) -> int:
+    """Disable the matching decorators (see :code:`registrations`), and
+    return how many were changed
+
+    Disabled decorators call the decorated function directly, at the cost
+    of a single attribute check. Decorators that are not toggleable, such
+    as :code:`fromenv`, are left enabled.
+
+    Examples:
+        Switch off all instrumentation of a hot module during an incident:
+
+        >>> disable("myapp.hot.*")
+        3
+        >>> enable("myapp.hot.*", decorator="timeit")
+        1
+    """
+    return _set_enabled(pattern, decorator, False)
+
+
+def _set_enabled(
+    pattern: str,
+    decorator: Optional[str],
+    enabled: bool,
+) -> int:
+    changed = 0
+    for registration in registrations(pattern, decorator):
+        if registration.toggleable and registration.enabled != enabled:
+            registration.enabled = enabled
+            changed += 1
+    return changed
+
+
+def stats(
+    pattern: str = "*",
+    decorator: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """Return the stats of the matching registrations, see
+    :code:`Registration.stats`"""
+    return [
+        registration.stats()
+        for registration in registrations(pattern, decorator)
+    ]
@@ -0,0 +1,204 @@
+import builtins
+from collections.abc import Mapping, Sequence, Set
+import itertools
+import reprlib
+from typing import Any, Callable, Dict, Optional
+
+
+#: Type signature of a summarizer registered with :code:`BoundedRepr`. It
+#: accepts the bounded repr engine, the object and the remaining nesting level
+#: and returns a string.
+SUMMARIZER_TYPE = Callable[["BoundedRepr", Any, int], str]
+
+
+def _truncate(s: str, limit: int, fillvalue: str) -> str:
+    if len(s) <= limit:
+        return s
+    i = max(0, (limit - len(fillvalue)) // 2)
+    j = max(0, limit - len(fillvalue) - i)
+    return s[:i] + fillvalue + s[len(s)-j:]
+
+
+class BoundedRepr(reprlib.Repr):
+    """A :code:`reprlib.Repr` whose output size never depends on input size
+
+    Unlike :code:`reprlib.Repr`, containers of any type are never fully
+    sorted, copied or :code:`repr`'d before being truncated, and array-like
+    objects (anything with :code:`shape` and :code:`dtype` attributes, e.g.,
+    numpy arrays or pandas series) and data frames are summarized by their
+    shape instead of their contents.
+
+    Args:
+        maxlevel: maximum nesting depth of containers
+        maxitems: maximum number of items shown for any container
+        maxstring: maximum length of the repr of a string or bytes
+        maxother: maximum length of the repr of any other object
+        maxchars: maximum length of the whole result
+
+    Examples:
+        >>> r = BoundedRepr(maxitems=3)
+        >>> r.repr(list(range(10**6)))
+        '[0, 1, 2, ...] (len=1000000)'
+        >>> r.repr(numpy.zeros((1000, 1000)))
+        'ndarray(shape=(1000, 1000), dtype=float64)'
+        >>> r.register(Decimal, lambda r, x, level: f"Decimal({x})")
+    """
+    def __init__(
+        self,
+        *,
+        maxlevel: int = 3,
+        maxitems: int = 10,
+        maxstring: int = 80,
+        maxother: int = 80,
+        maxchars: int = 1000,
+    ):
+        super().__init__()
+        # Only an attribute of reprlib.Repr since Python 3.11
+        self.fillvalue = "..."
+        self.maxlevel = maxlevel
+        self.maxtuple = self.maxlist = self.maxarray = self.maxdict = \
+            self.maxset = self.maxfrozenset = self.maxdeque = maxitems
+        self.maxitems = maxitems
+        self.maxstring = maxstring
+        self.maxlong = maxother
+        self.maxother = maxother
+        self.maxchars = maxchars
+        self.summarizers: Dict[type, SUMMARIZER_TYPE] = {}
+
+    def register(self, cls: type, summarizer: SUMMARIZER_TYPE):
+        """Use `summarizer` for instances of `cls` and its subclasses"""
+        self.summarizers[cls] = summarizer
+
+    def repr(self, x: Any) -> str:
+        return _truncate(
+            self.repr1(x, self.maxlevel), self.maxchars, self.fillvalue
+        )
+
+    def repr1(self, x: Any, level: int) -> str:
+        if self.summarizers:
+            for cls in type(x).__mro__:
+                summarizer = self.summarizers.get(cls)
+                if summarizer is not None:
+                    return summarizer(self, x, level)
+        if isinstance(x, (bytes, bytearray, memoryview)):
+            return self.repr_bytes(x, level)
+        if isinstance(x, str):
+            return self.repr_str(x, level)
+        if isinstance(x, int):
+            return self.repr_int(x, level)
+        if isinstance(x, (float, complex, range, type(None))):
+            return self.repr_instance(x, level)
+        if hasattr(x, "shape") and (
+            hasattr(x, "dtype") or hasattr(x, "columns")
+        ):
+            return self.repr_arraylike(x, level)
+        if isinstance(x, Mapping):
+            return self.repr_mapping(x, level)
+        if isinstance(x, (Sequence, Set)):
+            return self.repr_collection(x, level)
+        return self.repr_instance(x, level)
+
+    def repr_bytes(self, x: Any, level: int) -> str:
+        n = x.nbytes if isinstance(x, memoryview) else len(x)
+        head = bytes(x[:self.maxstring])
+        s = builtins.repr(head)
+        if isinstance(x, bytearray):
+            s = f"bytearray({s})"
+        elif isinstance(x, memoryview):
+            s = f"memoryview({s})"
+        if n > len(head):
+            s = f"{s[:self.maxstring]}{self.fillvalue} (len={n})"
+        return s
+
+    def repr_arraylike(self, x: Any, level: int) -> str:
+        name = type(x).__name__
+        try:
+            shape = tuple(x.shape)
+        except Exception:
+            return self.repr_instance(x, level)
+        dtype = getattr(x, "dtype", None)
+        if dtype is not None:
+            return f"{name}(shape={shape}, dtype={dtype})"
+        columns = list(itertools.islice(x.columns, self.maxitems))
+        return f"{name}(shape={shape}, columns={self.repr1(columns, level)})"
+
+    def repr_mapping(self, x: Mapping, level: int) -> str:
+        n = len(x)
+        left, right = "{", "}"
+        if type(x) is not dict:
+            left, right = f"{type(x).__name__}({{", "})"
+        if n == 0:
+            return left + right
+        if level <= 0:
+            return left + self.fillvalue + right
+        pieces = [
+            f"{self.repr1(k, level-1)}: {self.repr1(v, level-1)}"
+            for k, v in itertools.islice(x.items(), self.maxitems)
+        ]
+        return self._join(pieces, n, left, right)
+
+    def repr_collection(self, x: Any, level: int) -> str:
+        n = len(x)
+        if not n and type(x) in (set, frozenset):
+            return f"{type(x).__name__}()"
+        if isinstance(x, list):
+            left, right = "[", "]"
+        elif isinstance(x, tuple):
+            left, right = "(", ",)" if n == 1 else ")"
+        elif type(x) is set:
+            left, right = "{", "}"
+        elif type(x) is frozenset:
+            left, right = "frozenset({", "})"
+        else:
+            left, right = f"{type(x).__name__}([", "])"
+        if n and level <= 0:
+            return left + self.fillvalue + right
+        pieces = [
+            self.repr1(item, level-1)
+            for item in itertools.islice(x, self.maxitems)
+        ]
+        return self._join(pieces, n, left, right)
+
+    def repr_instance(self, x: Any, level: int) -> str:
+        return _truncate(
+            super().repr_instance(x, level), self.maxother, self.fillvalue
+        )
+
+    def _join(self, pieces: list, n: int, left: str, right: str) -> str:
+        if n > len(pieces):
+            pieces.append(self.fillvalue)
+            return f"{left}{', '.join(pieces)}{right} (len={n})"
+        return f"{left}{', '.join(pieces)}{right}"
+
+
+_default_repr = BoundedRepr()
+
+
+def get_default_repr() -> BoundedRepr:
+    """Return the engine used by :code:`bounded_repr`"""
+    return _default_repr
+
+
+def set_default_repr(value: Optional[BoundedRepr] = None, **limits: int):
+    """Replace the engine used by :code:`bounded_repr` and, through it, by
+    the default formatters of :code:`logit`
+
+    Args:
+        value: the new engine. If None, then a :code:`BoundedRepr` is created
+            from `limits`.
+        limits: keyword arguments of :code:`BoundedRepr`
+
+    Examples:
+        >>> set_default_repr(maxitems=3, maxchars=200)
+    """
+    global _default_repr
+    if value is None:
+        value = BoundedRepr(**limits)
+    elif limits:
+        raise ValueError("Provide either a BoundedRepr or limits, not both")
+    _default_repr = value
+
+
+def bounded_repr(x: Any) -> str:
+    """Return the repr of `x` bounded by the default :code:`BoundedRepr`"""
+    return _default_repr.repr(x)
@@ -0,0 +1,134 @@
+import copy
+import itertools
+import random
+import threading
+import time
+from typing import Optional, Union
+
+
+class Sampler:
+    """Sampling policy deciding which calls of a function are logged
+
+    The base policy samples every call. Subclasses sample fewer calls. Any
+    policy can also keep outliers: calls that were not sampled are logged
+    anyway, once they finish, if they were slow or raised an exception.
+
+    Each decorated function gets its own copy of the policy (see
+    :code:`bind`), so stateful policies such as rate limits apply per
+    function.
+
+    Args:
+        slow_ms: if not None, then calls taking at least this many
+            milliseconds are always logged.
+        exceptions: if True, then calls raising an exception are always
+            logged.
+    """
+    def __init__(
+        self,
+        *,
+        slow_ms: Optional[float] = None,
+        exceptions: bool = False,
+    ):
+        self.slow_ms = slow_ms
+        self.exceptions = exceptions
+        self._init_state()
+
+    def _init_state(self):
+        """Initialize mutable, per-function state"""
+        pass
+
+    @property
+    def outliers(self) -> bool:
+        """Whether unsampled calls may still be kept once finished"""
+        return self.slow_ms is not None or self.exceptions
+
+    def bind(self) -> "Sampler":
+        """Return a copy of this policy with its own state"""
+        clone = copy.copy(self)
+        clone._init_state()
+        return clone
+
+    def sample(self) -> bool:
+        """Decide, before the call, whether to log it"""
+        return True
+
+    def keep(self, seconds: float, excp: Optional[BaseException]) -> bool:
+        """Decide, after an unsampled call, whether to log it anyway"""
+        return (
+            (excp is not None and self.exceptions) or
+            (self.slow_ms is not None and seconds * 1000 >= self.slow_ms)
+        )
+
+
+class ProbabilitySampler(Sampler):
+    """Sample each call with fixed `probability`"""
+    def __init__(self, probability: float, **kwargs):
+        if not 0 <= probability <= 1:
+            raise ValueError(f"{probability} is not a probability")
+        self.probability = probability
+        super().__init__(**kwargs)
+
+    def sample(self) -> bool:
+        return random.random() < self.probability
+
+
+class EveryNthSampler(Sampler):
+    """Sample one call in every `n`, starting with the first one"""
+    def __init__(self, n: int, **kwargs):
+        if n < 1:
+            raise ValueError(f"n must be at least 1, got {n}")
+        self.n = n
+        super().__init__(**kwargs)
+
+    def _init_state(self):
+        self._counter = itertools.count()
+
+    def sample(self) -> bool:
+        return next(self._counter) % self.n == 0
+
+
+class RateLimitSampler(Sampler):
+    """Sample at most `per_second` calls per second, with bursts of up to
+    `burst` calls (default: `per_second`)"""
+    def __init__(
+        self,
+        per_second: float,
+        burst: Optional[float] = None,
+        **kwargs,
+    ):
+        if per_second <= 0:
+            raise ValueError(f"per_second must be positive, got {per_second}")
+        self.per_second = per_second
+        self.burst = per_second if burst is None else burst
+        super().__init__(**kwargs)
+
+    def _init_state(self):
+        self._lock = threading.Lock()
+        self._tokens = self.burst
+        self._last = time.monotonic()
+
+    def sample(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._last) * self.per_second
+            )
+            self._last = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+
+#: Type of the :code:`sample` option of decorators. A float is a shorthand
+#: for :code:`ProbabilitySampler(float)`.
+SAMPLE_TYPE = Union[Sampler, float]
+
+
+def as_sampler(sample: Optional[SAMPLE_TYPE]) -> Optional[Sampler]:
+    """Return a sampling policy bound to a single decorated function"""
+    if sample is None:
+        return None
+    if isinstance(sample, Sampler):
+        return sample.bind()
+    return ProbabilitySampler(sample)
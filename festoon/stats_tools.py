@@ -0,0 +1,212 @@
+import math
+import threading
+import weakref
+from typing import Dict, Iterable, List, NamedTuple
+
+
+class LatencySummary(NamedTuple):
+    """Summary statistics of recorded durations, in seconds"""
+    count: int
+    total: float
+    min: float
+    max: float
+    p50: float
+    p90: float
+    p99: float
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else math.nan
+
+
+class Histogram:
+    """Compact histogram of positive values with bounded relative error
+
+    Values are counted in log-linear buckets, in the style of HDR histograms:
+    each power of two is split into `subbuckets` linear buckets, so quantiles
+    are accurate to within about :code:`1/subbuckets` relative error,
+    whatever the range of values. Only non-empty buckets are stored.
+
+    Histograms are not thread-safe; see :code:`ShardedHistogram`.
+
+    Args:
+        subbuckets: number of buckets per power of two.
+    """
+    def __init__(self, subbuckets: int = 64):
+        self.subbuckets = subbuckets
+        self.buckets: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _index(self, value: float) -> int:
+        if value <= 0:
+            return -(2**62)  # single bucket for zero and below
+        mantissa, exponent = math.frexp(value)
+        return exponent * self.subbuckets + int(
+            (mantissa - 0.5) * 2 * self.subbuckets
+        )
+
+    def _value(self, index: int) -> float:
+        if index == -(2**62):
+            return 0.0
+        exponent, sub = divmod(index, self.subbuckets)
+        return math.ldexp(0.5 + (sub + 0.5) / (2 * self.subbuckets), exponent)
+
+    def record(self, value: float):
+        index = self._index(value)
+        buckets = self.buckets
+        buckets[index] = buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: "Histogram"):
+        """Add the counts of `other` (with the same subbuckets) to this one"""
+        buckets = self.buckets
+        for index, count in list(other.buckets.items()):
+            buckets[index] = buckets.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantiles(self, qs: Iterable[float]) -> List[float]:
+        """Return approximate quantiles for each `q` in [0, 1] of `qs`"""
+        qs = list(qs)
+        if not self.count:
+            return [math.nan] * len(qs)
+        targets = sorted((q * self.count, i) for i, q in enumerate(qs))
+        result = [0.0] * len(qs)
+        items = iter(sorted(self.buckets.items()))
+        index, count = next(items)
+        cumulative = count
+        for target, i in targets:
+            while cumulative < target:
+                index, count = next(items)
+                cumulative += count
+            result[i] = min(max(self._value(index), self.min), self.max)
+        return result
+
+    def quantile(self, q: float) -> float:
+        return self.quantiles([q])[0]
+
+    def summary(self) -> LatencySummary:
+        if not self.count:
+            return LatencySummary(0, 0.0, math.nan, math.nan,
+                                  math.nan, math.nan, math.nan)
+        p50, p90, p99 = self.quantiles([0.5, 0.9, 0.99])
+        return LatencySummary(
+            self.count, self.total, self.min, self.max, p50, p90, p99
+        )
+
+
+class _ShardOwner:
+    """Held by the thread-local storage of a thread only, so that it is
+    collected when the thread ends"""
+    __slots__ = ("shard", "__weakref__")
+
+    def __init__(self, shard):
+        self.shard = shard
+
+
+class ShardedHistogram:
+    """Histogram that can be recorded to from many threads without locking
+
+    Each thread records into its own :code:`Histogram` shard. Shards are only
+    merged when a snapshot is taken, so recording never contends with other
+    threads. The shards of threads that ended are folded into a single one,
+    so that the number of shards is bounded by the number of live threads.
+    Snapshots taken while other threads record may miss the values being
+    recorded at that instant.
+
+    Args:
+        subbuckets: number of buckets per power of two, see
+            :code:`Histogram`.
+    """
+    def __init__(self, subbuckets: int = 64):
+        self.subbuckets = subbuckets
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._shards: List[Histogram] = []
+        #: Values recorded by threads that ended
+        self._ended = Histogram(subbuckets)
+
+    def _new_shard(self) -> Histogram:
+        shard = Histogram(self.subbuckets)
+        owner = _ShardOwner(shard)
+        # Not a bound method, which would keep this histogram alive for as
+        # long as the thread
+        weakref.finalize(owner, _fold_shard, weakref.ref(self), shard)
+        with self._lock:
+            self._shards.append(shard)
+            self._local.owner = owner
+        return shard
+
+    def record(self, value: float):
+        try:
+            shard = self._local.owner.shard
+        except AttributeError:
+            shard = self._new_shard()
+        shard.record(value)
+
+    def snapshot(self) -> Histogram:
+        """Return a new histogram merging all shards"""
+        result = Histogram(self.subbuckets)
+        with self._lock:
+            result.merge(self._ended)
+            shards = list(self._shards)
+        for shard in shards:
+            result.merge(shard)
+        return result
+
+    def summary(self) -> LatencySummary:
+        return self.snapshot().summary()
+
+    def reset(self):
+        """Discard all recorded values"""
+        with self._lock:
+            local, self._local = self._local, threading.local()
+            self._shards = []
+            self._ended = Histogram(self.subbuckets)
+        # Dropped outside of the lock, which folding the shards it owns
+        # takes
+        del local
+
+
+def _fold_shard(ref: "weakref.ref[ShardedHistogram]", shard: Histogram):
+    """Fold the shard of a thread that ended into the values of ended
+    threads of its histogram, if neither was dropped in the meantime"""
+    histogram = ref()
+    if histogram is None:
+        return
+    with histogram._lock:
+        # Identity, Histogram does not define equality
+        for i, other in enumerate(histogram._shards):
+            if other is shard:
+                del histogram._shards[i]
+                histogram._ended.merge(shard)
+                return
+
+
+def format_summary(summary: LatencySummary, unit: str = "ms") -> str:
+    """Format `summary` as space separated key=value pairs
+
+    Args:
+        summary: statistics to format
+        unit: one of "s", "ms" or "us"
+    """
+    scale = {"s": 1, "ms": 1e3, "us": 1e6}[unit]
+    return (
+        f"count={summary.count} "
+        f"mean={summary.mean*scale:.3f}{unit} "
+        f"min={summary.min*scale:.3f}{unit} "
+        f"p50={summary.p50*scale:.3f}{unit} "
+        f"p90={summary.p90*scale:.3f}{unit} "
+        f"p99={summary.p99*scale:.3f}{unit} "
+        f"max={summary.max*scale:.3f}{unit}"
+    )
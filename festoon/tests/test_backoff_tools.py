@@ -0,0 +1,69 @@
+import itertools
+import random
+import unittest
+from unittest import mock
+
+from festoon.backoff_tools import Backoff, ExponentialBackoff
+
+
+class TestExponentialBackoff(unittest.TestCase):
+    def test_no_jitter(self):
+        self.assertEqual(
+            [1.0, 2.0, 4.0, 8.0], list(ExponentialBackoff(max_retries=4))
+        )
+
+    def test_max_delay(self):
+        self.assertEqual(
+            [0.5, 1.0, 1.5, 1.5],
+            list(ExponentialBackoff(0.5, max_delay=1.5, max_retries=4)),
+        )
+
+    def test_reiterable(self):
+        backoff = ExponentialBackoff(max_retries=3)
+        self.assertEqual(list(backoff), list(backoff))
+
+    def test_infinite(self):
+        backoff = ExponentialBackoff(max_delay=10, max_retries=None)
+        delays = list(itertools.islice(backoff, 1000))
+        self.assertEqual(1000, len(delays))
+        self.assertEqual(10.0, delays[-1])
+
+    def test_jitter_bounds(self):
+        rng = random.Random(0)
+        for jitter, low, high in [
+            ("full", lambda d: 0, lambda d: d),
+            ("equal", lambda d: d / 2, lambda d: d),
+        ]:
+            backoff = ExponentialBackoff(jitter=jitter, rng=rng)
+            expected = list(ExponentialBackoff())
+            for delay, exponential in zip(backoff, expected):
+                self.assertGreaterEqual(delay, low(exponential))
+                self.assertLessEqual(delay, high(exponential))
+
+    def test_decorrelated_jitter(self):
+        backoff = ExponentialBackoff(
+            jitter="decorrelated", max_delay=5, max_retries=100,
+            rng=random.Random(0),
+        )
+        delays = list(backoff)
+        self.assertTrue(all(1 <= delay <= 5 for delay in delays))
+        self.assertGreater(len(set(delays)), 1)
+
+    def test_invalid_jitter(self):
+        with self.assertRaises(ValueError):
+            ExponentialBackoff(jitter="bogus")
+
+
+class TestDeadline(unittest.TestCase):
+    def test_deadline_shortens_and_stops(self):
+        class Constant(Backoff):
+            def delays(self):
+                return itertools.repeat(4.0)
+
+        now = [0.0]
+        with mock.patch("time.monotonic", side_effect=lambda: now[0]):
+            delays = []
+            for delay in Constant(deadline=10):
+                delays.append(delay)
+                now[0] += delay
+        self.assertEqual([4.0, 4.0, 2.0], delays)
@@ -0,0 +1,47 @@
+import contextlib
+import io
+import unittest
+from unittest import mock
+
+from festoon import bench
+
+
+class TestThresholds(unittest.TestCase):
+    """Timings depend on the load of the machine, so their thresholds are
+    checked by `python -m festoon.bench --check`, a separate CI step. Memory
+    does not."""
+    def setUp(self):
+        # Fewer calls than a real run
+        patcher = mock.patch.object(bench, "NUMBER", 2_000)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_memory(self):
+        results = bench.bench_memory()
+        self.assertEqual(0, results["docfill"])
+        self.assertEqual([], bench.check("memory", results))
+
+    def test_check(self):
+        results = {"undecorated": 100, "retry (no failure)": 5_000}
+        failures = bench.check("retry", {
+            **results, "retry (registry disabled)": 200,
+        })
+        self.assertEqual(1, len(failures))
+        self.assertRegex(failures[0], r"^retry retry \(no failure\): 4900 ")
+
+    def test_main_fails_over_threshold(self):
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        thresholds = {"retry": {"retry (no failure)": 0}}
+        with mock.patch.dict(bench.THRESHOLDS, thresholds):
+            with contextlib.redirect_stdout(stdout):
+                with contextlib.redirect_stderr(stderr):
+                    with self.assertRaises(SystemExit) as raised:
+                        bench.main(["retry", "--check"])
+        self.assertEqual(1, raised.exception.code)
+        self.assertIn("retry retry (no failure)", stdout.getvalue())
+        self.assertIn("over the threshold of 0 ns/call", stderr.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
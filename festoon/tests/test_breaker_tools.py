@@ -0,0 +1,77 @@
+import unittest
+from unittest import mock
+
+from festoon.breaker_tools import CircuitBreaker, CircuitOpenError, RetryBudget
+
+
+class TestRetryBudget(unittest.TestCase):
+    def test_budget_spent_and_replenished_by_calls(self):
+        with mock.patch("time.monotonic", return_value=0.0):
+            budget = RetryBudget(ratio=0.5, min_per_second=0, max_tokens=1)
+            self.assertTrue(budget.try_spend())
+            self.assertFalse(budget.try_spend())
+            budget.record_call()
+            budget.record_call()
+            self.assertTrue(budget.try_spend())
+
+        self.assertEqual(
+            {"tokens": 0, "calls": 2, "retries": 2, "rejected": 1},
+            budget.stats(),
+        )
+
+    def test_budget_replenished_over_time(self):
+        with mock.patch("time.monotonic", return_value=0.0) as monotonic:
+            budget = RetryBudget(ratio=0, min_per_second=2, max_tokens=1)
+            self.assertTrue(budget.try_spend())
+            self.assertFalse(budget.try_spend())
+            monotonic.return_value = 0.5
+            self.assertTrue(budget.try_spend())
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_state_transitions(self):
+        with mock.patch("time.monotonic", return_value=0.0) as monotonic:
+            breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+            self.assertEqual("closed", breaker.state)
+
+            breaker.record_failure()
+            self.assertTrue(breaker.allow())
+            breaker.record_failure()
+            self.assertEqual("open", breaker.state)
+            self.assertFalse(breaker.allow())
+            with self.assertRaises(CircuitOpenError):
+                breaker.check()
+
+            monotonic.return_value = 10.0
+            self.assertEqual("half-open", breaker.state)
+            self.assertTrue(breaker.allow())
+            self.assertFalse(breaker.allow())
+            breaker.record_failure()
+            self.assertEqual("open", breaker.state)
+
+            monotonic.return_value = 20.0
+            self.assertTrue(breaker.allow())
+            breaker.record_success()
+            self.assertEqual("closed", breaker.state)
+
+        self.assertEqual(
+            {"state": "closed", "successes": 1, "failures": 3,
+             "rejected": 3, "opened": 2},
+            breaker.stats(),
+        )
+
+    def test_cancelled_trial_gives_back_slot(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_cancelled()
+        self.assertEqual("half-open", breaker.state)
+        self.assertTrue(breaker.allow())
+
+    def test_success_resets_consecutive_failures(self):
+        breaker = CircuitBreaker(failure_threshold=2)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        self.assertEqual("closed", breaker.state)
@@ -0,0 +1,176 @@
+import asyncio
+import threading
+import time
+import unittest
+from unittest import mock
+
+from festoon.cache_tools import cacheit
+
+
+def _function(mocked):
+    def func(*args, **kwargs):
+        return mocked(*args, **kwargs)
+    return func
+
+
+class TestCacheit(unittest.TestCase):
+    def test_hit_and_miss(self):
+        fn = mock.Mock(side_effect=lambda x, y=1: x + y)
+        func = cacheit(_function(fn))
+
+        self.assertEqual(3, func(1, y=2))
+        self.assertEqual(3, func(1, y=2))
+        self.assertEqual(2, func(1))
+        self.assertEqual(2, fn.call_count)
+        info = func.cache_info()
+        self.assertEqual((1, 2, 2), (info.hits, info.misses, info.currsize))
+
+        func.cache_clear()
+        func(1)
+        self.assertEqual(3, fn.call_count)
+
+    def test_logging(self):
+        @cacheit
+        def func(x):
+            return x
+
+        with self.assertLogs(level="DEBUG") as logs:
+            func(1)
+            func(1)
+        self.assertRegex(logs.output[0], r"CACHE MISS \S*func\(x=1\)$")
+        self.assertRegex(logs.output[1], r"CACHE HIT \S*func\(x=1\)$")
+
+    def test_lru(self):
+        fn = mock.Mock(side_effect=lambda x: x)
+        func = cacheit(_function(fn), maxsize=2)
+        for x in (1, 2, 1, 3, 1, 2):
+            func(x)
+        # 2 was evicted by 3, then 3 by 2
+        self.assertEqual([1, 2, 3, 2], [c.args[0] for c in fn.call_args_list])
+        self.assertEqual(2, func.cache_info().evictions)
+
+    def test_lfu(self):
+        fn = mock.Mock(side_effect=lambda x: x)
+        func = cacheit(_function(fn), maxsize=2, policy="lfu")
+        for x in (1, 1, 2, 3, 2, 1):
+            func(x)
+        # 2 and then 3 were the least frequently used
+        self.assertEqual([1, 2, 3, 2], [c.args[0] for c in fn.call_args_list])
+
+    def test_ttl(self):
+        fn = mock.Mock(return_value=1)
+        func = cacheit(_function(fn), ttl=10)
+        with mock.patch("time.monotonic", return_value=100.0):
+            func()
+            func()
+        with mock.patch("time.monotonic", return_value=110.0):
+            func()
+        self.assertEqual(2, fn.call_count)
+        self.assertEqual(1, func.cache_info().expirations)
+
+    def test_key(self):
+        fn = mock.Mock(side_effect=lambda x, session: x)
+        func = cacheit(_function(fn), key=lambda x, session: x)
+        func(1, object())
+        func(1, object())
+        fn.assert_called_once()
+
+    def test_exceptions_not_cached(self):
+        fn = mock.Mock(side_effect=[KeyError, 1])
+        func = cacheit(_function(fn))
+        with self.assertRaises(KeyError):
+            func()
+        self.assertEqual(1, func())
+        self.assertEqual(1, func())
+        self.assertEqual(2, fn.call_count)
+
+    def test_single_flight(self):
+        started = threading.Event()
+        release = threading.Event()
+        fn = mock.Mock()
+
+        @cacheit
+        def func(x):
+            fn(x)
+            started.set()
+            release.wait(5)
+            return x * 2
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(func(21)))
+            for _ in range(5)
+        ]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        time.sleep(0.05)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([42] * 5, results)
+        fn.assert_called_once_with(21)
+        self.assertEqual(4, func.cache_info().waits)
+
+    def test_disabled(self):
+        fn = mock.Mock(return_value=1)
+        func = cacheit(_function(fn))
+        func.registration.enabled = False
+        func()
+        func()
+        self.assertEqual(2, fn.call_count)
+
+    def test_async_generator_rejected(self):
+        async def gen():
+            yield 1
+
+        with self.assertRaises(ValueError):
+            cacheit(gen)
+
+
+class TestCacheitAsync(unittest.IsolatedAsyncioTestCase):
+    async def test_single_flight(self):
+        calls = 0
+
+        @cacheit
+        async def func(x):
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return x * 2
+
+        results = await asyncio.gather(*(func(21) for _ in range(5)))
+        self.assertEqual([42] * 5, results)
+        self.assertEqual(1, calls)
+        self.assertEqual(42, await func(21))
+        info = func.cache_info()
+        self.assertEqual((1, 1, 4), (info.hits, info.misses, info.waits))
+
+    async def test_shared_exception(self):
+        @cacheit
+        async def func():
+            await asyncio.sleep(0.01)
+            raise KeyError
+
+        results = await asyncio.gather(
+            func(), func(), return_exceptions=True
+        )
+        self.assertEqual([KeyError, KeyError], [type(r) for r in results])
+
+    async def test_cancelled_leader(self):
+        @cacheit
+        async def func():
+            await asyncio.sleep(0.05)
+            return 1
+
+        leader = asyncio.ensure_future(func())
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(func())
+        await asyncio.sleep(0)
+        leader.cancel()
+        self.assertEqual(1, await waiter)
+
+
+if __name__ == "__main__":
+    unittest.main()
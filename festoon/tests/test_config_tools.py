@@ -0,0 +1,209 @@
+import os
+import tempfile
+import time
+from typing import NamedTuple
+import unittest
+from unittest import mock
+
+from festoon import config_tools
+from festoon.config_tools import (
+    Config, DotEnvSource, IniSource, JsonSource, source_for, TomlSource,
+)
+from festoon.environment_tools import fromenv
+from festoon.parse_tools import ParseError
+
+
+class _TempDir(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.directory = tmpdir.name
+
+    def write(self, name: str, text: str) -> str:
+        path = os.path.join(self.directory, name)
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+
+class TestSources(_TempDir):
+    def test_dotenv(self):
+        path = self.write(".env", "\n".join([
+            "# comment",
+            "A=1",
+            "export B = two words  # comment",
+            'C="quoted # not a comment\\n"',
+            "D='single'",
+            "E=",
+        ]))
+        self.assertEqual(
+            {
+                "A": "1", "B": "two words", "C": "quoted # not a comment\n",
+                "D": "single", "E": "",
+            },
+            DotEnvSource(path).load(),
+        )
+
+    def test_dotenv_invalid_line(self):
+        path = self.write(".env", "A=1\nnot a variable\n")
+        with self.assertRaisesRegex(ValueError, ":2: invalid line"):
+            DotEnvSource(path).load()
+
+    def test_json(self):
+        path = self.write("config.json", (
+            '{"db": {"table_name": "events", "batch": 5, "ids": [1, 2]},'
+            ' "debug": true}'
+        ))
+        self.assertEqual(
+            {
+                "DB_TABLE_NAME": "events", "DB_BATCH": "5",
+                "DB_IDS": "[1, 2]", "DEBUG": "true",
+            },
+            JsonSource(path).load(),
+        )
+
+    @unittest.skipIf(config_tools.tomllib is None, "requires tomllib")
+    def test_toml(self):
+        path = self.write("config.toml", (
+            'debug = false\n[db]\ntable_name = "events"\n'
+        ))
+        self.assertEqual(
+            {"DEBUG": "false", "DB_TABLE_NAME": "events"},
+            TomlSource(path).load(),
+        )
+
+    def test_toml_unavailable(self):
+        path = self.write("config.toml", "a = 1\n")
+        with mock.patch.object(config_tools, "tomllib", None):
+            with self.assertRaisesRegex(ImportError, "tomli"):
+                TomlSource(path).load()
+
+    @unittest.skipIf(config_tools.tomllib is None, "requires tomllib")
+    def test_toml_dates(self):
+        path = self.write("config.toml", (
+            "day = 2020-01-01\ndays = [2020-01-01]\n"
+        ))
+        self.assertEqual(
+            {"DAY": "2020-01-01", "DAYS": '["2020-01-01"]'},
+            TomlSource(path).load(),
+        )
+
+    def test_ini_section_overrides_default(self):
+        path = self.write("config.ini", (
+            "[DEFAULT]\ntimeout = 5\n[db]\ntimeout = 10\n[cache]\nsize = 1\n"
+        ))
+        self.assertEqual(
+            {"TIMEOUT": "5", "DB_TIMEOUT": "10", "CACHE_SIZE": "1"},
+            IniSource(path).load(),
+        )
+
+    def test_ini(self):
+        path = self.write("config.ini", (
+            "[DEFAULT]\ndebug = 1\n[db]\ntable_name = events\n"
+        ))
+        self.assertEqual(
+            {"DEBUG": "1", "DB_TABLE_NAME": "events"},
+            IniSource(path).load(),
+        )
+
+    def test_missing_file(self):
+        self.assertEqual({}, DotEnvSource("/nonexistent/.env").load())
+
+    def test_source_for(self):
+        self.assertIsInstance(source_for("a/.env"), DotEnvSource)
+        self.assertIsInstance(source_for("prod.env"), DotEnvSource)
+        self.assertIsInstance(source_for("a.json"), JsonSource)
+        self.assertIsInstance(source_for("a.toml"), TomlSource)
+        self.assertIsInstance(source_for("a.cfg"), IniSource)
+        with self.assertRaises(ValueError):
+            source_for("a.yaml")
+
+
+class TestConfig(_TempDir):
+    def test_precedence(self):
+        dotenv = self.write(".env", "DB_BATCH=100\n")
+        config_file = self.write(
+            "config.json", '{"db": {"table": "events", "batch": 500}}'
+        )
+        config = Config(dotenv, config_file)
+        self.assertEqual(
+            {"DB_TABLE": "events", "DB_BATCH": "100"}, dict(config.snapshot)
+        )
+        with self.assertRaises(TypeError):
+            config.snapshot["DB_TABLE"] = "other"
+
+    def test_reload(self):
+        path = self.write(".env", "A=1\n")
+        config = Config(path)
+        self.assertFalse(config.reload())
+        self.write(".env", "A=22\n")
+        self.assertTrue(config.reload())
+        self.assertEqual({"A": "22"}, dict(config.snapshot))
+
+    def test_reload_failure_keeps_snapshot(self):
+        path = self.write(".env", "A=1\n")
+        config = Config(path)
+        self.write(".env", "invalid line\n")
+        with self.assertRaises(ValueError):
+            config.reload()
+        self.assertEqual({"A": "1"}, dict(config.snapshot))
+
+    def test_watch(self):
+        path = self.write(".env", "A=1\n")
+        config = Config(path, watch=True, interval=0.01)
+        self.addCleanup(config.close)
+        self.write(".env", "A=22\n")
+        deadline = time.monotonic() + 2
+        while config.snapshot["A"] != "22" and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual("22", config.snapshot["A"])
+
+
+class TestFromenvConfig(_TempDir):
+    def test_layers(self):
+        config = Config(
+            self.write(".env", "DB_BATCH=100\n"),
+            self.write(
+                "config.json",
+                '{"db": {"table": "events", "batch": 500, "ids": [1, 2]}}',
+            ),
+        )
+
+        @fromenv(prefix="DB", config=config)
+        def func(table="test", batch: int = 10, ids=(), other=None):
+            return table, batch, list(ids), other
+
+        self.assertEqual(("events", 100, [1, 2], None), func())
+        with mock.patch.dict(os.environ, {"DB_BATCH": "1"}):
+            self.assertEqual(("events", 1, [1, 2], None), func())
+            self.assertEqual(("events", 2, [1, 2], None), func(batch=2))
+
+    def test_class_resolved_again_after_reload(self):
+        config = Config(self.write(".env", "APP_WORKERS=2\n"))
+
+        @fromenv(prefix="APP", config=config, as_config=True)
+        class Settings(NamedTuple):
+            workers: int = 1
+
+        settings = Settings.from_env()
+        self.assertEqual(2, settings.workers)
+        self.assertIs(settings, Settings.from_env())
+        self.write(".env", "APP_WORKERS=16\n")
+        config.reload()
+        self.assertEqual(16, Settings.from_env().workers)
+
+    def test_invalid_value(self):
+        config = Config(self.write(".env", "FUNC_X=abc\n"))
+
+        @fromenv(config=config)
+        def func(x: int = 0):
+            return x
+
+        with self.assertRaisesRegex(
+            ParseError, "in configuration variable FUNC_X"
+        ):
+            func()
+
+
+if __name__ == "__main__":
+    unittest.main()
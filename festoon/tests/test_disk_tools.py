@@ -0,0 +1,194 @@
+import os
+import pickle
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from festoon.cache_tools import cacheit
+from festoon.disk_tools import DiskStore, source_hash
+
+
+class Blob:
+    """Pickled with its data out-of-band, like a numpy array"""
+    def __init__(self, data):
+        self.data = data
+
+    def __reduce_ex__(self, protocol):
+        return type(self), (pickle.PickleBuffer(self.data),)
+
+
+class TestDiskStore(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.directory = tmpdir.name
+        self.store = DiskStore(self.directory)
+
+    def test_roundtrip(self):
+        value = {"a": [1, 2.5, "x"], "b": b"bytes", "c": bytearray(b"ba")}
+        digest = self.store.key("ns", (1, "a"))
+        self.assertEqual((False, None), self.store.get(digest))
+        self.store.put(digest, value)
+        self.assertEqual((True, value), self.store.get(digest))
+        # Only the entry remains, no temporary file
+        files = [
+            name for _, _, names in os.walk(self.directory) for name in names
+        ]
+        self.assertEqual([digest[2:] + ".pkl"], files)
+
+    def test_key(self):
+        self.assertEqual(
+            self.store.key("ns", (1,)), self.store.key("ns", (1,))
+        )
+        self.assertNotEqual(
+            self.store.key("ns", (1,)), self.store.key("ns", (2,))
+        )
+        self.assertNotEqual(
+            self.store.key("ns", (1,)), self.store.key("other", (1,))
+        )
+
+    def test_out_of_band_buffers_are_mapped(self):
+        digest = self.store.key("ns", "blob")
+        self.store.put(digest, [Blob(bytearray(b"x" * 1000)), Blob(b"yz")])
+        found, (first, second) = self.store.get(digest)
+        self.assertTrue(found)
+        self.assertIsInstance(first.data, memoryview)
+        self.assertTrue(first.data.readonly)
+        self.assertEqual(b"x" * 1000, first.data.tobytes())
+        self.assertEqual(b"yz", second.data.tobytes())
+
+    def test_unreadable_entry_deleted(self):
+        digest = self.store.key("ns", 1)
+        self.store.put(digest, 1)
+        path = self.store._path(digest)
+        with open(path, "wb") as f:
+            f.write(b"garbage" * 10)
+        with self.assertLogs("festoon.disk_tools", "WARNING"):
+            self.assertEqual((False, None), self.store.get(digest))
+        self.assertFalse(os.path.exists(path))
+
+    def test_unpicklable_value_not_stored(self):
+        digest = self.store.key("ns", 1)
+        with self.assertLogs("festoon.disk_tools", "WARNING"):
+            self.store.put(digest, lambda: 1)
+        self.assertEqual((False, None), self.store.get(digest))
+
+    def test_eviction(self):
+        store = DiskStore(self.directory, max_bytes=3500)
+        digests = [store.key("ns", i) for i in range(3)]
+        for i, digest in enumerate(digests):
+            store.put(digest, b"x" * 1000)
+            # Order the entries by use, regardless of timestamp resolution
+            os.utime(store._path(digest), (i, i))
+        os.utime(store._path(digests[0]), (10, 10))
+        store.put(store.key("ns", 3), b"x" * 1000)
+        self.assertLessEqual(store.size(), 3500)
+        self.assertTrue(store.get(digests[0])[0])
+        self.assertFalse(store.get(digests[1])[0])
+        self.assertTrue(store.get(digests[2])[0])
+
+    def test_clear(self):
+        digest = self.store.key("ns", 1)
+        self.store.put(digest, 1)
+        self.store.clear()
+        self.assertEqual(0, self.store.size())
+        self.assertFalse(self.store.get(digest)[0])
+
+    def test_source_hash(self):
+        def func():
+            return 1
+
+        def other():
+            return 2
+
+        self.assertEqual(source_hash(func), source_hash(func))
+        self.assertNotEqual(source_hash(func), source_hash(other))
+
+
+class TestCacheitDisk(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.store = DiskStore(tmpdir.name)
+
+    def test_persistence(self):
+        calls = []
+
+        def func(x):
+            calls.append(x)
+            return x * 2
+
+        self.assertEqual(4, cacheit(func, disk=self.store)(2))
+        # As after a restart
+        cached = cacheit(func, disk=self.store)
+        with self.assertLogs(level="DEBUG") as logs:
+            self.assertEqual(4, cached(2))
+        self.assertRegex(logs.output[0], r"CACHE DISK HIT \S*func\(x=2\)$")
+        self.assertEqual([2], calls)
+        info = cached.cache_info()
+        self.assertEqual((1, 1), (info.misses, info.disk_hits))
+
+    def test_exceptions_not_stored(self):
+        def func():
+            raise KeyError
+
+        with self.assertRaises(KeyError):
+            cacheit(func, disk=self.store)()
+        self.assertEqual(0, self.store.size())
+
+    def test_unpicklable_key(self):
+        lock = threading.Lock()
+        calls = []
+
+        def func(x):
+            calls.append(x)
+            return 1
+
+        cached = cacheit(func, disk=self.store)
+        with self.assertLogs("festoon.cache_tools", "WARNING") as logs:
+            self.assertEqual(1, cached(lock))
+        self.assertIn("unpicklable key", logs.output[0])
+        # Still cached in memory
+        self.assertEqual(1, cached(lock))
+        self.assertEqual([lock], calls)
+        self.assertEqual(0, self.store.size())
+
+    def test_store_errors_logged(self):
+        cached = cacheit(lambda x: x * 2, disk=self.store)
+        with mock.patch.object(self.store, "get", side_effect=OSError):
+            with mock.patch.object(self.store, "put", side_effect=OSError):
+                with self.assertLogs("festoon.cache_tools", "WARNING") as logs:
+                    self.assertEqual(4, cached(2))
+        self.assertEqual(2, len(logs.output))
+
+
+class TestCacheitDiskAsync(unittest.IsolatedAsyncioTestCase):
+    async def test_persistence(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        store = DiskStore(tmpdir.name)
+        calls = []
+
+        async def func(x):
+            calls.append(x)
+            return x * 2
+
+        self.assertEqual(4, await cacheit(func, disk=store)(2))
+        self.assertEqual(4, await cacheit(func, disk=store)(2))
+        self.assertEqual([2], calls)
+
+    async def test_unpicklable_key(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+
+        async def func(x):
+            return 1
+
+        cached = cacheit(func, disk=DiskStore(tmpdir.name))
+        with self.assertLogs("festoon.cache_tools", "WARNING"):
+            self.assertEqual(1, await cached(threading.Lock()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,13 @@
 from contextlib import contextmanager
+import dataclasses
 import os
-from typing import Any, Dict
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional
 import unittest
+from unittest import mock
 
 from festoon.environment_tools import fromenv
+from festoon.parse_tools import ParseError
 
 
 @contextmanager
@@ -77,3 +81,203 @@ class TestLogit(unittest.TestCase):
             with _temp_env({"FUNC_X": 100, "FUNC_Y": -1}):
                 result = func()
             self.assertEqual(142, result)
+
+    def test_fromenv_positional_not_overridden(self):
+        @fromenv
+        def func(x: int = 0, y: int = 42):
+            return x + y
+
+        with _temp_env({"FUNC_X": 100}):
+            result = func(1)
+        self.assertEqual(43, result)
+
+    def test_fromenv_cast_cached_until_value_changes(self):
+        caster = mock.Mock(side_effect=int)
+
+        # The default is None, so that int is never tried before caster
+        @fromenv
+        def func(x: caster = None):
+            return x
+
+        with _temp_env({"FUNC_X": 1}):
+            self.assertEqual(1, func())
+            self.assertEqual(1, func())
+        self.assertEqual(1, caster.call_count)
+
+        with _temp_env({"FUNC_X": 2}):
+            self.assertEqual(2, func())
+        self.assertEqual(2, caster.call_count)
+
+        func.refresh()
+        with _temp_env({"FUNC_X": 2}):
+            self.assertEqual(2, func())
+        self.assertEqual(3, caster.call_count)
+
+    def test_fromenv_mutable_values_not_shared(self):
+        @fromenv
+        def func(xs: List[int] = (), options: dict = None):
+            xs.append(99)
+            options["seen"] = True
+            return xs, options
+
+        with _temp_env({"FUNC_XS": "1,2", "FUNC_OPTIONS": '{"a": 1}'}):
+            for _ in range(2):
+                self.assertEqual(
+                    ([1, 2, 99], {"a": 1, "seen": True}), func()
+                )
+
+    def test_fromenv_replaced_environ(self):
+        @fromenv
+        def func(x: int = 0):
+            return x
+
+        with mock.patch("os.environ", {"FUNC_X": "7"}):
+            self.assertEqual(7, func())
+        self.assertEqual(0, func())
+
+    def test_fromenv_parsed_by_annotation(self):
+        @fromenv
+        def func(
+            flag: bool = True,
+            ids: List[int] = (),
+            limit: Optional[int] = 10,
+            ratio=0.5,
+            name=None,
+        ):
+            return flag, ids, limit, ratio, name
+
+        env = {
+            "FUNC_FLAG": "false",
+            "FUNC_IDS": "1,2",
+            "FUNC_LIMIT": "none",
+            "FUNC_RATIO": "2",
+            "FUNC_NAME": "x",
+        }
+        with _temp_env(env):
+            self.assertEqual((False, [1, 2], None, 2.0, "x"), func())
+
+    def test_fromenv_invalid_value(self):
+        @fromenv
+        def func(x: int = 0):
+            return x
+
+        with _temp_env({"FUNC_X": "abc"}):
+            with self.assertRaisesRegex(
+                ParseError,
+                "Invalid int 'abc' in environment variable FUNC_X",
+            ):
+                func()
+
+
+@dataclasses.dataclass(frozen=True)
+class _Pool:
+    size: int = 4
+    timeout: float = 1.0
+
+
+class _Database(NamedTuple):
+    url: str
+    pool: _Pool = _Pool()
+
+
+class TestFromenvClass(unittest.TestCase):
+    def test_constructor_wrapped_by_default(self):
+        @fromenv
+        class C:
+            def __init__(self, x: int = 1):
+                self.x = x
+
+        with _temp_env({"C_X": "5"}):
+            self.assertEqual(5, C().x)
+            self.assertEqual(2, C(2).x)
+        self.assertEqual(1, C().x)
+
+    def test_as_config_requires_class(self):
+        with self.assertRaises(ValueError):
+            fromenv(lambda x=1: x, as_config=True)
+
+    def test_dataclass(self):
+        @fromenv(prefix="APP", as_config=True)
+        @dataclasses.dataclass(frozen=True)
+        class Settings:
+            name: str = "app"
+            debug: bool = False
+
+        self.assertIsInstance(Settings, type)
+        with _temp_env({"APP_DEBUG": "yes"}):
+            settings = Settings.from_env()
+        self.assertEqual(Settings("app", True), settings)
+        # Resolved once
+        self.assertIs(settings, Settings.from_env())
+        Settings.from_env.refresh()
+        self.assertEqual(Settings("app", False), Settings.from_env())
+        # The constructor is unchanged
+        with _temp_env({"APP_DEBUG": "yes"}):
+            self.assertEqual(Settings("app", False), Settings())
+
+    def test_nested(self):
+        @fromenv(prefix="", as_config=True)
+        @dataclasses.dataclass(frozen=True)
+        class Settings:
+            db: _Database
+            debug: bool = False
+
+        with _temp_env({"DB_URL": "postgres://db", "DB_POOL_SIZE": 16}):
+            settings = Settings.from_env()
+        self.assertEqual(
+            Settings(_Database("postgres://db", _Pool(16, 1.0)), False),
+            settings,
+        )
+
+    def test_missing_required_field(self):
+        @fromenv(as_config=True)
+        class Database(NamedTuple):
+            url: str
+
+        with self.assertRaisesRegex(
+            ValueError, "Missing environment variable DATABASE_URL"
+        ):
+            Database.from_env()
+
+    def test_plain_class(self):
+        @fromenv(prefix="SVC", as_config=True)
+        class Service:
+            __slots__ = ("host", "port")
+
+            def __init__(self, host: str = "localhost", port: int = 80):
+                self.host = host
+                self.port = port
+
+        with _temp_env({"SVC_PORT": "8080"}):
+            service = Service.from_env()
+        self.assertEqual(("localhost", 8080), (service.host, service.port))
+
+    def test_invalid_value(self):
+        @fromenv(prefix="APP", as_config=True)
+        class Settings(NamedTuple):
+            workers: int = 1
+
+        with _temp_env({"APP_WORKERS": "many"}):
+            with self.assertRaisesRegex(
+                ParseError, "in environment variable APP_WORKERS"
+            ):
+                Settings.from_env()
+
+    def test_resolved_once_across_threads(self):
+        @fromenv(prefix="APP", as_config=True)
+        class Settings(NamedTuple):
+            workers: int = 1
+
+        instances = []
+        threads = [
+            threading.Thread(
+                target=lambda: instances.append(Settings.from_env())
+            )
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(1, len({id(instance) for instance in instances}))
+        self.assertEqual(1, Settings.from_env.registration.calls)
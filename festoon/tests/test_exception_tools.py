@@ -0,0 +1,394 @@
+import asyncio
+import concurrent.futures
+import os
+import subprocess
+import sys
+import threading
+import time
+import unittest
+from unittest import mock
+
+import festoon
+from festoon.backoff_tools import ExponentialBackoff
+from festoon.breaker_tools import CircuitBreaker, CircuitOpenError, RetryBudget
+from festoon.cancel_tools import AttemptTimeoutError, current_token
+from festoon.exception_tools import BatchRetryError, retry, retry_batch
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(festoon.__file__)))
+
+
+class TestRetry(unittest.TestCase):
+    def test_retry_until_success(self):
+        fn = mock.Mock(side_effect=[IOError, IOError, "done"])
+        func = retry(fn, schedule=[0, 0, 0], log_exceptions=False)
+
+        self.assertEqual("done", func())
+        self.assertEqual(3, fn.call_count)
+
+    def test_last_attempt_raises(self):
+        fn = mock.Mock(side_effect=IOError)
+        func = retry(fn, schedule=[0], log_exceptions=False)
+
+        with self.assertRaises(IOError):
+            func()
+        self.assertEqual(2, fn.call_count)
+
+    def test_catch_list(self):
+        fn = mock.Mock(side_effect=[KeyError, "done"])
+        func = retry(
+            fn, schedule=[0], catch=[IOError, KeyError], log_exceptions=False
+        )
+        self.assertEqual("done", func())
+
+
+class TestRetryAsync(unittest.IsolatedAsyncioTestCase):
+    async def test_coroutine_function(self):
+        calls = []
+
+        @retry(schedule=[0, 0], log_exceptions=False)
+        async def func():
+            calls.append(1)
+            if len(calls) < 3:
+                raise IOError
+            return "done"
+
+        with mock.patch("time.sleep") as sleep:
+            self.assertEqual("done", await func())
+        sleep.assert_not_called()
+        self.assertEqual(3, len(calls))
+
+    async def test_breaker_trial_cancelled(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        started = asyncio.Event()
+
+        @retry(breaker=breaker)
+        async def func(wait):
+            started.set()
+            if wait:
+                await asyncio.sleep(60)
+            return "done"
+
+        task = asyncio.ensure_future(func(True))
+        await started.wait()
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.assertEqual("half-open", breaker.state)
+        self.assertEqual("done", await func(False))
+        self.assertEqual("closed", breaker.state)
+
+    async def test_asyncio_sleep_used(self):
+        @retry(schedule=[0.5], log_exceptions=False)
+        async def func():
+            raise IOError
+
+        with mock.patch("asyncio.sleep") as sleep:
+            with self.assertRaises(IOError):
+                await func()
+        sleep.assert_called_once_with(0.5)
+
+    async def test_async_generator_retried_before_first_item(self):
+        calls = []
+
+        @retry(schedule=[0], log_exceptions=False)
+        async def gen():
+            calls.append(1)
+            if len(calls) == 1:
+                raise IOError
+            yield 1
+            yield 2
+
+        self.assertEqual([1, 2], [item async for item in gen()])
+        self.assertEqual(2, len(calls))
+
+    async def test_async_generator_not_retried_after_first_item(self):
+        calls = []
+
+        @retry(schedule=[0], log_exceptions=False)
+        async def gen():
+            calls.append(1)
+            yield 1
+            raise IOError
+
+        with self.assertRaises(IOError):
+            [item async for item in gen()]
+        self.assertEqual(1, len(calls))
+
+
+class TestRetryBackoff(unittest.TestCase):
+    def test_backoff_schedule(self):
+        fn = mock.Mock(side_effect=[IOError, IOError, "done"])
+        func = retry(
+            fn, schedule=ExponentialBackoff(0.5, max_retries=3),
+            log_exceptions=False,
+        )
+        with mock.patch("time.sleep") as sleep:
+            self.assertEqual("done", func())
+        self.assertEqual([mock.call(0.5), mock.call(1.0)],
+                         sleep.call_args_list)
+
+
+class TestRetryBudgetAndBreaker(unittest.TestCase):
+    def test_budget_shared(self):
+        budget = RetryBudget(ratio=0, min_per_second=0, max_tokens=1)
+        a = mock.Mock(side_effect=[IOError, "a"])
+        b = mock.Mock(side_effect=[IOError, "b"])
+        func_a = retry(a, schedule=[0], budget=budget, log_exceptions=False)
+        func_b = retry(b, schedule=[0], budget=budget, log_exceptions=False)
+
+        self.assertEqual("a", func_a())
+        with self.assertRaises(IOError):
+            func_b()
+        self.assertEqual(1, b.call_count)
+        self.assertEqual(1, budget.rejected)
+
+    def test_breaker_fails_fast(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+        fn = mock.Mock(side_effect=IOError)
+        func = retry(fn, schedule=[0, 0, 0], breaker=breaker,
+                     log_exceptions=False)
+
+        with self.assertRaises(CircuitOpenError):
+            func()
+        self.assertEqual(2, fn.call_count)
+        self.assertEqual("open", breaker.state)
+
+    def test_breaker_uncaught_exception_is_success(self):
+        breaker = CircuitBreaker(failure_threshold=1)
+        func = retry(mock.Mock(side_effect=KeyError), catch=IOError,
+                     breaker=breaker)
+        with self.assertRaises(KeyError):
+            func()
+        self.assertEqual(1, breaker.successes)
+
+    def test_breaker_trial_interrupted(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        func = retry(
+            mock.Mock(side_effect=[KeyboardInterrupt, "done"]),
+            breaker=breaker,
+        )
+        with self.assertRaises(KeyboardInterrupt):
+            func()
+        self.assertEqual("half-open", breaker.state)
+        self.assertEqual("done", func())
+        self.assertEqual("closed", breaker.state)
+
+
+class TestRetryTimeout(unittest.TestCase):
+    def test_hung_attempt_abandoned(self):
+        tokens = []
+        stopped = threading.Event()
+
+        @retry(schedule=[0], timeout=0.05, log_exceptions=False)
+        def func():
+            token = current_token()
+            tokens.append(token)
+            if len(tokens) == 1:
+                while not token.sleep(0.01):
+                    pass
+                stopped.set()
+                return "abandoned"
+            return "done"
+
+        self.assertEqual("done", func())
+        self.assertTrue(stopped.wait(1))
+        self.assertTrue(tokens[0].cancelled)
+        self.assertEqual(1, func.registration.retries)
+
+    def test_abandoned_attempts_do_not_block(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        daemons = []
+
+        @retry(schedule=[], timeout=0.01, log_exceptions=False)
+        def hang():
+            daemons.append(threading.current_thread().daemon)
+            release.wait()
+
+        # More abandoned attempts than the workers of a default pool
+        for _ in range(40):
+            with self.assertRaises(AttemptTimeoutError):
+                hang()
+        self.assertEqual([True] * 40, daemons)
+        func = retry(lambda: "done", timeout=1)
+        self.assertEqual("done", func())
+
+    def test_hung_attempt_does_not_hold_exit(self):
+        code = (
+            "import time\n"
+            "from festoon.exception_tools import retry\n"
+            "func = retry(lambda: time.sleep(60), schedule=[], timeout=0.01,"
+            " log_exceptions=False)\n"
+            "try:\n"
+            "    func()\n"
+            "except TimeoutError:\n"
+            "    pass\n"
+        )
+        start = time.monotonic()
+        subprocess.run(
+            [sys.executable, "-c", code], cwd=ROOT, check=True, timeout=30,
+        )
+        self.assertLess(time.monotonic() - start, 10)
+
+    def test_attempts_time_out(self):
+        func = retry(
+            lambda: time.sleep(0.3), schedule=[0], timeout=0.01,
+            log_exceptions=False,
+        )
+        with self.assertRaises(AttemptTimeoutError):
+            func()
+
+    def test_deadline_stops_retries(self):
+        fn = mock.Mock(side_effect=IOError)
+        func = retry(fn, schedule=[0, 10], deadline=1, log_exceptions=False)
+        start = time.monotonic()
+        with self.assertRaises(IOError):
+            func()
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(2, fn.call_count)
+
+    def test_deadline_abandons_last_attempt(self):
+        func = retry(lambda: time.sleep(0.3), deadline=0.05)
+        start = time.monotonic()
+        with self.assertRaises(AttemptTimeoutError):
+            func()
+        self.assertLess(time.monotonic() - start, 0.25)
+
+    def test_executor(self):
+        threads = []
+        fn = mock.Mock(side_effect=lambda: threads.append(
+            threading.current_thread().name
+        ))
+        with concurrent.futures.ThreadPoolExecutor(
+            thread_name_prefix="test-pool"
+        ) as pool:
+            retry(fn, executor=pool)()
+        self.assertTrue(threads[0].startswith("test-pool"))
+
+    def test_no_token_without_options(self):
+        tokens = []
+        retry(lambda: tokens.append(current_token()))()
+        self.assertEqual([None], tokens)
+
+    def test_unsupported(self):
+        async def gen():
+            yield 1
+
+        async def coro():
+            pass
+
+        with self.assertRaises(ValueError):
+            retry(gen, timeout=1)
+        with self.assertRaises(ValueError):
+            retry(coro, executor=concurrent.futures.ThreadPoolExecutor())
+
+
+class TestRetryTimeoutAsync(unittest.IsolatedAsyncioTestCase):
+    async def test_hung_attempt_cancelled(self):
+        calls = []
+
+        @retry(schedule=[0], timeout=0.05, log_exceptions=False)
+        async def func():
+            calls.append(current_token())
+            if len(calls) == 1:
+                await asyncio.sleep(1)
+            return "done"
+
+        self.assertEqual("done", await func())
+        self.assertEqual(2, len(calls))
+        self.assertTrue(calls[0].cancelled)
+
+
+def _flaky(failures):
+    """Return a bulk function failing each item its number of `failures`,
+    and the batches it was called with"""
+    failures = dict(failures)
+    batches = []
+
+    def write(items, suffix=""):
+        batches.append(list(items))
+        results = []
+        for item in items:
+            if failures.get(item, 0):
+                failures[item] -= 1
+                results.append(IOError(item))
+            else:
+                results.append(f"{item}{suffix}")
+        return results
+
+    return write, batches
+
+
+class TestRetryBatch(unittest.TestCase):
+    def test_only_failed_items_retried(self):
+        write, batches = _flaky({"b": 2, "d": 1})
+        func = retry_batch(write, schedule=[0, 0], log_exceptions=False)
+
+        self.assertEqual(
+            ["a!", "b!", "c!", "d!"], func(["a", "b", "c", "d"], suffix="!")
+        )
+        self.assertEqual(
+            [["a", "b", "c", "d"], ["b", "d"], ["b"]], batches
+        )
+        self.assertEqual(2, func.registration.retries)
+
+    def test_remaining_failures(self):
+        write, _ = _flaky({"b": 5})
+        func = retry_batch(write, schedule=[0], log_exceptions=False)
+        with self.assertRaises(BatchRetryError) as cm:
+            func(["a", "b"])
+        self.assertEqual([1], cm.exception.failed)
+        self.assertEqual("a", cm.exception.results[0])
+        self.assertIsInstance(cm.exception.results[1], IOError)
+
+        func = retry_batch(
+            write, schedule=[0], log_exceptions=False, raise_on_failure=False
+        )
+        results = func(["a", "b"])
+        self.assertEqual("a", results[0])
+        self.assertIsInstance(results[1], IOError)
+
+    def test_uncaught_item_exceptions_not_retried(self):
+        fn = mock.Mock(return_value=[KeyError("a"), "b"])
+        func = retry_batch(fn, schedule=[0], catch=IOError)
+        results = func(["a", "b"])
+        fn.assert_called_once()
+        self.assertIsInstance(results[0], KeyError)
+
+    def test_raised_exception_retries_batch(self):
+        fn = mock.Mock(side_effect=[IOError, ["A", "B"]])
+        func = retry_batch(fn, schedule=[0], log_exceptions=False)
+        self.assertEqual(["A", "B"], func(("a", "b")))
+        fn.assert_called_with(["a", "b"])
+
+    def test_result_length_checked(self):
+        func = retry_batch(mock.Mock(return_value=["A"]))
+        with self.assertRaises(ValueError):
+            func(["a", "b"])
+
+    def test_logging(self):
+        write, _ = _flaky({"b": 1})
+        func = retry_batch(write, schedule=[0])
+        with self.assertLogs("festoon.exception_tools") as logs:
+            func(["a", "b", "c"])
+        self.assertIn(
+            "1 of 3 items failed, sleeping for 0 seconds and then retrying "
+            "them...",
+            logs.output[-1],
+        )
+
+
+class TestRetryBatchAsync(unittest.IsolatedAsyncioTestCase):
+    async def test_coroutine_function(self):
+        write, batches = _flaky({"a": 1})
+
+        @retry_batch(schedule=[0.5], log_exceptions=False)
+        async def func(items):
+            return write(items)
+
+        with mock.patch("asyncio.sleep") as sleep:
+            self.assertEqual(["a", "b"], await func(["a", "b"]))
+        sleep.assert_called_once_with(0.5)
+        self.assertEqual([["a", "b"], ["a"]], batches)
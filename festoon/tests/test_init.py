@@ -0,0 +1,88 @@
+import os
+import subprocess
+import sys
+import unittest
+
+import festoon
+from festoon import exception_tools, logging_tools
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(festoon.__file__)))
+
+
+def _run(*args: str) -> subprocess.CompletedProcess:
+    """Run a new interpreter, which imports festoon from this tree"""
+    return subprocess.run(
+        [sys.executable, *args],
+        cwd=ROOT,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+
+
+def _new_modules(code: str) -> list:
+    """Return the modules imported by `code` in a new interpreter"""
+    output = _run("-c", (
+        "import sys\n"
+        "before = set(sys.modules)\n"
+        f"{code}\n"
+        "print(' '.join(sorted(set(sys.modules) - before)))\n"
+    )).stdout
+    return output.split()
+
+
+class TestLazyImport(unittest.TestCase):
+    def test_import_loads_no_submodule(self):
+        self.assertEqual(["festoon"], _new_modules("import festoon"))
+
+    def test_import_time(self):
+        # Lines of -X importtime are "import time: self | cumulative |
+        # name", with names indented by depth, and imports nested in a
+        # module listed before it
+        lines = _run("-X", "importtime", "-c", "import festoon").stderr
+        imports = [
+            line.split("|")[-1].rstrip()
+            for line in lines.splitlines()
+            if line.startswith("import time:")
+        ]
+        names = [name.strip() for name in imports]
+        index = names.index("festoon")
+        depth = len(imports[index]) - len("festoon")
+        nested = []
+        for name in reversed(imports[:index]):
+            if len(name) - len(name.lstrip()) <= depth:
+                break
+            nested.append(name.strip())
+        self.assertEqual([], nested)
+
+    def test_decorators_loaded_on_access(self):
+        modules = _new_modules("import festoon; festoon.docfill")
+        self.assertEqual(
+            ["festoon", "festoon.docstring_tools"],
+            [module for module in modules if module.startswith("festoon")],
+        )
+
+    def test_slow_imports_deferred(self):
+        modules = _new_modules(
+            "import festoon\n"
+            "festoon.retry(lambda: None)\n"
+            "festoon.retry_batch(lambda items: items)\n"
+            "festoon.cacheit(lambda: None)\n"
+            "festoon.limitit(lambda: None)\n"
+            "festoon.logit(lambda: None)\n"
+        )
+        for slow in ("asyncio", "concurrent.futures", "http.server"):
+            self.assertNotIn(slow, modules)
+
+    def test_attributes(self):
+        self.assertIs(exception_tools.retry, festoon.retry)
+        self.assertIs(logging_tools.logit, festoon.logit)
+        self.assertIn("retry", vars(festoon))
+        self.assertLessEqual(set(festoon.__all__), set(dir(festoon)))
+        with self.assertRaises(AttributeError):
+            festoon.missing
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,231 @@
+import asyncio
+import logging
+import threading
+import time
+import unittest
+from unittest import mock
+
+from festoon.exception_tools import retry
+from festoon.limit_tools import Bulkhead, BulkheadFullError, limitit
+
+
+def _hold(bulkhead: Bulkhead, count: int):
+    """Take `count` slots, and return a function giving them back"""
+    for _ in range(count):
+        bulkhead.acquire()
+    return lambda: [bulkhead.release() for _ in range(count)]
+
+
+class TestBulkhead(unittest.TestCase):
+    def test_free_slots(self):
+        bulkhead = Bulkhead(2)
+        self.assertEqual(0.0, bulkhead.acquire())
+        self.assertEqual(0.0, bulkhead.acquire())
+        self.assertEqual(2, bulkhead.in_flight)
+        bulkhead.release()
+        bulkhead.release()
+        self.assertEqual(0, bulkhead.in_flight)
+
+    def test_reject_immediately(self):
+        bulkhead = Bulkhead(1, max_waiting=0)
+        bulkhead.acquire()
+        with self.assertRaises(BulkheadFullError):
+            bulkhead.acquire()
+        self.assertEqual(1, bulkhead.stats()["rejected"])
+
+    def test_timeout(self):
+        bulkhead = Bulkhead(1, timeout=0.01)
+        bulkhead.acquire()
+        with self.assertRaises(BulkheadFullError):
+            bulkhead.acquire()
+        self.assertEqual(0, bulkhead.waiting)
+        self.assertEqual(1, bulkhead.timeouts)
+
+    def test_waiting_calls_served_in_order(self):
+        bulkhead = Bulkhead(1)
+        release = _hold(bulkhead, 1)
+        order = []
+
+        def call(i):
+            bulkhead.acquire()
+            order.append(i)
+            bulkhead.release()
+
+        threads = []
+        for i in range(3):
+            threads.append(threading.Thread(target=call, args=(i,)))
+            threads[-1].start()
+            while bulkhead.waiting < i + 1:
+                time.sleep(0.001)
+        release()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([0, 1, 2], order)
+        self.assertEqual(0, bulkhead.in_flight)
+
+    def test_interrupted_waiter_leaves_line(self):
+        bulkhead = Bulkhead(1)
+        bulkhead.acquire()
+        with mock.patch.object(
+            threading.Event, "wait", side_effect=KeyboardInterrupt
+        ):
+            with self.assertRaises(KeyboardInterrupt):
+                bulkhead.acquire()
+        self.assertEqual(0, bulkhead.waiting)
+        bulkhead.release()
+        self.assertEqual(0, bulkhead.in_flight)
+
+    def test_interrupted_waiter_passes_on_granted_slot(self):
+        bulkhead = Bulkhead(1)
+        bulkhead.acquire()
+
+        def wait(event, timeout=None):
+            bulkhead.release()
+            raise KeyboardInterrupt
+
+        with mock.patch.object(threading.Event, "wait", wait):
+            with self.assertRaises(KeyboardInterrupt):
+                bulkhead.acquire()
+        self.assertEqual(0, bulkhead.in_flight)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            Bulkhead(0)
+
+
+class TestLimitit(unittest.TestCase):
+    def test_max_concurrent(self):
+        running = 0
+        peak = 0
+        lock = threading.Lock()
+
+        @limitit(max_concurrent=2)
+        def func():
+            nonlocal running, peak
+            with lock:
+                running += 1
+                peak = max(peak, running)
+            time.sleep(0.01)
+            with lock:
+                running -= 1
+
+        threads = [threading.Thread(target=func) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(2, peak)
+        self.assertEqual(6, func.registration.calls)
+        self.assertEqual(0, func.bulkhead.in_flight)
+
+    def test_slot_released_on_exception(self):
+        @limitit(max_concurrent=1)
+        def func():
+            raise KeyError
+
+        for _ in range(2):
+            with self.assertRaises(KeyError):
+                func()
+        self.assertEqual(0, func.bulkhead.in_flight)
+        self.assertEqual(2, func.registration.errors)
+
+    def test_logging(self):
+        @limitit(max_concurrent=3)
+        def func():
+            pass
+
+        with self.assertLogs(level="DEBUG") as logs:
+            func()
+        self.assertRegex(
+            logs.output[0],
+            r"LIMIT \S*func 1/3 in flight, 0 waiting, waited 0.00s$",
+        )
+
+        func.bulkhead.max_waiting = 0
+        release = _hold(func.bulkhead, 3)
+        with self.assertLogs(level="WARNING") as logs:
+            with self.assertRaises(BulkheadFullError):
+                func()
+        release()
+        self.assertIn("rejected: Bulkhead is full", logs.output[0])
+
+    def test_shared_bulkhead(self):
+        bulkhead = Bulkhead(1, max_waiting=0)
+        func = limitit(lambda: None, bulkhead=bulkhead)
+        release = _hold(bulkhead, 1)
+        with self.assertLogs(level=logging.WARNING) as logs:
+            with self.assertRaises(BulkheadFullError):
+                func()
+        self.assertIn(
+            "rejected: Bulkhead is full, 0 calls already waiting",
+            logs.output[0],
+        )
+        release()
+        func()
+
+    def test_retry_takes_a_slot_per_attempt(self):
+        in_flight = []
+        attempts = iter([IOError, None])
+
+        @retry(schedule=[0], log_exceptions=False)
+        @limitit(max_concurrent=1)
+        def func():
+            in_flight.append(func.__wrapped__.bulkhead.in_flight)
+            error = next(attempts)
+            if error is not None:
+                raise error
+
+        func()
+        self.assertEqual([1, 1], in_flight)
+        self.assertEqual(0, func.__wrapped__.bulkhead.in_flight)
+
+
+class TestLimititAsync(unittest.IsolatedAsyncioTestCase):
+    async def test_max_concurrent(self):
+        running = 0
+        peak = 0
+
+        @limitit(max_concurrent=2)
+        async def func():
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+        await asyncio.gather(*(func() for _ in range(6)))
+        self.assertEqual(2, peak)
+        self.assertEqual(0, func.bulkhead.in_flight)
+
+    async def test_timeout(self):
+        bulkhead = Bulkhead(1, timeout=0.01)
+        await bulkhead.acquire_async()
+        with self.assertRaises(BulkheadFullError):
+            await bulkhead.acquire_async()
+        self.assertEqual(0, bulkhead.waiting)
+
+    async def test_cancelled_waiter_leaves_line(self):
+        bulkhead = Bulkhead(1)
+        await bulkhead.acquire_async()
+        task = asyncio.ensure_future(bulkhead.acquire_async())
+        await asyncio.sleep(0)
+        self.assertEqual(1, bulkhead.waiting)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.assertEqual(0, bulkhead.waiting)
+        bulkhead.release()
+        self.assertEqual(0, bulkhead.in_flight)
+
+    async def test_shared_with_threads(self):
+        bulkhead = Bulkhead(1)
+        bulkhead.acquire()
+        task = asyncio.ensure_future(bulkhead.acquire_async())
+        await asyncio.sleep(0)
+        threading.Thread(target=bulkhead.release).start()
+        await asyncio.wait_for(task, 1)
+        self.assertEqual(1, bulkhead.in_flight)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,15 @@
+import asyncio
+import gc
+import json
+import logging
+import time
 import unittest
 from unittest import mock
 
-from festoon.logging_tools import format_call, logit, timeit
+from festoon.logging_tools import (
+    format_call, JsonFormatter, logit, StructuredMessage, timeit
+)
+from festoon.sampling_tools import EveryNthSampler, ProbabilitySampler
 
 
 def func1(x, y, z=3):
@@ -31,6 +39,29 @@ class TestDefaultFormatCall(unittest.TestCase):
         message = format_call(func1, args, kwargs)
         self.assertEqual("CALL func1(x=1, y=2, z=3)", message)
 
+    def test_func1_method_skips_self(self):
+        class Foo:
+            def func(self, x, y=2):
+                pass
+
+        message = format_call(Foo.func, (Foo(), 1), {})
+        self.assertTrue(message.endswith("Foo.func(x=1, y=2)"))
+
+    def test_func_var_keyword(self):
+        def func(x, *, y=2, **kwargs):
+            pass
+
+        message = format_call(func, (1,), {"z": 3})
+        self.assertTrue(message.endswith("func(x=1, y=2, z=3)"))
+
+    def test_large_values_bounded(self):
+        message = format_call(func1, (list(range(10**6)), "y" * 10**6), {})
+        self.assertLess(len(message), 300)
+
+    def test_fmtvalue(self):
+        message = format_call(func1, (1, 2), {}, fmtvalue=lambda v: "?")
+        self.assertEqual("CALL func1(x=?, y=?, z=?)", message)
+
     def test_func2(self):
         message = format_call(func2, (1, 2, 3), {})
         self.assertEqual("CALL func2(1, 2, 3)", message)
@@ -44,7 +75,8 @@ class TestLogit(unittest.TestCase):
         def func():
             pass
 
-        func()
+        with self.assertLogs(level="INFO"):
+            func()
         fmtcall.assert_called_once()
 
     def test_fmtdone_called(self):
@@ -54,7 +86,8 @@ class TestLogit(unittest.TestCase):
         def func():
             pass
 
-        func()
+        with self.assertLogs(level="INFO"):
+            func()
         fmtdone.assert_called_once()
 
     def test_fmtexcp_called(self):
@@ -64,9 +97,144 @@ class TestLogit(unittest.TestCase):
         def func():
             raise Exception
 
-        with self.assertRaises(Exception):
+        with self.assertLogs(level="INFO"):
+            with self.assertRaises(Exception):
+                func()
+        fmtexcp.assert_called_once()
+
+    def test_nothing_formatted_when_level_disabled(self):
+        fmtcall = mock.Mock()
+        fmtdone = mock.Mock()
+
+        @logit(level=logging.DEBUG, fmtcall=fmtcall, fmtdone=fmtdone)
+        def func():
+            pass
+
+        with self.assertLogs(level="INFO"):
+            func()
+            logging.getLogger(__name__).info("keep assertLogs happy")
+        fmtcall.assert_not_called()
+        fmtdone.assert_not_called()
+
+    def test_default_formatters(self):
+        @logit
+        def func(x, y=2):
+            return x + y
+
+        with self.assertLogs(level="INFO") as logs:
+            func(1)
+        self.assertEqual(
+            ["CALL TestLogit.test_default_formatters.<locals>.func(x=1, y=2)",
+             "DONE TestLogit.test_default_formatters.<locals>.func->3"],
+            [record.getMessage() for record in logs.records],
+        )
+
+    def test_sampled_calls_not_formatted(self):
+        fmtcall = mock.Mock(return_value="call")
+
+        @logit(fmtcall=fmtcall, fmtdone=None, sample=EveryNthSampler(3))
+        def func():
+            pass
+
+        with self.assertLogs(level="INFO") as logs:
+            for _ in range(6):
+                func()
+        self.assertEqual(2, len(logs.records))
+        self.assertEqual(2, fmtcall.call_count)
+
+    def test_unsampled_exception_kept(self):
+        @logit(sample=ProbabilitySampler(0, exceptions=True))
+        def func(x):
+            if x:
+                raise ValueError
+            return x
+
+        with self.assertLogs(level="INFO") as logs:
+            func(0)
+            with self.assertRaises(ValueError):
+                func(1)
+        messages = [record.getMessage() for record in logs.records]
+        self.assertEqual(2, len(messages))
+        self.assertTrue(messages[0].startswith("CALL"))
+        self.assertIn("x=1", messages[0])
+        self.assertTrue(messages[1].startswith("EXCP"))
+
+
+class TestStructured(unittest.TestCase):
+    def test_fields(self):
+        @logit(structured=True)
+        def func(x, *rest, y=2):
+            return x + y
+
+        with self.assertLogs(level="INFO") as logs:
+            func(1, 5, y=3)
+        call, done = logs.records
+        self.assertTrue(call.getMessage().endswith("func(x=1, 5, y=3)"))
+        self.assertEqual("call", call.outcome)
+        self.assertTrue(call.function.endswith(".func"))
+        self.assertEqual(
+            {"x": "1", "rest": ["5"], "y": "3"}, call.arguments
+        )
+        self.assertEqual("done", done.outcome)
+        self.assertEqual("4", done.result)
+        self.assertGreaterEqual(done.duration, 0)
+
+    def test_exception_fields(self):
+        @logit(structured=True, fmtcall=None)
+        def func():
+            raise KeyError("missing")
+
+        with self.assertLogs(level="INFO") as logs:
+            with self.assertRaises(KeyError):
+                func()
+        (record,) = logs.records
+        self.assertEqual("error", record.outcome)
+        self.assertEqual("KeyError", record.exception)
+        self.assertEqual("'missing'", record.exception_message)
+
+    def test_custom_formatter(self):
+        fmtdone = mock.Mock(
+            return_value=StructuredMessage("done", {"rows": 3})
+        )
+
+        @logit(structured=True, fmtdone=fmtdone, fmtcall=None)
+        def func():
+            pass
+
+        with self.assertLogs(level="INFO") as logs:
             func()
-            fmtexcp.assert_called_once()
+        self.assertEqual("done", logs.records[0].getMessage())
+        self.assertEqual(3, logs.records[0].rows)
+
+    def test_fields_named_like_record_attributes(self):
+        @logit(
+            structured=True, fmtcall=None,
+            fmtdone=lambda fn, out: StructuredMessage(
+                "done", {"name": "x", "args": 1}
+            ),
+        )
+        def func():
+            return "result"
+
+        with self.assertLogs(level="INFO") as logs:
+            self.assertEqual("result", func())
+        (record,) = logs.records
+        self.assertEqual(__name__, record.name)
+        self.assertEqual(("x", 1), (record.field_name, record.field_args))
+
+    def test_json_formatter(self):
+        @logit(structured=True, fmtcall=None)
+        def func(x):
+            return {"x": x}
+
+        with self.assertLogs(level="INFO") as logs:
+            func(1)
+        data = json.loads(JsonFormatter().format(logs.records[0]))
+        self.assertEqual("INFO", data["level"])
+        self.assertTrue(data["message"].endswith("func->{'x': 1}"))
+        self.assertEqual("done", data["outcome"])
+        self.assertEqual("{'x': 1}", data["result"])
+        self.assertNotIn("args", data)
 
 
 class TestTimeit(unittest.TestCase):
@@ -77,5 +245,161 @@ class TestTimeit(unittest.TestCase):
         def func():
             pass
 
-        func()
+        with self.assertLogs(level="INFO"):
+            func()
+        fmttime.assert_called_once()
+
+    def test_fmttime_string(self):
+        @timeit(fmttime="{name} {seconds:.1f}s {ms:.0f}ms {us!r:.3}")
+        def func():
+            pass
+
+        with mock.patch("time.perf_counter", side_effect=[1.0, 1.25]):
+            with self.assertLogs(level="INFO") as logs:
+                func()
+        self.assertTrue(logs.output[0].endswith(
+            "func 0.2s 250ms 250"
+        ))
+        self.assertIn("TIME ", logs.output[0])
+
+    def test_fmttime_default(self):
+        @timeit
+        def func():
+            pass
+
+        with mock.patch("time.perf_counter", side_effect=[1.0, 1.5]):
+            with self.assertLogs(level="INFO") as logs:
+                func()
+        self.assertTrue(logs.output[0].endswith("func 0.50s"))
+
+    def test_fmttime_string_rejected(self):
+        for fmtstr in (
+            "{seconds*1000}",
+            "{seconds.__class__}",
+            "{}",
+            "{seconds:{ms}}",
+        ):
+            with self.subTest(fmtstr=fmtstr):
+                with self.assertRaises(ValueError):
+                    timeit(lambda: None, fmttime=fmtstr)
+
+    def test_aggregate_flush_calls(self):
+        @timeit(aggregate=True, flush_interval=None, flush_calls=3)
+        def func():
+            pass
+
+        with self.assertLogs(level="INFO") as logs:
+            for _ in range(6):
+                func()
+        self.assertEqual(2, len(logs.records))
+        self.assertIn("STATS", logs.records[0].getMessage())
+        self.assertIn("count=3", logs.records[0].getMessage())
+        self.assertIn("count=6", logs.records[1].getMessage())
+
+    def test_aggregate_flushed_without_calls(self):
+        @timeit(aggregate=True, flush_interval=0.05)
+        def func():
+            pass
+
+        with self.assertLogs(level="INFO") as logs:
+            func()
+            for _ in range(200):
+                if logs.records:
+                    break
+                time.sleep(0.01)
+        self.assertEqual(1, len(logs.records))
+        self.assertIn("count=1", logs.records[0].getMessage())
+
+    def test_aggregate_stats(self):
+        @timeit(aggregate=True, flush_interval=None)
+        def func():
+            pass
+
+        for _ in range(5):
+            func()
+
+        self.assertEqual(5, func.stats().count)
+        key = f"{__name__}.{func.__qualname__}"
+        self.assertEqual(5, timeit.stats()[key].count)
+
+        with self.assertLogs(level="INFO") as logs:
+            func.flush()
+        self.assertIn("count=5", logs.records[0].getMessage())
+
+    def test_aggregates_of_same_name(self):
+        def decorate():
+            @timeit(aggregate=True, flush_interval=None)
+            def same_name():
+                pass
+
+            return same_name
+
+        first, second = decorate(), decorate()
+        first()
+        second()
+        second()
+        key = f"{__name__}.{first.__qualname__}"
+        self.assertEqual((1, 2), (first.stats().count, second.stats().count))
+        self.assertEqual(3, timeit.stats()[key].count)
+
+        # Released with their wrappers
+        del first, second
+        gc.collect()
+        self.assertNotIn(key, timeit.stats())
+
+    def test_sampling_slow_calls_kept(self):
+        fmttime = mock.Mock(return_value="time")
+
+        @timeit(fmttime=fmttime, sample=ProbabilitySampler(0, slow_ms=5))
+        def func():
+            pass
+
+        # Calls taking 1ms, then 10ms
+        with self.assertLogs(level="INFO"), mock.patch(
+            "time.perf_counter", side_effect=[0, 0.001, 1, 1.01]
+        ):
+            func()
+            func()
+        fmttime.assert_called_once()
+
+    def test_sampling_and_aggregate_exclusive(self):
+        with self.assertRaises(ValueError):
+            timeit(lambda: None, aggregate=True, sample=0.5)
+
+
+class TestAsync(unittest.IsolatedAsyncioTestCase):
+    async def test_logit_coroutine(self):
+        fmtdone = mock.Mock(return_value="done")
+
+        @logit(fmtdone=fmtdone)
+        async def func(x):
+            return x + 1
+
+        with self.assertLogs(level="INFO"):
+            self.assertEqual(2, await func(1))
+        fmtdone.assert_called_once_with(func.__wrapped__, 2)
+
+    async def test_logit_async_generator(self):
+        fmtdone = mock.Mock(return_value="done")
+
+        @logit(fmtdone=fmtdone)
+        async def gen():
+            yield 1
+            yield 2
+
+        with self.assertLogs(level="INFO"):
+            self.assertEqual([1, 2], [item async for item in gen()])
+        fmtdone.assert_called_once()
+
+    async def test_timeit_coroutine(self):
+        fmttime = mock.Mock(return_value="time")
+
+        @timeit(fmttime=fmttime)
+        async def func():
+            await asyncio.sleep(0.01)
+            return 1
+
+        with self.assertLogs(level="INFO"):
+            self.assertEqual(1, await func())
         fmttime.assert_called_once()
+        self.assertGreaterEqual(fmttime.call_args[0][1], 0.01)
@@ -0,0 +1,183 @@
+import asyncio
+import os
+import tempfile
+import threading
+import unittest
+import urllib.request
+from unittest import mock
+
+from festoon.exception_tools import retry
+from festoon.logging_tools import logit, timeit
+from festoon.metrics_tools import (
+    CONTENT_TYPE, MetricsRegistry, start_http_server, write_textfile,
+)
+
+
+class TestMetrics(unittest.TestCase):
+    def test_counter(self):
+        registry = MetricsRegistry()
+        counter = registry.counter("jobs", "Jobs run", ("queue",))
+        counter.inc(("a",))
+        counter.inc(("a",), 2)
+        counter.inc(('b"\n',))
+        self.assertIs(counter, registry.counter("jobs"))
+        self.assertEqual(
+            '# TYPE jobs counter\n'
+            '# HELP jobs Jobs run\n'
+            'jobs_total{queue="a"} 3\n'
+            'jobs_total{queue="b\\"\\n"} 1\n'
+            '# EOF\n',
+            registry.render(),
+        )
+
+    def test_histogram(self):
+        registry = MetricsRegistry()
+        histogram = registry.histogram("size", buckets=(1, 10))
+        for value in (0.5, 1, 5, 20):
+            histogram.observe(value)
+        self.assertEqual(
+            '# TYPE size histogram\n'
+            'size_bucket{le="1"} 2\n'
+            'size_bucket{le="10"} 3\n'
+            'size_bucket{le="+Inf"} 4\n'
+            'size_count 4\n'
+            'size_sum 26.5\n'
+            '# EOF\n',
+            registry.render(),
+        )
+
+    def test_threads_merged(self):
+        registry = MetricsRegistry()
+        counter = registry.counter("n")
+
+        def work():
+            for _ in range(1000):
+                counter.inc()
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual({(): 4000}, counter.values())
+
+    def test_shards_of_ended_threads_folded(self):
+        registry = MetricsRegistry()
+        counter = registry.counter("n")
+        histogram = registry.histogram("h", buckets=[1.0])
+
+        def work():
+            counter.inc()
+            histogram.observe(0.5)
+
+        work()
+        for _ in range(3):
+            thread = threading.Thread(target=work)
+            thread.start()
+            thread.join()
+        self.assertEqual(1, len(counter._shards))
+        self.assertEqual(1, len(histogram._shards))
+        self.assertEqual({(): 4}, counter.values())
+        self.assertEqual({(): [4, 0, 2.0]}, histogram.values())
+        # Merging does not share the lists of folded shards
+        histogram.values()[()][0] = 100
+        self.assertEqual({(): [4, 0, 2.0]}, histogram.values())
+
+    def test_type_conflict(self):
+        registry = MetricsRegistry()
+        registry.counter("x")
+        with self.assertRaises(ValueError):
+            registry.histogram("x")
+
+
+class TestDecoratorMetrics(unittest.TestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry(latency_buckets=(0.1, 1))
+
+    def test_logit(self):
+        @logit(metrics=self.registry, level=5)
+        def func(x):
+            if x < 0:
+                raise KeyError(x)
+            return x
+
+        func(1)
+        with self.assertRaises(KeyError):
+            func(-1)
+        name = func.registration.name
+        labels = (name, "logit")
+        calls = self.registry.counter("festoon_calls").values()
+        self.assertEqual({labels: 2}, calls)
+        errors = self.registry.counter("festoon_errors").values()
+        self.assertEqual({labels + ("KeyError",): 1}, errors)
+        latency = self.registry.histogram("festoon_latency_seconds")
+        self.assertEqual(2, sum(latency.values()[labels][:-1]))
+        text = self.registry.render()
+        self.assertIn(
+            f'festoon_calls_total{{function="{name}",decorator="logit"}} 2',
+            text,
+        )
+
+        func.registration.enabled = False
+        func(1)
+        self.assertEqual(
+            {labels: 2}, self.registry.counter("festoon_calls").values()
+        )
+
+    def test_timeit_coroutine(self):
+        @timeit(metrics=self.registry)
+        async def func():
+            return 1
+
+        with self.assertLogs(level="INFO"):
+            self.assertEqual(1, asyncio.run(func()))
+        self.assertEqual(
+            [1], list(self.registry.counter("festoon_calls").values().values())
+        )
+
+    def test_retry(self):
+        fn = mock.Mock(side_effect=[KeyError, KeyError, "done"])
+        func = retry(
+            fn, schedule=[0, 0], log_exceptions=False, metrics=self.registry
+        )
+        self.assertEqual("done", func())
+        labels = (func.registration.name, "retry")
+        self.assertEqual(
+            {labels: 2}, self.registry.counter("festoon_retries").values()
+        )
+        self.assertEqual(
+            {labels: 1}, self.registry.counter("festoon_calls").values()
+        )
+        self.assertEqual({}, self.registry.counter("festoon_errors").values())
+
+
+class TestExport(unittest.TestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry()
+        self.registry.counter("requests").inc()
+
+    def test_http(self):
+        server = start_http_server(0, registry=self.registry)
+        try:
+            port = server.server_address[1]
+            url = f"http://127.0.0.1:{port}/metrics"
+            with urllib.request.urlopen(url) as response:
+                content_type = response.headers["Content-Type"]
+                body = response.read().decode()
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertEqual(CONTENT_TYPE, content_type)
+        self.assertEqual(self.registry.render(), body)
+
+    def test_textfile(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "festoon.prom")
+            write_textfile(path, self.registry)
+            with open(path) as f:
+                self.assertIn("requests_total 1\n", f.read())
+            self.assertEqual(["festoon.prom"], os.listdir(tmpdir))
+
+
+if __name__ == "__main__":
+    unittest.main()
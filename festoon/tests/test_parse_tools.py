@@ -0,0 +1,140 @@
+import enum
+import pathlib
+from typing import (
+    Any, Dict, FrozenSet, List, Literal, Optional, Sequence, Tuple, Union,
+)
+import unittest
+
+from festoon.parse_tools import ParseError, parser_for, register_parser
+
+
+class Color(enum.Enum):
+    RED = "r"
+    GREEN = "g"
+
+
+class TestParserFor(unittest.TestCase):
+    def assertParses(self, annotation, value, expected):
+        parsed = parser_for(annotation)(value)
+        self.assertEqual(expected, parsed)
+        self.assertIs(type(expected), type(parsed))
+
+    def test_scalars(self):
+        self.assertParses(str, " a ", " a ")
+        self.assertParses(int, "42", 42)
+        self.assertParses(float, "2.5", 2.5)
+        self.assertParses(Any, "x", "x")
+
+    def test_bool(self):
+        for value in ("1", "true", "True", "YES", "on"):
+            with self.subTest(value):
+                self.assertParses(bool, value, True)
+        for value in ("0", "false", "False", "no", "off"):
+            with self.subTest(value):
+                self.assertParses(bool, value, False)
+        with self.assertRaises(ParseError):
+            parser_for(bool)("maybe")
+
+    def test_enum(self):
+        self.assertParses(Color, "RED", Color.RED)
+        self.assertParses(Color, "g", Color.GREEN)
+        with self.assertRaisesRegex(ParseError, "expected one of RED, GREEN"):
+            parser_for(Color)("BLUE")
+
+    def test_path(self):
+        self.assertParses(pathlib.Path, "/tmp/x", pathlib.Path("/tmp/x"))
+
+    def test_json(self):
+        self.assertParses(dict, '{"a": [1]}', {"a": [1]})
+        self.assertParses(Dict[str, int], '{"a": 1}', {"a": 1})
+        with self.assertRaises(ParseError):
+            parser_for(dict)("[1]")
+        with self.assertRaises(ParseError):
+            parser_for(dict)("{")
+
+    def test_collections(self):
+        self.assertParses(List[int], "1, 2,3", [1, 2, 3])
+        self.assertParses(List[int], "[1, \"2\"]", [1, 2])
+        self.assertParses(List[str], "", [])
+        self.assertParses(list, "a,b", ["a", "b"])
+        self.assertParses(Sequence[float], "1.5", [1.5])
+        self.assertParses(FrozenSet[int], "1,1", frozenset([1]))
+        self.assertParses(Tuple[int, ...], "1,2", (1, 2))
+        self.assertParses(Tuple[str, int], "a,2", ("a", 2))
+        with self.assertRaises(ParseError):
+            parser_for(Tuple[str, int])("a")
+        with self.assertRaisesRegex(ParseError, "Invalid int 'x'"):
+            parser_for(List[int])("1,x")
+
+    def test_json_array_items_checked(self):
+        self.assertParses(List[float], "[1, 2.5]", [1.0, 2.5])
+        self.assertParses(
+            List[Any], '[1, true, {"a": 1}]', [1, True, {"a": 1}]
+        )
+        self.assertParses(list, "[1, null]", [1, None])
+        self.assertParses(List[Optional[int]], "[1, null]", [1, None])
+        self.assertParses(List[Union[int, str]], '[1, "a"]', [1, "a"])
+        self.assertParses(List[List[int]], "[[1], [2, 3]]", [[1], [2, 3]])
+        self.assertParses(List[Dict[str, int]], '[{"a": 1}]', [{"a": 1}])
+        self.assertParses(Tuple[str, float], '["a", 2]', ("a", 2.0))
+        self.assertParses(List[Literal[1, 2]], "[2]", [2])
+        for value in ("[1.5]", "[true]", '[{"a": 1}]', "[null]", "[[1]]"):
+            with self.subTest(value):
+                with self.assertRaisesRegex(
+                    ParseError, r"^Invalid List\[int\]"
+                ):
+                    parser_for(List[int])(value)
+        with self.assertRaises(ParseError):
+            parser_for(List[str])("[1]")
+        with self.assertRaises(ParseError):
+            parser_for(List[bool])("[1]")
+        with self.assertRaises(ParseError):
+            parser_for(List[List[int]])("[[1.5]]")
+
+    def test_union_in_declared_order(self):
+        self.assertParses(Union[int, str], "1", 1)
+        self.assertParses(Union[str, int], "1", "1")
+        self.assertParses(Optional[int], "3", 3)
+        self.assertParses(Optional[int], "none", None)
+        self.assertParses(Optional[int], "", None)
+        with self.assertRaises(ParseError):
+            parser_for(Optional[int])("x")
+
+    def test_literal(self):
+        self.assertParses(Literal["a", 1], "1", 1)
+        with self.assertRaises(ParseError):
+            parser_for(Literal["a", 1])("b")
+
+    def test_callable(self):
+        self.assertParses(lambda value: value * 2, "ab", "abab")
+        with self.assertRaises(ParseError):
+            parser_for(int.from_bytes)("x")
+
+    def test_compiled_once(self):
+        self.assertIs(parser_for(List[int]), parser_for(List[int]))
+
+    def test_register_parser(self):
+        class Port(int):
+            pass
+
+        def parse_port(value):
+            port = Port(value)
+            if not 0 < port < 65536:
+                raise ValueError("out of range")
+            return port
+
+        register_parser(Port, parse_port)
+        self.assertParses(List[Port], "80,443", [Port(80), Port(443)])
+        with self.assertRaisesRegex(ParseError, "out of range"):
+            parser_for(Port)("0")
+
+    def test_error(self):
+        with self.assertRaises(ParseError) as cm:
+            parser_for(int)("x")
+        self.assertIsInstance(cm.exception, ValueError)
+        self.assertEqual("x", cm.exception.value)
+        self.assertIs(int, cm.exception.annotation)
+
+
+if __name__ == "__main__":
+    unittest.main()
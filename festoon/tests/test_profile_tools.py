@@ -0,0 +1,180 @@
+import gc
+import os
+import pstats
+import signal
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from festoon import profile_tools
+from festoon.profile_tools import disable, enable, profileit
+
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+class TestProfileit(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        disable()
+        self.tmpdir.cleanup()
+
+    def test_disabled_by_default(self):
+        @profileit(output_dir=self.tmpdir.name)
+        def func(x):
+            return x + 1
+
+        self.assertEqual(2, func(1))
+        self.assertFalse(func.profiler.enabled)
+        self.assertEqual([], disable())
+        self.assertEqual([], os.listdir(self.tmpdir.name))
+
+    def test_cprofile(self):
+        @profileit(output_dir=self.tmpdir.name, name="test.cprofile")
+        def func():
+            busy(0.01)
+            return 1
+
+        enable("test.cprof*")
+        self.assertEqual(1, func())
+        dump, table = disable("test.*")
+        self.assertTrue(dump.endswith(".pstats"))
+        stats = pstats.Stats(dump)
+        self.assertTrue(any(
+            name == "busy" for _, _, name in stats.stats
+        ))
+        with open(table) as f:
+            self.assertIn("busy", f.read())
+
+    def test_cprofile_nested(self):
+        @profileit(output_dir=self.tmpdir.name, name="test.nested.inner")
+        def inner():
+            busy(0.001)
+
+        @profileit(output_dir=self.tmpdir.name, name="test.nested.outer")
+        def outer():
+            inner()
+
+        enable("test.nested.*")
+        outer()
+        self.assertEqual(4, len(disable("test.nested.*")))
+
+    def test_sampling(self):
+        @profileit(
+            output_dir=self.tmpdir.name, mode="sampling", interval=0.001,
+        )
+        def func():
+            busy(0.1)
+
+        func.profiler.enable()
+        func()
+        collapsed, table = func.profiler.disable()
+        with open(collapsed) as f:
+            stacks = dict(line.rsplit(" ", 1) for line in f)
+        self.assertTrue(stacks)
+        for stack in stacks:
+            self.assertTrue(stack.startswith("test_profile_tools.py:func"))
+        self.assertTrue(any(
+            stack.endswith(";test_profile_tools.py:busy") for stack in stacks
+        ))
+        with open(table) as f:
+            self.assertIn("test_profile_tools.py:busy", f.read())
+
+    def test_window(self):
+        @profileit(output_dir=self.tmpdir.name)
+        def func():
+            pass
+
+        profiler = func.profiler
+        threads = []
+
+        def disable_():
+            threads.append(threading.current_thread())
+            return profiler_disable()
+
+        profiler_disable = profiler.disable
+        profiler.enable(window=0.01)
+        func()
+        time.sleep(0.02)
+        with mock.patch.object(profiler, "disable", disable_):
+            func()
+            func()
+            for _ in range(100):
+                if threads:
+                    break
+                time.sleep(0.01)
+            threads[0].join()
+        self.assertFalse(profiler.enabled)
+        self.assertEqual(2, len(os.listdir(self.tmpdir.name)))
+        # Reports are written by a single thread, other than the caller's
+        self.assertEqual(1, len(threads))
+        self.assertIsNot(threading.current_thread(), threads[0])
+
+    def test_env(self):
+        with mock.patch.dict(os.environ, {"FESTOON_PROFILE": "x.*,y.func"}):
+            @profileit(name="y.func", output_dir=self.tmpdir.name)
+            def func():
+                pass
+
+            @profileit(name="z.func", output_dir=self.tmpdir.name)
+            def other():
+                pass
+
+        self.assertTrue(func.profiler.enabled)
+        self.assertFalse(other.profiler.enabled)
+
+    @unittest.skipUnless(hasattr(signal, "SIGUSR2"), "POSIX only")
+    def test_signal(self):
+        @profileit(name="test.signal", output_dir=self.tmpdir.name)
+        def func():
+            pass
+
+        previous = signal.getsignal(signal.SIGUSR2)
+        profile_tools.install_signal_handler(pattern="test.signal")
+        try:
+            os.kill(os.getpid(), signal.SIGUSR2)
+            for _ in range(100):
+                if func.profiler.enabled:
+                    break
+                time.sleep(0.01)
+            self.assertTrue(func.profiler.enabled)
+        finally:
+            signal.signal(signal.SIGUSR2, previous)
+
+    def test_profilers_held_weakly(self):
+        def make():
+            @profileit(name="test.weak", output_dir=self.tmpdir.name)
+            def func():
+                pass
+
+            return func
+
+        first = make()
+        second = make()
+        # Profilers of the same name are all matched
+        enable("test.weak")
+        self.assertTrue(first.profiler.enabled)
+        self.assertTrue(second.profiler.enabled)
+        disable("test.weak")
+        count = len(profile_tools._profilers)
+        del first, second
+        gc.collect()
+        self.assertEqual(count - 2, len(profile_tools._profilers))
+
+    def test_async_rejected(self):
+        async def func():
+            pass
+
+        with self.assertRaises(ValueError):
+            profileit(func)
+
+
+if __name__ == "__main__":
+    unittest.main()
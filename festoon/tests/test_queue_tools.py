@@ -0,0 +1,119 @@
+import logging
+import threading
+import unittest
+
+from festoon import queue_tools
+from festoon.logging_tools import logit, timeit
+from festoon.queue_tools import configure, get_log_queue, LogQueue
+
+
+class _BlockingHandler(logging.Handler):
+    """Handler that waits for `gate` before handling each record"""
+    def __init__(self):
+        super().__init__()
+        self.gate = threading.Event()
+        self.records = []
+
+    def emit(self, record):
+        self.gate.wait(5)
+        self.records.append(record)
+
+
+class TestLogQueue(unittest.TestCase):
+    def setUp(self):
+        self.logger = logging.getLogger("festoon.tests.queue")
+        self.handler = _BlockingHandler()
+        self.logger.addHandler(self.handler)
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+
+    def tearDown(self):
+        self.handler.gate.set()
+        self.logger.removeHandler(self.handler)
+        self.logger.propagate = True
+
+    def test_handled_in_background(self):
+        queue = LogQueue()
+        self.handler.gate.set()
+        queue.log(self.logger, logging.INFO, "hello")
+        self.assertTrue(queue.flush(5))
+        (record,) = self.handler.records
+        self.assertEqual("hello", record.getMessage())
+        self.assertEqual(threading.get_ident(), record.thread)
+        self.assertEqual(1, queue.stats()["handled"])
+        queue.close()
+
+    def test_drop(self):
+        queue = LogQueue(size=2, overflow="drop")
+        for i in range(10):
+            queue.log(self.logger, logging.INFO, str(i))
+        self.assertGreaterEqual(queue.dropped, 7)
+        self.handler.gate.set()
+        queue.close()
+        self.assertEqual(10, queue.handled + queue.dropped)
+
+    def test_drop_count_warns(self):
+        queue = LogQueue(size=1, overflow="drop_count")
+        for i in range(5):
+            queue.log(self.logger, logging.INFO, str(i))
+        with self.assertLogs("festoon.queue_tools", "WARNING") as logs:
+            self.handler.gate.set()
+            queue.close()
+        self.assertIn(f"dropped {queue.dropped} records", logs.output[0])
+
+    def test_block(self):
+        queue = LogQueue(size=1, overflow="block")
+        threading.Timer(0.05, self.handler.gate.set).start()
+        for i in range(5):
+            queue.log(self.logger, logging.INFO, str(i))
+        queue.close()
+        self.assertEqual(0, queue.dropped)
+        self.assertEqual(
+            [str(i) for i in range(5)],
+            [record.getMessage() for record in self.handler.records],
+        )
+
+    def test_invalid_overflow(self):
+        with self.assertRaises(ValueError):
+            LogQueue(overflow="spill")
+
+
+class TestConfigure(unittest.TestCase):
+    def tearDown(self):
+        configure(async_logging=False)
+
+    def test_decorators_use_queue(self):
+        configure(async_logging=True)
+        queue = get_log_queue()
+        self.assertIsNotNone(queue)
+
+        @logit
+        @timeit
+        def func(x):
+            return x
+
+        with self.assertLogs(level="INFO") as logs:
+            func(1)
+            queue.flush(5)
+        self.assertEqual(3, len(logs.records))
+        self.assertEqual(3, queue.handled)
+
+    def test_disable_flushes(self):
+        configure(async_logging=True)
+        queue = get_log_queue()
+
+        @logit(fmtcall=None)
+        def func():
+            pass
+
+        with self.assertLogs(level="INFO") as logs:
+            func()
+            configure(async_logging=False)
+        self.assertEqual(1, len(logs.records))
+        self.assertIsNone(get_log_queue())
+        self.assertIsNone(queue_tools._log_queue)
+        self.assertFalse(queue._thread.is_alive())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import gc
+import logging
+import os
+import unittest
+from unittest import mock
+
+from festoon import registry_tools
+from festoon.environment_tools import fromenv
+from festoon.exception_tools import retry
+from festoon.logging_tools import logit, timeit
+from festoon.registry_tools import disable, enable, registrations, stats
+
+
+@logit
+def logged(x):
+    if x < 0:
+        raise ValueError(x)
+    return x
+
+
+@timeit
+def timed():
+    pass
+
+
+@retry(schedule=[0, 0], log_exceptions=False)
+def retried(fn):
+    return fn()
+
+
+@fromenv(prefix="FESTOON_TEST_REGISTRY")
+def configured(x: int = 0):
+    return x
+
+
+class TestRegistry(unittest.TestCase):
+    def setUp(self):
+        for registration in registrations(f"{__name__}.*"):
+            registration.reset()
+
+    def tearDown(self):
+        enable()
+
+    def test_registrations(self):
+        found = {
+            (registration.name.rsplit(".", 1)[1], registration.decorator)
+            for registration in registrations(f"{__name__}.*")
+        }
+        self.assertLessEqual({
+            ("logged", "logit"),
+            ("timed", "timeit"),
+            ("retried", "retry"),
+            ("configured", "fromenv"),
+        }, found)
+        (registration,) = registrations(f"{__name__}.*", decorator="retry")
+        self.assertEqual([0, 0], registration.config["schedule"])
+        self.assertIs(registration, retried.registration)
+
+    def test_counters(self):
+        with self.assertLogs(level="INFO"):
+            logged(1)
+            with self.assertRaises(ValueError):
+                logged(-1)
+        fn = mock.Mock(side_effect=[KeyError, KeyError, KeyError])
+        with self.assertRaises(KeyError):
+            retried(fn)
+        with mock.patch.dict(os.environ, {"FESTOON_TEST_REGISTRY_X": "2"}):
+            self.assertEqual(2, configured())
+
+        counters = {
+            (s["name"].rsplit(".", 1)[1], s["decorator"]): s
+            for s in stats(f"{__name__}.*")
+        }
+        logit_stats = counters["logged", "logit"]
+        self.assertEqual(2, logit_stats["calls"])
+        self.assertEqual(1, logit_stats["errors"])
+        self.assertEqual(2, logit_stats["timed"])
+        self.assertGreater(logit_stats["time"], 0)
+        retry_stats = counters["retried", "retry"]
+        self.assertEqual(
+            (1, 1, 2),
+            (retry_stats["calls"], retry_stats["errors"],
+             retry_stats["retries"]),
+        )
+        self.assertEqual(1, counters["configured", "fromenv"]["calls"])
+
+    def test_disable(self):
+        self.assertEqual(3, disable(f"{__name__}.*"))
+        self.assertFalse(logged.registration.enabled)
+        # fromenv changes arguments, so it stays enabled
+        self.assertTrue(configured.registration.enabled)
+
+        with self.assertLogs(level="INFO") as logs:
+            logged(1)
+            timed()
+            logging.getLogger().info("sentinel")
+        self.assertEqual(["INFO:root:sentinel"], logs.output)
+        self.assertEqual(0, logged.registration.calls)
+
+        fn = mock.Mock(side_effect=KeyError)
+        with self.assertRaises(KeyError):
+            retried(fn)
+        fn.assert_called_once()
+
+        self.assertEqual(1, enable(f"{__name__}.*", decorator="logit"))
+        with self.assertLogs(level="INFO"):
+            logged(1)
+        self.assertFalse(timed.registration.enabled)
+
+    def test_forgotten_when_collected(self):
+        @logit
+        def temporary():
+            pass
+
+        name = temporary.registration.name
+        self.assertEqual(1, len(registrations(name)))
+        del temporary
+        gc.collect()
+        self.assertEqual([], registrations(name))
+        self.assertNotIn(name, [r.name for r in registry_tools._registrations])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+from collections import OrderedDict
+import unittest
+
+from festoon.repr_tools import (
+    BoundedRepr, bounded_repr, get_default_repr, set_default_repr
+)
+
+
+class _FakeArray:
+    shape = (1000, 1000)
+    dtype = "float64"
+
+    def __repr__(self):
+        raise AssertionError("full repr must not be computed")
+
+
+class _FakeFrame:
+    shape = (10, 3)
+    columns = ["a", "b", "c"]
+
+
+class TestBoundedRepr(unittest.TestCase):
+    def setUp(self):
+        self.r = BoundedRepr(maxitems=3, maxstring=10, maxchars=100)
+
+    def test_sequence(self):
+        self.assertEqual(
+            "[0, 1, 2, ...] (len=1000000)", self.r.repr(list(range(10**6)))
+        )
+        self.assertEqual("(1,)", self.r.repr((1,)))
+        self.assertEqual("[1, 2]", self.r.repr([1, 2]))
+
+    def test_mapping(self):
+        self.assertEqual(
+            "{0: 0, 1: 1, 2: 2, ...} (len=10)",
+            self.r.repr({i: i for i in range(10)}),
+        )
+        self.assertEqual("OrderedDict({'a': 1})",
+                         self.r.repr(OrderedDict(a=1)))
+
+    def test_bytes(self):
+        self.assertEqual("b'xxxxxxxx... (len=1000)", self.r.repr(b"x"*1000))
+        self.assertEqual("b'xx'", self.r.repr(b"xx"))
+
+    def test_arraylike(self):
+        self.assertEqual(
+            "_FakeArray(shape=(1000, 1000), dtype=float64)",
+            self.r.repr(_FakeArray()),
+        )
+        self.assertEqual(
+            "_FakeFrame(shape=(10, 3), columns=['a', 'b', 'c'])",
+            self.r.repr(_FakeFrame()),
+        )
+
+    def test_depth(self):
+        self.assertEqual("[[[[...]]]]", self.r.repr([[[[[1]]]]]))
+
+    def test_maxchars(self):
+        r = BoundedRepr(maxchars=20)
+        self.assertEqual(20, len(r.repr([10**6] * 10)))
+
+    def test_register(self):
+        self.r.register(_FakeArray, lambda r, x, level: "array!")
+        self.assertEqual("[array!]", self.r.repr([_FakeArray()]))
+
+
+class TestDefaultRepr(unittest.TestCase):
+    def test_set_default_repr(self):
+        original = get_default_repr()
+        try:
+            set_default_repr(maxitems=1)
+            self.assertEqual("[1, ...] (len=2)", bounded_repr([1, 2]))
+        finally:
+            set_default_repr(original)
+        self.assertEqual("[1, 2]", bounded_repr([1, 2]))
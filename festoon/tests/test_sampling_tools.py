@@ -0,0 +1,55 @@
+import unittest
+from unittest import mock
+
+from festoon.sampling_tools import (
+    as_sampler, EveryNthSampler, ProbabilitySampler, RateLimitSampler,
+    Sampler,
+)
+
+
+class TestSamplers(unittest.TestCase):
+    def test_probability(self):
+        with mock.patch("random.random", side_effect=[0.05, 0.5]):
+            sampler = ProbabilitySampler(0.1)
+            self.assertTrue(sampler.sample())
+            self.assertFalse(sampler.sample())
+
+        with self.assertRaises(ValueError):
+            ProbabilitySampler(2)
+
+    def test_every_nth(self):
+        sampler = EveryNthSampler(3)
+        self.assertEqual(
+            [True, False, False, True, False, False],
+            [sampler.sample() for _ in range(6)],
+        )
+
+    def test_rate_limit(self):
+        with mock.patch("time.monotonic", return_value=100.0) as monotonic:
+            sampler = RateLimitSampler(2)
+            self.assertEqual(
+                [True, True, False], [sampler.sample() for _ in range(3)]
+            )
+            monotonic.return_value = 100.5
+            self.assertEqual([True, False],
+                             [sampler.sample() for _ in range(2)])
+
+    def test_keep_outliers(self):
+        sampler = Sampler(slow_ms=100, exceptions=True)
+        self.assertTrue(sampler.outliers)
+        self.assertTrue(sampler.keep(0.2, None))
+        self.assertFalse(sampler.keep(0.05, None))
+        self.assertTrue(sampler.keep(0.05, ValueError()))
+        self.assertFalse(Sampler().outliers)
+
+    def test_bind_has_own_state(self):
+        sampler = EveryNthSampler(2)
+        a, b = sampler.bind(), sampler.bind()
+        self.assertTrue(a.sample())
+        self.assertTrue(b.sample())
+
+    def test_as_sampler(self):
+        self.assertIsNone(as_sampler(None))
+        sampler = as_sampler(0.5)
+        self.assertIsInstance(sampler, ProbabilitySampler)
+        self.assertEqual(0.5, sampler.probability)
@@ -0,0 +1,94 @@
+import math
+import threading
+import unittest
+
+from festoon.stats_tools import (
+    format_summary, Histogram, LatencySummary, ShardedHistogram
+)
+
+
+class TestHistogram(unittest.TestCase):
+    def test_quantiles_relative_error(self):
+        histogram = Histogram()
+        values = [i / 1000 for i in range(1, 10001)]
+        for value in values:
+            histogram.record(value)
+
+        for q in (0.01, 0.5, 0.9, 0.99):
+            expected = values[int(q * len(values)) - 1]
+            self.assertAlmostEqual(
+                expected, histogram.quantile(q), delta=expected / 32
+            )
+
+    def test_summary(self):
+        histogram = Histogram()
+        for value in (0.0, 1.0, 2.0, 3.0):
+            histogram.record(value)
+        summary = histogram.summary()
+        self.assertEqual(4, summary.count)
+        self.assertEqual(6.0, summary.total)
+        self.assertEqual(0.0, summary.min)
+        self.assertEqual(3.0, summary.max)
+        self.assertEqual(1.5, summary.mean)
+
+    def test_empty(self):
+        summary = Histogram().summary()
+        self.assertEqual(0, summary.count)
+        self.assertTrue(math.isnan(summary.p50))
+
+    def test_merge(self):
+        a, b = Histogram(), Histogram()
+        a.record(1.0)
+        b.record(2.0)
+        a.merge(b)
+        self.assertEqual(2, a.count)
+        self.assertEqual(2.0, a.max)
+
+
+class TestShardedHistogram(unittest.TestCase):
+    def test_record_from_threads(self):
+        histogram = ShardedHistogram()
+
+        def work():
+            for _ in range(1000):
+                histogram.record(0.001)
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(8000, histogram.summary().count)
+
+        histogram.reset()
+        self.assertEqual(0, histogram.summary().count)
+
+    def test_shards_of_ended_threads_folded(self):
+        histogram = ShardedHistogram()
+        histogram.record(1.0)
+        for value in (2.0, 3.0):
+            thread = threading.Thread(target=histogram.record, args=(value,))
+            thread.start()
+            thread.join()
+        self.assertEqual(1, len(histogram._shards))
+        summary = histogram.summary()
+        self.assertEqual(
+            (3, 6.0, 1.0, 3.0),
+            (summary.count, summary.total, summary.min, summary.max),
+        )
+
+        # Dropping the shard of this thread does not deadlock
+        histogram.reset()
+        histogram.record(4.0)
+        self.assertEqual(1, histogram.summary().count)
+
+
+class TestFormatSummary(unittest.TestCase):
+    def test_format(self):
+        summary = LatencySummary(2, 0.003, 0.001, 0.002, 0.001, 0.002, 0.002)
+        self.assertEqual(
+            "count=2 mean=1.500ms min=1.000ms p50=1.000ms p90=2.000ms "
+            "p99=2.000ms max=2.000ms",
+            format_summary(summary),
+        )
@@ -0,0 +1,166 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+
+from festoon.logging_tools import logit
+from festoon.trace_tools import (
+    ChromeTraceSink,
+    current_span,
+    get_tracer,
+    JsonlSink,
+    RingBufferSink,
+    set_tracer,
+    traceit,
+    Tracer,
+)
+
+
+@traceit
+def inner(x):
+    if x < 0:
+        raise ValueError(x)
+    return x
+
+
+@traceit(name="outer")
+def outer(x):
+    return inner(x) + inner(x + 1)
+
+
+class _TracerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.sink = RingBufferSink()
+        self.previous = set_tracer(Tracer(self.sink, batch_size=1000))
+
+    def tearDown(self):
+        set_tracer(self.previous)
+
+    def spans(self):
+        get_tracer().flush()
+        return self.sink.spans()
+
+
+class TestTraceit(_TracerTestCase):
+    def test_nesting(self):
+        self.assertEqual(3, outer(1))
+        first, second, parent = self.spans()
+        self.assertEqual("outer", parent.name)
+        self.assertTrue(first.name.endswith("test_trace_tools.inner"))
+        self.assertIsNone(parent.parent_id)
+        for child in (first, second):
+            self.assertEqual(parent.span_id, child.parent_id)
+            self.assertEqual(parent.trace_id, child.trace_id)
+            self.assertGreaterEqual(child.start_ns, parent.start_ns)
+            self.assertLessEqual(child.end_ns, parent.end_ns)
+        self.assertIsNone(current_span())
+
+    def test_error(self):
+        with self.assertRaises(ValueError):
+            outer(-1)
+        child, parent = self.spans()
+        self.assertEqual("error", child.outcome)
+        self.assertEqual("ValueError", child.error)
+        self.assertEqual("error", parent.outcome)
+
+    def test_separate_traces(self):
+        inner(1)
+        inner(2)
+        first, second = self.spans()
+        self.assertNotEqual(first.trace_id, second.trace_id)
+
+    def test_disabled(self):
+        set_tracer(None)
+        self.assertEqual(3, outer(1))
+        self.assertEqual([], self.sink.spans())
+
+    def test_asyncio_tasks(self):
+        @traceit(name="child")
+        async def child():
+            await asyncio.sleep(0.01)
+            return current_span()
+
+        @traceit(name="parent")
+        async def parent():
+            return await asyncio.gather(child(), child())
+
+        first, second = asyncio.run(parent())
+        spans = {span.span_id: span for span in self.spans()}
+        (root,) = [span for span in spans.values() if span.name == "parent"]
+        self.assertEqual(root.span_id, first.parent_id)
+        self.assertEqual(root.span_id, second.parent_id)
+        self.assertNotEqual(first.span_id, second.span_id)
+
+    def test_batching(self):
+        sink = RingBufferSink()
+        set_tracer(Tracer(sink, batch_size=4, flush_interval=60))
+        for i in range(3):
+            inner(i)
+        self.assertEqual([], sink.spans())
+        inner(3)
+        self.assertEqual(4, len(sink.spans()))
+
+
+class TestLogitTrace(_TracerTestCase):
+    def test_structured_ids(self):
+        @logit(trace=True, structured=True)
+        def func():
+            return 1
+
+        with self.assertLogs(level="INFO") as logs:
+            func()
+        (span,) = self.spans()
+        for record in logs.records:
+            self.assertEqual(f"{span.span_id:016x}", record.span_id)
+            self.assertEqual(f"{span.trace_id:016x}", record.trace_id)
+
+
+class TestFileSinks(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "trace")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def run_traced(self, sink):
+        previous = set_tracer(Tracer(sink, batch_size=2))
+        try:
+            outer(1)
+        finally:
+            set_tracer(previous).close()
+
+    def test_jsonl(self):
+        self.run_traced(JsonlSink(self.path))
+        with open(self.path) as f:
+            spans = [json.loads(line) for line in f]
+        self.assertEqual(3, len(spans))
+        self.assertEqual(spans[2]["span_id"], spans[0]["parent_id"])
+
+    def test_chrome_trace(self):
+        self.run_traced(ChromeTraceSink(self.path))
+        with open(self.path) as f:
+            events = json.load(f)
+        self.assertEqual(["X"] * 3, [event["ph"] for event in events])
+        self.assertEqual("outer", events[2]["name"])
+        self.assertGreaterEqual(events[2]["dur"], events[0]["dur"])
+
+    def test_chrome_trace_path_reused(self):
+        sink = ChromeTraceSink(self.path)
+        self.run_traced(sink)
+        self.run_traced(sink)
+        self.run_traced(ChromeTraceSink(self.path))
+        with open(self.path) as f:
+            events = json.load(f)
+        self.assertEqual(3, len(events))
+
+    def test_jsonl_appended(self):
+        self.run_traced(JsonlSink(self.path))
+        self.run_traced(JsonlSink(self.path))
+        with open(self.path) as f:
+            self.assertEqual(6, len(f.readlines()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,395 @@
+"""Lightweight tracing of nested calls of decorated functions"""
+import atexit
+import collections
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, IO, List, Optional
+
+from .registry_tools import register
+
+
+LOG = logging.getLogger(__name__)
+
+
+class Span:
+    """A single call of a traced function
+
+    Spans started while another span is current, in the same thread or
+    asyncio task, are its children and share its `trace_id`.
+
+    Timestamps are in nanoseconds since the epoch. `outcome` is "ok" if the
+    function returned, or "error" if it raised, in which case `error` is the
+    qualified name of the exception type.
+    """
+    __slots__ = (
+        "name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns",
+        "outcome", "error", "thread_id",
+    )
+
+    def __init__(self, name: str, parent: Optional["Span"] = None):
+        self.name = name
+        self.span_id = random.getrandbits(64)
+        if parent is None:
+            self.trace_id = random.getrandbits(64)
+            self.parent_id: Optional[int] = None
+        else:
+            self.trace_id = parent.trace_id
+            self.parent_id = parent.span_id
+        self.thread_id = threading.get_ident()
+        self.outcome = "ok"
+        self.error: Optional[str] = None
+        self.end_ns = 0
+        self.start_ns = time.time_ns()
+
+    def finish(self, excp: Optional[BaseException] = None):
+        self.end_ns = time.time_ns()
+        if excp is not None:
+            self.outcome = "error"
+            self.error = type(excp).__qualname__
+
+    @property
+    def duration(self) -> float:
+        """Duration of the span, in seconds"""
+        return (self.end_ns - self.start_ns) / 1e9
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the span as a JSON-serializable dict, with hex ids"""
+        return {
+            "name": self.name,
+            "trace_id": f"{self.trace_id:016x}",
+            "span_id": f"{self.span_id:016x}",
+            "parent_id": (
+                None if self.parent_id is None else f"{self.parent_id:016x}"
+            ),
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "outcome": self.outcome,
+            "error": self.error,
+            "thread_id": self.thread_id,
+        }
+
+    def __repr__(self) -> str:
+        return f"Span({self.name!r}, span_id={self.span_id:016x})"
+
+
+class SpanSink:
+    """Base class of destinations of finished spans
+
+    Sinks receive spans in batches, from one thread at a time.
+    """
+    def export(self, spans: List[Span]):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class RingBufferSink(SpanSink):
+    """Keep the last `capacity` spans in memory
+
+    Examples:
+        >>> sink = RingBufferSink(1000)
+        >>> set_tracer(Tracer(sink))
+        >>> ...
+        >>> get_tracer().flush()
+        >>> slowest = max(sink.spans(), key=lambda span: span.duration)
+    """
+    def __init__(self, capacity: int = 10_000):
+        self._spans: collections.deque = collections.deque(maxlen=capacity)
+
+    def export(self, spans: List[Span]):
+        self._spans.extend(spans)
+
+    def spans(self) -> List[Span]:
+        """Return the spans kept, oldest first"""
+        return list(self._spans)
+
+
+class _FileSink(SpanSink):
+    #: Mode in which the file is opened
+    mode = "a"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file: Optional[IO[str]] = None
+
+    def _open(self) -> IO[str]:
+        if self._file is None:
+            self._file = open(self.path, self.mode)
+        return self._file
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class JsonlSink(_FileSink):
+    """Append spans to the file at `path`, one JSON object per line (see
+    :code:`Span.to_dict`)"""
+    def export(self, spans: List[Span]):
+        file = self._open()
+        file.write("".join(
+            json.dumps(span.to_dict(), separators=(",", ":")) + "\n"
+            for span in spans
+        ))
+        file.flush()
+
+
+class ChromeTraceSink(_FileSink):
+    """Write spans to the file at `path` as Chrome trace events
+
+    The file can be opened with chrome://tracing or https://ui.perfetto.dev,
+    which display the nested calls of each thread on a timeline. Like the
+    trace event format allows, the file is only terminated when the sink is
+    closed, so it can be inspected while spans are still exported.
+
+    A file holds a single trace, so an existing file at `path` is replaced
+    by the first export, and again by the first export after closing.
+    """
+    mode = "w"
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self._pid = os.getpid()
+        self._first = True
+
+    def export(self, spans: List[Span]):
+        file = self._open()
+        if self._first:
+            file.write("[\n")
+            self._first = False
+        else:
+            file.write(",\n")
+        file.write(",\n".join(
+            json.dumps({
+                "name": span.name,
+                "cat": "festoon",
+                "ph": "X",
+                "ts": span.start_ns / 1e3,
+                "dur": (span.end_ns - span.start_ns) / 1e3,
+                "pid": self._pid,
+                "tid": span.thread_id,
+                "args": {
+                    key: value
+                    for key, value in span.to_dict().items()
+                    if key in ("trace_id", "span_id", "parent_id",
+                               "outcome", "error")
+                },
+            }, separators=(",", ":"))
+            for span in spans
+        ))
+        file.flush()
+
+    def close(self):
+        if self._file is not None and not self._first:
+            self._file.write("\n]\n")
+        self._first = True
+        super().close()
+
+
+class Tracer:
+    """Collect finished spans and export them in batches to `sink`
+
+    Finished spans are buffered and exported once `batch_size` of them are
+    pending, or when a span finishes at least `flush_interval` seconds after
+    the last export. Pending spans are also exported by :code:`flush`, and
+    at interpreter exit for the current tracer.
+
+    Args:
+        sink: destination of the spans
+        batch_size: number of pending spans triggering an export
+        flush_interval: maximum number of seconds between exports, as long
+            as spans keep finishing
+    """
+    def __init__(
+        self,
+        sink: SpanSink,
+        batch_size: int = 256,
+        flush_interval: float = 1.0,
+    ):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending: collections.deque = collections.deque()
+        self._lock = threading.Lock()
+        self._next_flush = time.monotonic() + flush_interval
+
+    def record(self, span: Span):
+        """Queue a finished span for export"""
+        pending = self._pending
+        pending.append(span)
+        if (
+            len(pending) >= self.batch_size or
+            time.monotonic() >= self._next_flush
+        ) and self._lock.acquire(blocking=False):
+            # Another thread exporting will pick up this span next time
+            try:
+                self._export()
+            except Exception:
+                # Never fail the traced call because of its sink
+                LOG.exception("Failed to export spans")
+            finally:
+                self._lock.release()
+
+    def _export(self):
+        self._next_flush = time.monotonic() + self.flush_interval
+        pending = self._pending
+        spans = [pending.popleft() for _ in range(len(pending))]
+        if spans:
+            self.sink.export(spans)
+
+    def flush(self):
+        """Export all pending spans"""
+        with self._lock:
+            self._export()
+
+    def close(self):
+        """Export all pending spans and close the sink"""
+        self.flush()
+        self.sink.close()
+
+
+_tracer: Optional[Tracer] = None
+_current_span: contextvars.ContextVar = contextvars.ContextVar(
+    "festoon_current_span", default=None
+)
+
+
+def set_tracer(tracer: Optional[Tracer]) -> Optional[Tracer]:
+    """Set the tracer recording the spans of traced functions, or disable
+    tracing with None, and return the previous tracer"""
+    global _tracer
+    previous, _tracer = _tracer, tracer
+    return previous
+
+
+def get_tracer() -> Optional[Tracer]:
+    """Return the current tracer, or None if tracing is disabled"""
+    return _tracer
+
+
+def current_span() -> Optional[Span]:
+    """Return the span of the innermost traced call, in the current thread
+    or asyncio task"""
+    return _current_span.get()
+
+
+def traceit(fn: Optional[Callable] = None, *, name: Optional[str] = None):
+    """Record a span for each call of this function
+
+    Spans are only recorded while a tracer is set (see :code:`set_tracer`);
+    otherwise the function is called directly. Nesting follows
+    :code:`contextvars`, so it is tracked across threads and asyncio tasks
+    (threads started from a span are not its children, unless they run in
+    a copy of its context). Calls of async generator functions are
+    recorded, but their spans are never current, because the generator may
+    be iterated from several contexts.
+
+    Args:
+        fn: function to be decorated
+        name: name of the spans. If None, then the module-qualified name of
+            the function is used.
+
+    Examples:
+        >>> set_tracer(Tracer(ChromeTraceSink("trace.json")))
+        >>> @traceit
+        >>> def load(path):
+        >>>     ...
+        >>> @traceit
+        >>> def main():
+        >>>     for path in paths:
+        >>>         load(path)
+        >>> main()
+        >>> get_tracer().close()
+    """
+    if fn is None:
+        return functools.partial(traceit, name=name)
+
+    if not callable(fn):
+        raise ValueError(f"{fn} is not callable")
+
+    if name is None:
+        name = f"{fn.__module__}.{getattr(fn, '__qualname__', fn.__name__)}"
+
+    current = _current_span
+    registration = register("traceit", fn, {"name": name})
+
+    def record(tracer: Tracer, span: Span, excp: Optional[BaseException]):
+        span.finish(excp)
+        tracer.record(span)
+        registration.calls += 1
+        if excp is not None:
+            registration.errors += 1
+        registration.add_time(span.duration)
+
+    if inspect.isasyncgenfunction(fn):
+        @functools.wraps(fn)
+        async def wrapped(*args, **kwargs):
+            tracer = _tracer
+            if tracer is None or not registration.enabled:
+                async for item in fn(*args, **kwargs):
+                    yield item
+                return
+            span = Span(name, current.get())
+            excp = None
+            try:
+                async for item in fn(*args, **kwargs):
+                    yield item
+            except BaseException as e:
+                excp = e
+                raise
+            finally:
+                record(tracer, span, excp)
+
+    elif inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def wrapped(*args, **kwargs):
+            tracer = _tracer
+            if tracer is None or not registration.enabled:
+                return await fn(*args, **kwargs)
+            span = Span(name, current.get())
+            token = current.set(span)
+            excp = None
+            try:
+                return await fn(*args, **kwargs)
+            except BaseException as e:
+                excp = e
+                raise
+            finally:
+                current.reset(token)
+                record(tracer, span, excp)
+
+    else:
+        @functools.wraps(fn)
+        def wrapped(*args, **kwargs):
+            tracer = _tracer
+            if tracer is None or not registration.enabled:
+                return fn(*args, **kwargs)
+            span = Span(name, current.get())
+            token = current.set(span)
+            excp = None
+            try:
+                return fn(*args, **kwargs)
+            except BaseException as e:
+                excp = e
+                raise
+            finally:
+                current.reset(token)
+                record(tracer, span, excp)
+
+    wrapped.registration = registration
+    return wrapped
+
+
+@atexit.register
+def _close_tracer():
+    if _tracer is not None:
+        _tracer.close()